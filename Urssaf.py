@@ -1,125 +1,2371 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import requests
-from bs4 import BeautifulSoup
+import io
+import os
+import sys
+import argparse
+import asyncio
+import gzip
+import json
 import time
+import hashlib
+import cProfile
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import OrderedDict
+import tracemalloc
+import traceback
+from contextlib import contextmanager, nullcontext
 import warnings
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 warnings.filterwarnings('ignore')
 
-class URSSAFAnalysis:
-    def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+# Période couverte par l'analyse
+BASE_YEAR = 2002
+YEARS = np.arange(BASE_YEAR, 2026)
+
+# Ratio cotisations / masse salariale par secteur (modèle par défaut)
+SECTOR_SOCIAL_RATIOS = {'Banque': 0.55, 'Énergie': 0.50, 'Luxe': 0.48, 'Automobile': 0.52}
+DEFAULT_SOCIAL_RATIO = 0.50
+
+# Salaire moyen annuel par secteur (en milliers d'euros)
+SECTOR_AVG_SALARIES = {'Banque': 55, 'Luxe': 50, 'Énergie': 60, 'Automobile': 45}
+DEFAULT_AVG_SALARY = 48
+
+# Impact des crises économiques sur la croissance annuelle
+# (2008-2009: crise financière, 2020: COVID-19)
+CRISIS_SHOCKS = {
+    'social': {2008: 0.10, 2009: 0.10, 2020: 0.08},
+    'payroll': {2008: 0.08, 2009: 0.08, 2020: 0.06},
+    'employees': {2008: 0.03, 2009: 0.03, 2020: 0.02},
+}
+
+# Registre des entreprises, taux de cotisations et historiques de référence
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Métriques des historiques de référence et colonnes correspondantes
+HISTORY_METRICS = {
+    'social': 'Social Contributions (M€)',
+    'payroll': 'Payroll (M€)',
+    'employees': 'Employees',
+}
+
+# Indicateurs calculés à partir des séries de base: la disposition compacte
+# ne les stocke pas, ils sont recalculés à la demande (add_derived_columns)
+DERIVED_COLUMNS = ['Avg Salary (€)', 'Social/Payroll Ratio (%)', 'Social per Employee (€)',
+                   'Payroll per Employee (€)']
+
+# Écart absolu toléré par colonne lors du passage en float32: la moitié de la
+# résolution affichée par les rapports. Au-delà (grandes valeurs), la colonne
+# reste en float64.
+COMPACT_TOLERANCES = {
+    'Social Contributions (M€)': 0.5,
+    'Payroll (M€)': 0.5,
+    'Employees': 0.5,
+    'Social Rate (%)': 0.005,
+    'Avg Salary (€)': 0.5,
+    'Social/Payroll Ratio (%)': 0.05,
+    'Social per Employee (€)': 0.5,
+    'Payroll per Employee (€)': 0.5,
+}
+
+class ReferenceData:
+    """
+    Registre des entreprises, taux de cotisations et historiques de référence,
+    lus depuis les fichiers CSV de data_dir et rangés en tableaux NumPy indexés
+    """
+    def __init__(self, data_dir=DATA_DIR):
         # Liste des principales entreprises françaises avec leurs secteurs et effectifs
-        self.companies = {
-            'LVMH': {'sector': 'Luxe', 'employees': 150000, 'payroll': 7500e6},
-            'L\'Oréal': {'sector': 'Cosmétiques', 'employees': 85000, 'payroll': 4500e6},
-            'TotalEnergies': {'sector': 'Énergie', 'employees': 105000, 'payroll': 6800e6},
-            'Sanofi': {'sector': 'Pharmaceutique', 'employees': 100000, 'payroll': 5200e6},
-            'Air Liquide': {'sector': 'Industrie', 'employees': 65000, 'payroll': 3200e6},
-            'BNP Paribas': {'sector': 'Banque', 'employees': 190000, 'payroll': 12500e6},
-            'Kering': {'sector': 'Luxe', 'employees': 38000, 'payroll': 2200e6},
-            'Hermès': {'sector': 'Luxe', 'employees': 18000, 'payroll': 1200e6},
-            'Schneider Electric': {'sector': 'Équipement électrique', 'employees': 135000, 'payroll': 5800e6},
-            'Vinci': {'sector': 'Construction', 'employees': 220000, 'payroll': 9800e6},
-            'Danone': {'sector': 'Agroalimentaire', 'employees': 100000, 'payroll': 4200e6},
-            'Safran': {'sector': 'Aéronautique', 'employees': 81000, 'payroll': 3800e6},
-            'EssilorLuxottica': {'sector': 'Optique', 'employees': 180000, 'payroll': 6500e6},
-            'AXA': {'sector': 'Assurance', 'employees': 95000, 'payroll': 5500e6},
-            'Société Générale': {'sector': 'Banque', 'employees': 138000, 'payroll': 7800e6},
-            'Carrefour': {'sector': 'Distribution', 'employees': 320000, 'payroll': 8500e6},
-            'Orange': {'sector': 'Télécommunications', 'employees': 139000, 'payroll': 6200e6},
-            'Engie': {'sector': 'Énergie', 'employees': 170000, 'payroll': 7200e6},
-            'Pernod Ricard': {'sector': 'Spiritueux', 'employees': 19000, 'payroll': 1100e6},
-            'STMicroelectronics': {'sector': 'Semi-conducteurs', 'employees': 48000, 'payroll': 2200e6},
-            'Capgemini': {'sector': 'Services informatiques', 'employees': 325000, 'payroll': 14500e6},
-            'Legrand': {'sector': 'Équipement électrique', 'employees': 38000, 'payroll': 1800e6},
-            'Publicis': {'sector': 'Communication', 'employees': 101000, 'payroll': 4800e6},
-            'Renault': {'sector': 'Automobile', 'employees': 170000, 'payroll': 7500e6},
-            'PSA': {'sector': 'Automobile', 'employees': 210000, 'payroll': 9200e6}
-        }
+        companies = pd.read_csv(os.path.join(data_dir, 'companies.csv'))
+        self.company_names = companies['company'].to_numpy(dtype=object)
+        self.sectors = companies['sector'].to_numpy(dtype=object)
+        self.employees = companies['employees'].to_numpy()
+        self.payroll = companies['payroll'].to_numpy(dtype=np.float64)
         
         # Taux de cotisations sociales en France (en % de la masse salariale)
-        self.social_rates = {
-            '2002': 45.0, '2003': 45.5, '2004': 45.8, '2005': 46.0,
-            '2006': 46.2, '2007': 46.5, '2008': 46.8, '2009': 47.0,
-            '2010': 47.2, '2011': 47.5, '2012': 48.0, '2013': 48.5,
-            '2014': 49.0, '2015': 49.5, '2016': 50.0, '2017': 50.5,
-            '2018': 51.0, '2019': 51.5, '2020': 52.0, '2021': 52.5,
-            '2022': 53.0, '2023': 53.5, '2024': 54.0, '2025': 54.5
+        rates = pd.read_csv(os.path.join(data_dir, 'social_rates.csv'))
+        self.rate_years = rates['year'].to_numpy()
+        self.rates = rates['rate'].to_numpy(dtype=np.float64)
+        
+        # Historiques approximatifs: une matrice (entreprises × années) par métrique,
+        # NaN pour les années inconnues
+        history_path = os.path.join(data_dir, 'reference_history.csv')
+        with open(history_path, 'rb') as f:
+            self.history_digest = hashlib.sha256(f.read()).hexdigest()
+        history = pd.read_csv(history_path)
+        self.history_years = np.sort(history['year'].unique())
+        self.history_index = {}
+        self.history = {}
+        for metric in HISTORY_METRICS:
+            table = history[history['metric'] == metric].pivot(index='company', columns='year', values='value')
+            table = table.reindex(columns=self.history_years)
+            self.history_index[metric] = {company: i for i, company in enumerate(table.index)}
+            self.history[metric] = table.to_numpy(dtype=np.float64)
+    
+    def registry(self):
+        """Registre des entreprises sous la forme {nom: {'sector', 'employees', 'payroll'}}"""
+        return {name: {'sector': sector, 'employees': employees, 'payroll': payroll}
+                for name, sector, employees, payroll in zip(self.company_names.tolist(), self.sectors.tolist(),
+                                                            self.employees.tolist(), self.payroll.tolist())}
+    
+    def social_rates(self):
+        """Taux de cotisations sous la forme {'année': taux}"""
+        return {str(year): rate for year, rate in zip(self.rate_years.tolist(), self.rates.tolist())}
+    
+    def history_series(self, metric, company):
+        """Historique de référence d'une entreprise ({'année': valeur}), ou None"""
+        row = self.history_index[metric].get(company)
+        if row is None:
+            return None
+        values = self.history[metric][row]
+        return {str(year): value for year, value in zip(self.history_years.tolist(), values.tolist())
+                if not np.isnan(value)}
+    
+    def overlay_history(self, metric, companies, years, matrix):
+        """Remplace dans matrix (entreprises × années) les valeurs connues de l'historique"""
+        index = self.history_index[metric]
+        pairs = [(i, index[company]) for i, company in enumerate(companies) if company in index]
+        if not pairs:
+            return
+        
+        target, source = (np.array(values) for values in zip(*pairs))
+        # Colonnes de l'historique correspondant aux années demandées
+        columns = np.minimum(np.searchsorted(self.history_years, years), len(self.history_years) - 1)
+        known = np.flatnonzero(self.history_years[columns] == years)
+        
+        values = self.history[metric][np.ix_(source, columns[known])]
+        block = matrix[np.ix_(target, known)]
+        matrix[np.ix_(target, known)] = np.where(np.isnan(values), block, values)
+
+@lru_cache(maxsize=None)
+def load_reference_data(data_dir=DATA_DIR):
+    """Charge les données de référence une seule fois par processus"""
+    return ReferenceData(data_dir)
+
+def _crisis_vector(metric, years=YEARS):
+    """Renvoie le choc de croissance de chaque année pour une métrique"""
+    shocks = CRISIS_SHOCKS[metric]
+    return np.array([shocks.get(int(year), 0.0) for year in years])
+
+def simulate_social_matrix(base_social, z_growth, z_noise, years=YEARS):
+    """
+    Simule les cotisations sociales (entreprises × années) à partir de la base
+    de chaque entreprise et de tirages normaux centrés réduits
+    """
+    # Croissance moyenne de 4% avec variations aléatoires
+    growth = 0.04 + 0.02 * z_growth - _crisis_vector('social', years)
+    social_value = base_social[:, None] * (1 + growth) ** (years - BASE_YEAR)
+    return np.maximum(10, social_value + social_value * 0.1 * z_noise)
+
+def simulate_payroll_matrix(base_payroll, z_growth, z_noise, years=YEARS):
+    """
+    Simule la masse salariale (entreprises × années) à partir de la base
+    de chaque entreprise et de tirages normaux centrés réduits
+    """
+    # Croissance moyenne de 3% avec variations aléatoires
+    growth = 0.03 + 0.02 * z_growth - _crisis_vector('payroll', years)
+    payroll_value = base_payroll[:, None] * (1 + growth) ** (years - BASE_YEAR)
+    return np.maximum(100, payroll_value + payroll_value * 0.1 * z_noise)
+
+def simulate_employees_matrix(base_employees, z_growth, z_noise, years=YEARS):
+    """
+    Simule les effectifs (entreprises × années) à partir des effectifs actuels
+    de chaque entreprise et de tirages normaux centrés réduits
+    """
+    # Croissance de 2% avant 2010, puis de 1%
+    mean = np.where(years < 2010, 0.02, 0.01)
+    std = np.where(years < 2010, 0.01, 0.005)
+    growth = mean + std * z_growth - _crisis_vector('employees', years)
+    # Inverse car on part de maintenant
+    employees_value = base_employees[:, None] * (1 + growth) ** (BASE_YEAR - years)
+    return np.maximum(100, employees_value + employees_value * 0.05 * z_noise)
+
+# Simulateurs utilisés par le mode Monte Carlo
+METRIC_SIMULATORS = {
+    'social': simulate_social_matrix,
+    'payroll': simulate_payroll_matrix,
+    'employees': simulate_employees_matrix,
+}
+
+def simulate_paths(metric, base, rng, n_paths, years=YEARS):
+    """Tire n_paths trajectoires d'une métrique pour chaque entreprise (trajectoires × entreprises × années)"""
+    z = rng.standard_normal((2, n_paths * len(base), len(years)))
+    values = METRIC_SIMULATORS[metric](np.tile(base, n_paths), z[0], z[1], years)
+    return values.reshape(n_paths, len(base), len(years))
+
+def _histogram_counts(values, low, high, bins):
+    """
+    Compte des trajectoires (trajectoires × entreprises × années) dans des
+    classes logarithmiques propres à chaque (entreprise, année); les valeurs
+    hors bornes tombent dans les classes extrêmes
+    """
+    position = (np.log(values) - low) / (high - low) * bins
+    index = np.clip(position.astype(np.int64), 0, bins - 1)
+    cells = np.arange(low.size).reshape(low.shape) * bins
+    return np.bincount((index + cells).ravel(), minlength=low.size * bins)
+
+def _histogram_quantiles(counts, low, high, quantile):
+    """Quantile (en %) interpolé dans les histogrammes (entreprises × années × classes)"""
+    bins = counts.shape[-1]
+    cumulative = np.cumsum(counts, axis=-1)
+    target = cumulative[..., -1] * quantile / 100
+    index = np.minimum((cumulative < target[..., None]).sum(axis=-1), bins - 1)
+    in_bin = np.take_along_axis(counts, index[..., None], axis=-1)[..., 0]
+    before = np.take_along_axis(cumulative, index[..., None], axis=-1)[..., 0] - in_bin
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(in_bin > 0, (target - before) / in_bin, 0.5)
+    return np.exp(low + (index + fraction) * (high - low) / bins)
+
+def _monte_carlo_job(job):
+    """Tire un lot de trajectoires et le réduit en histogrammes (processus de calcul)"""
+    rng = np.random.Generator(np.random.PCG64(job['seed']))
+    counts = {metric: 0 for metric in job['bases']}
+    remaining = job['paths']
+    while remaining > 0:
+        n_paths = min(remaining, job['block_paths'])
+        for metric, base in job['bases'].items():
+            values = simulate_paths(metric, base, rng, n_paths, job['years'])
+            counts[metric] = counts[metric] + _histogram_counts(values, job['low'][metric], job['high'][metric],
+                                                                job['bins'])
+        remaining -= n_paths
+    return counts
+
+def derive_company_metrics(batch):
+    """
+    Séries de base et indicateurs calculés de chaque (entreprise, année), sous
+    forme de matrices (entreprises × années)
+    """
+    social = np.asarray(batch['Social Contributions (M€)'], dtype=np.float64)
+    payroll = np.asarray(batch['Payroll (M€)'], dtype=np.float64)
+    employees = np.asarray(batch['Employees'], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Effectif nul: salaire moyen nul; effectif inconnu: salaire moyen inconnu
+        avg_salary = np.where(employees > 0, payroll * 1e6 / employees, np.where(np.isnan(employees), np.nan, 0))
+        return {
+            'Social Contributions (M€)': social,
+            'Payroll (M€)': payroll,
+            'Employees': employees,
+            'Avg Salary (€)': avg_salary,
+            # Ajouter des indicateurs calculés
+            'Social/Payroll Ratio (%)': social / payroll * 100,
+            'Social per Employee (€)': social * 1e6 / employees,
+            'Payroll per Employee (€)': payroll * 1e6 / employees,
+        }
+
+def build_companies_frame(batch, social_rates, metrics=None, compact=False):
+    """
+    Construit le DataFrame entreprises × années à partir de séries en colonnes
+    (voir URSSAFAnalysis.simulate_companies_batch), sans passer par un
+    dictionnaire par ligne. metrics: indicateurs déjà calculés par
+    derive_company_metrics (par exemple dans des processus de calcul).
+    compact: disposition compacte (voir compact_frame), sans les indicateurs
+    calculés.
+    """
+    metrics = derive_company_metrics(batch) if metrics is None else metrics
+    years = np.asarray(batch['Year'])
+    n_companies, n_years = metrics['Social Contributions (M€)'].shape
+    
+    # Colonnes catégorielles: un code par ligne, chaque libellé stocké une seule fois
+    company_codes = np.repeat(np.arange(n_companies), n_years)
+    sector_codes, sectors = pd.factorize(np.asarray(batch['Sector'], dtype=object))
+    rates = np.array([social_rates.get(str(year), np.nan) for year in years], dtype=np.float64)
+    
+    columns = {
+        'Company': pd.Categorical.from_codes(company_codes, categories=list(batch['Company'])),
+        'Sector': pd.Categorical.from_codes(np.repeat(sector_codes, n_years), categories=list(sectors)),
+        'Year': np.tile(years.astype(np.int16), n_companies),
+    }
+    for column in ['Social Contributions (M€)', 'Payroll (M€)', 'Employees', 'Social Rate (%)'] + DERIVED_COLUMNS:
+        if compact and column in DERIVED_COLUMNS:
+            continue
+        values = np.tile(rates, n_companies) if column == 'Social Rate (%)' else metrics[column].ravel()
+        columns[column] = _downcast(values, COMPACT_TOLERANCES[column]) if compact else values
+    return pd.DataFrame(columns)
+
+def _downcast(values, tolerance):
+    """Valeurs en float32 si l'arrondi reste sous tolerance, sinon inchangées"""
+    values = np.asarray(values, dtype=np.float64)
+    compact = values.astype(np.float32)
+    with np.errstate(invalid='ignore', over='ignore'):
+        error = np.abs(compact.astype(np.float64) - values)
+    # Un débordement (inf) ou un NaN introduit par l'arrondi interdit la conversion
+    if np.any(np.isnan(error) & ~np.isnan(values)) or (error.size and np.nanmax(error, initial=0) > tolerance):
+        return values
+    return compact
+
+def compact_frame(df, derived=False):
+    """
+    Disposition compacte du panel entreprises × années: Company et Sector
+    catégoriels, Year en int16, indicateurs en float32 lorsque la précision
+    le permet (COMPACT_TOLERANCES) et indicateurs calculés retirés, sauf si
+    derived est vrai.
+    """
+    columns = {}
+    for column in df.columns:
+        if column in ('Company', 'Sector'):
+            columns[column] = df[column] if isinstance(df[column].dtype, pd.CategoricalDtype) else df[column].astype('category')
+        elif column == 'Year':
+            columns[column] = df[column].to_numpy().astype(np.int16)
+        elif column in DERIVED_COLUMNS and not derived:
+            continue
+        elif column in COMPACT_TOLERANCES:
+            columns[column] = _downcast(df[column].to_numpy(), COMPACT_TOLERANCES[column])
+        else:
+            columns[column] = df[column]
+    return pd.DataFrame(columns, index=df.index)
+
+def add_derived_columns(df, columns=None):
+    """
+    Ajoute les indicateurs calculés absents du DataFrame (tous, ou seulement
+    columns), au format de la disposition compacte, et complète ceux qui
+    contiennent des valeurs manquantes (lignes compactes mêlées à des lignes
+    complètes). Renvoie df tel quel si rien ne manque.
+    """
+    columns = DERIVED_COLUMNS if columns is None else columns
+    missing = [column for column in columns if column not in df.columns]
+    incomplete = [column for column in columns if column in df.columns and df[column].isna().any()]
+    if not missing and not incomplete:
+        return df
+    metrics = derive_company_metrics(df)
+    values = {column: _downcast(metrics[column], COMPACT_TOLERANCES[column]) for column in missing}
+    for column in incomplete:
+        values[column] = df[column].where(df[column].notna(), metrics[column])
+    return df.assign(**values)
+
+def memory_report(df):
+    """
+    Octets occupés par chaque colonne du panel selon trois dispositions:
+    'object' (libellés répétés en chaînes Python, Year en int64, float64
+    partout), 'standard' (build_companies_frame) et 'compact' (compact_frame,
+    indicateurs calculés à la demande). Les colonnes sont converties une à
+    une: le panel n'est jamais dupliqué en entier.
+    """
+    df = add_derived_columns(df)
+    rows = {}
+    for column in df.columns:
+        values = df[column]
+        if column in ('Company', 'Sector'):
+            layouts = (values.astype(object), values.astype('category'), values.astype('category'))
+        elif column == 'Year':
+            layouts = (values.astype(np.int64), values.astype(np.int16), values.astype(np.int16))
+        else:
+            wide = values.astype(np.float64)
+            compact = (None if column in DERIVED_COLUMNS else
+                       pd.Series(_downcast(wide.to_numpy(), COMPACT_TOLERANCES.get(column, 0))))
+            layouts = (wide, wide, compact)
+        rows[column] = [0 if layout is None else int(layout.memory_usage(index=False, deep=True))
+                        for layout in layouts]
+        rows[column].append(str(layouts[2].dtype) if layouts[2] is not None else 'à la demande')
+    
+    report = pd.DataFrame.from_dict(rows, orient='index', columns=['object', 'standard', 'compact', 'compact dtype'])
+    totals = report[['object', 'standard', 'compact']].sum()
+    report.loc['Total'] = [*totals, '']
+    report.loc['Octets par ligne'] = [*(totals / max(len(df), 1)).round(1), '']
+    return report
+
+class ScenarioResults:
+    """
+    Résultats compacts d'un lot de scénarios: totaux par (scénario, année) et
+    par (scénario, secteur, année), et statistiques de synthèse par scénario
+    """
+    def __init__(self, names, years, sectors, totals, sector_totals, summary, contributions=None):
+        self.names = names
+        self.years = years
+        self.sectors = sectors
+        # Cotisations totales (M€), scénarios × années
+        self.totals = pd.DataFrame(totals, index=pd.Index(names, name='Scenario'), columns=years)
+        # Cotisations totales (M€), (scénario, secteur) × années
+        index = pd.MultiIndex.from_product([names, sectors], names=['Scenario', 'Sector'])
+        self.sector_totals = pd.DataFrame(sector_totals.reshape(-1, len(years)), index=index, columns=years)
+        self.summary = pd.DataFrame(summary, index=pd.Index(names, name='Scenario'))
+        # Tableau complet scénarios × entreprises × années, seulement si demandé
+        self.contributions = contributions
+
+class ScenarioEngine:
+    """
+    Évalue en bloc des scénarios de cotisations (barèmes de taux, ratios et
+    exonérations par secteur, chocs de crise) sur une même base d'entreprises.
+    
+    Un scénario est un dictionnaire dont toutes les clés sont optionnelles:
+        'name'           nom du scénario
+        'rates'          taux remplaçant ceux du barème ({'année': taux en %})
+        'rate_change'    variation en points appliquée à toutes les années
+        'sector_ratios'  ratios cotisations / masse salariale par secteur
+        'exemptions'     part des cotisations exonérée par secteur (0 à 1)
+        'shocks'         chocs supplémentaires sur les cotisations ({année: choc})
+    
+    Les cotisations de référence sont ajustées par le rapport des taux et des
+    ratios du scénario à ceux du modèle de base; masse salariale et effectifs
+    sont partagés par tous les scénarios.
+    """
+    def __init__(self, batch, social_rates, max_cells=2 ** 24):
+        self.companies = np.asarray(batch['Company'], dtype=object)
+        self.years = np.asarray(batch['Year'])
+        self.social = np.asarray(batch['Social Contributions (M€)'], dtype=np.float64)
+        self.payroll = np.asarray(batch['Payroll (M€)'], dtype=np.float64)
+        self.employees = np.asarray(batch['Employees'], dtype=np.float64)
+        self.sector_codes, sectors = pd.factorize(np.asarray(batch['Sector'], dtype=object))
+        self.sectors = list(sectors)
+        # Taille maximale (en cellules) d'un bloc du tableau complet scénarios × entreprises × années
+        self.max_cells = max_cells
+        
+        self.base_rates = np.array([social_rates.get(str(year), np.nan) for year in self.years], dtype=np.float64)
+        self.base_ratios = np.array([SECTOR_SOCIAL_RATIOS.get(sector, DEFAULT_SOCIAL_RATIO)
+                                     for sector in self.sectors], dtype=np.float64)
+        # Matrice d'appartenance entreprises × secteurs, pour les totaux sectoriels
+        self.membership = np.zeros((len(self.companies), len(self.sectors)))
+        self.membership[np.arange(len(self.companies)), self.sector_codes] = 1.0
+    
+    def scenario_arrays(self, scenarios):
+        """Convertit les scénarios en tableaux (scénarios × années) et (scénarios × secteurs)"""
+        n_scenarios = len(scenarios)
+        rates = np.tile(self.base_rates, (n_scenarios, 1))
+        ratios = np.tile(self.base_ratios, (n_scenarios, 1))
+        exemptions = np.zeros((n_scenarios, len(self.sectors)))
+        shocks = np.zeros((n_scenarios, len(self.years)))
+        year_index = {int(year): i for i, year in enumerate(self.years)}
+        sector_index = {sector: i for i, sector in enumerate(self.sectors)}
+        
+        for s, scenario in enumerate(scenarios):
+            for year, rate in scenario.get('rates', {}).items():
+                if int(year) in year_index:
+                    rates[s, year_index[int(year)]] = rate
+            rates[s] += scenario.get('rate_change', 0.0)
+            for sector, ratio in scenario.get('sector_ratios', {}).items():
+                if sector in sector_index:
+                    ratios[s, sector_index[sector]] = ratio
+            for sector, share in scenario.get('exemptions', {}).items():
+                if sector in sector_index:
+                    exemptions[s, sector_index[sector]] = share
+            for year, shock in scenario.get('shocks', {}).items():
+                if int(year) in year_index:
+                    shocks[s, year_index[int(year)]] = shock
+        return rates, ratios, exemptions, shocks
+    
+    def evaluate(self, scenarios, keep_contributions=False):
+        """
+        Évalue tous les scénarios et renvoie un ScenarioResults. Le tableau
+        complet scénarios × entreprises × années (float32) n'est formé que si
+        keep_contributions est vrai.
+        """
+        names = [scenario.get('name', f'scenario_{s}') for s, scenario in enumerate(scenarios)]
+        rates, ratios, exemptions, shocks = self.scenario_arrays(scenarios)
+        
+        # Facteurs séparables: par (scénario, année) et par (scénario, secteur)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            year_factor = rates / self.base_rates * np.cumprod(1 - shocks, axis=1)
+        sector_factor = ratios / self.base_ratios * (1 - exemptions)
+        
+        # Le multiplicateur étant séparable, les totaux sectoriels s'obtiennent à
+        # partir des totaux de référence sans former le tableau complet
+        base_sector_totals = self.membership.T @ np.nan_to_num(self.social)
+        sector_totals = sector_factor[:, :, None] * year_factor[:, None, :] * base_sector_totals[None, :, :]
+        totals = sector_totals.sum(axis=1)
+        
+        # Dernière année: ratios par entreprise (scénarios × entreprises)
+        latest_factor = sector_factor[:, self.sector_codes] * year_factor[:, -1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            latest_ratio = latest_factor * (self.social[:, -1] / self.payroll[:, -1] * 100)
+        ratio_quantiles = np.nanpercentile(latest_ratio, [5, 50, 95], axis=1).T
+        
+        contributions = None
+        if keep_contributions:
+            # Tableau complet scénarios × entreprises × années, rempli par blocs bornés
+            n_companies, n_years = self.social.shape
+            contributions = np.empty((len(scenarios), n_companies, n_years), dtype=np.float32)
+            block = max(1, self.max_cells // max(1, n_companies * n_years))
+            for start in range(0, len(scenarios), block):
+                part = slice(start, start + block)
+                contributions[part] = (self.social[None, :, :] * sector_factor[part][:, self.sector_codes, None]
+                                       * year_factor[part][:, None, :])
+        
+        base_total = np.nansum(self.social)
+        latest_employees = np.nansum(self.employees[:, -1])
+        summary = {
+            'Total (M€)': totals.sum(axis=1),
+            'Delta vs base (%)': (totals.sum(axis=1) / base_total - 1) * 100,
+            f'Total {self.years[-1]} (M€)': totals[:, -1],
+            f'Social per Employee {self.years[-1]} (€)': totals[:, -1] * 1e6 / latest_employees,
+            'Ratio p5 (%)': ratio_quantiles[:, 0],
+            'Ratio p50 (%)': ratio_quantiles[:, 1],
+            'Ratio p95 (%)': ratio_quantiles[:, 2],
+        }
+        return ScenarioResults(names, [int(year) for year in self.years], self.sectors,
+                               totals, sector_totals, summary, contributions)
+
+class StageProfiler:
+    """
+    Instrumentation des étapes du pipeline: durée, lignes traitées,
+    allocations (tracemalloc) et octets écrits par étape, exportés en lignes
+    JSON, avec un profil cProfile optionnel par étape
+    """
+    def __init__(self, log_path=None, profile_dir=None, trace_memory=True):
+        self.log_path = log_path
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.records = []
+        self._profiling = False
+        # Pics mémoire (absolus) des étapes en cours, de la plus externe à la plus interne
+        self._peaks = []
+    
+    @contextmanager
+    def span(self, stage, **fields):
+        """
+        Mesure le bloc encadré. Le dictionnaire renvoyé peut être complété dans
+        le bloc (rows, bytes_written...).
+        """
+        record = {'stage': stage, **fields, 'rows': fields.get('rows', 0),
+                  'bytes_written': fields.get('bytes_written', 0)}
+        
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            memory_before, peak = tracemalloc.get_traced_memory()
+            # Le pic atteint jusqu'ici revient à l'étape parente avant d'être remis à zéro
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(memory_before)
+        
+        # Un seul profil cProfile actif à la fois: les étapes imbriquées sont incluses dans le parent
+        profile = None
+        if self.profile_dir and not self._profiling:
+            profile = cProfile.Profile()
+            self._profiling = True
+            profile.enable()
+        
+        record['start'] = time.time()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profile_path = os.path.join(self.profile_dir, f"{len(self.records):04d}-{stage}.pstats")
+                profile.dump_stats(profile_path)
+                record['profile'] = profile_path
+            
+            if self.trace_memory:
+                memory_after, memory_peak = tracemalloc.get_traced_memory()
+                memory_peak = max(memory_peak, self._peaks.pop())
+                # Le pic d'une étape imbriquée compte aussi dans celui de son parent
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], memory_peak)
+                record['alloc_bytes'] = memory_after - memory_before
+                record['peak_alloc_bytes'] = memory_peak - memory_before
+                if started_tracing:
+                    tracemalloc.stop()
+            
+            self.record(record)
+    
+    def record(self, record):
+        """Enregistre une mesure faite ailleurs (par exemple dans un processus de rendu)"""
+        record.setdefault('rows', 0)
+        record.setdefault('bytes_written', 0)
+        self.records.append(record)
+        if self.log_path:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+    
+    def summary(self):
+        """Durée totale, lignes et octets écrits cumulés par étape"""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes_written': 0})
+            total['count'] += 1
+            total['seconds'] += record['seconds']
+            total['rows'] += record['rows']
+            total['bytes_written'] += record['bytes_written']
+        return totals
+
+# Version du moteur de simulation: à incrémenter quand les séries générées changent
+ENGINE_VERSION = 4
+
+class DatasetCache:
+    """
+    Cache disque des jeux de données produits par get_all_companies_data,
+    adressé par le contenu et stocké au format Arrow IPC (mappable en mémoire)
+    """
+    def __init__(self, directory='.urssaf_cache', max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+    
+    def make_key(self, companies, social_rates, years, seed, history=None):
+        """Calcule la clé d'un jeu de données à partir de tout ce qui le détermine"""
+        payload = json.dumps({
+            'engine': ENGINE_VERSION,
+            'companies': companies,
+            'social_rates': social_rates,
+            'years': [int(year) for year in years],
+            'seed': seed,
+            'history': history,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.arrow")
+    
+    def load(self, key):
+        """Renvoie le DataFrame en cache (colonnes mappées en mémoire) ou None"""
+        import pyarrow as pa
+        
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        
+        # La date de modification sert d'horodatage d'accès pour l'éviction
+        os.utime(path)
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        return table.to_pandas(split_blocks=True)
+    
+    def store(self, key, df):
+        """Écrit un DataFrame dans le cache puis applique la limite de taille"""
+        import pyarrow as pa
+        
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        self.evict()
+    
+    def invalidate(self, key=None):
+        """Supprime une entrée du cache, ou tout le cache si key est None"""
+        if not os.path.isdir(self.directory):
+            return
+        
+        for name in os.listdir(self.directory):
+            if name.endswith('.arrow') and (key is None or name == f"{key}.arrow"):
+                os.remove(os.path.join(self.directory, name))
+    
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes"""
+        if not os.path.isdir(self.directory):
+            return
+        
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.arrow'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+# Correspondance entre les colonnes des exports open data URSSAF et celles du
+# jeu de données (à adapter au jeu de données exporté). Company est la raison
+# sociale de l'entreprise de l'établissement: les exports agrégés par activité
+# (APE) n'ont pas d'entreprise et ne peuvent pas alimenter ce jeu de données.
+OPEN_DATA_COLUMNS = {
+    'Company': 'raison_sociale',
+    'Sector': 'secteur_na17',
+    'Year': 'annee',
+    'Employees': 'effectifs_salaries',
+    'Payroll': 'masse_salariale',
+}
+
+class URSSAFOpenDataClient:
+    """
+    Client asynchrone des exports open data URSSAF: nombre de connexions
+    borné, connexions persistantes, requêtes conditionnelles (ETag /
+    Last-Modified) et reprises avec attente exponentielle.
+    
+    Les requêtes bloquantes (requests) s'exécutent dans un pool de
+    max_connections threads; chaque thread a sa propre session, une
+    requests.Session n'étant pas garantie sûre entre threads.
+    """
+    def __init__(self, base_url='https://open.urssaf.fr/api/explore/v2.1/catalog/datasets',
+                 max_connections=8, max_retries=4, backoff=0.5, timeout=30,
+                 cache_dir='.urssaf_http_cache', headers=None):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.headers = headers
+        
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._executor = None
+    
+    def _session(self):
+        """Session du thread courant, créée à sa première requête puis réutilisée (keep-alive)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if self.headers:
+                session.headers.update(self.headers)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+    
+    def export_url(self, dataset):
+        """URL de l'export CSV complet d'un jeu de données"""
+        return f"{self.base_url}/{dataset}/exports/csv"
+    
+    def _cache_paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return (os.path.join(self.cache_dir, f"{key}.json"),
+                os.path.join(self.cache_dir, f"{key}.body"))
+    
+    def _get(self, url):
+        """Requête GET conditionnelle et bloquante, avec reprises"""
+        import requests
+        
+        meta_path, body_path = self._cache_paths(url)
+        headers = {}
+        if os.path.exists(meta_path) and os.path.exists(body_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"⚠️ {url}: {e}, nouvelle tentative...")
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            
+            if response.status_code == 304:
+                with open(body_path, 'rb') as f:
+                    return f.read()
+            
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                retry_after = response.headers.get('Retry-After', '')
+                delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt
+                print(f"⚠️ {url}: HTTP {response.status_code}, nouvelle tentative dans {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+            
+            response.raise_for_status()
+            
+            # Mémoriser le contenu et ses validateurs pour les prochaines requêtes
+            if response.headers.get('ETag') or response.headers.get('Last-Modified'):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(body_path, 'wb') as f:
+                    f.write(response.content)
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified')}, f)
+            return response.content
+    
+    async def fetch(self, url, semaphore):
+        """Télécharge une URL sans dépasser le nombre de connexions autorisé"""
+        async with semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._get, url)
+    
+    async def fetch_datasets(self, datasets):
+        """Télécharge en parallèle les exports CSV de plusieurs jeux de données"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections,
+                                                thread_name_prefix='urssaf-http')
+        semaphore = asyncio.Semaphore(self.max_connections)
+        bodies = await asyncio.gather(*(self.fetch(self.export_url(dataset), semaphore)
+                                        for dataset in datasets))
+        return dict(zip(datasets, bodies))
+    
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+def normalize_open_data(content, social_rates, columns=OPEN_DATA_COLUMNS, sep=';'):
+    """
+    Convertit un export CSV open data (effectifs salariés et masse salariale
+    en euros) en séries entreprises × années pour build_companies_frame.
+    
+    Les cotisations sociales sont estimées à partir du taux de l'année.
+    """
+    raw = pd.read_csv(io.BytesIO(content), sep=sep)
+    missing = [column for column in columns.values() if column not in raw.columns]
+    if missing:
+        raise ValueError(f"Colonnes absentes de l'export open data: {', '.join(missing)}")
+    data = pd.DataFrame({
+        'Company': raw[columns['Company']].astype(str),
+        'Sector': raw[columns['Sector']].astype(str),
+        'Year': pd.to_numeric(raw[columns['Year']], errors='coerce'),
+        'Employees': pd.to_numeric(raw[columns['Employees']], errors='coerce'),
+        'Payroll': pd.to_numeric(raw[columns['Payroll']], errors='coerce'),
+    }).dropna(subset=['Year'])
+    data['Year'] = data['Year'].astype(int)
+    
+    # Un export peut contenir plusieurs lignes par entreprise et par année (départements...)
+    totals = data.groupby(['Company', 'Year'], sort=True)[['Employees', 'Payroll']].sum(min_count=1)
+    sectors = data.groupby('Company', sort=True)['Sector'].first()
+    years = np.array(sorted(data['Year'].unique()))
+    
+    employees = totals['Employees'].unstack('Year').reindex(index=sectors.index, columns=years)
+    payroll = totals['Payroll'].unstack('Year').reindex(index=sectors.index, columns=years) / 1e6
+    rates = np.array([social_rates.get(str(year), np.nan) for year in years])
+    
+    return {
+        'Company': sectors.index.to_numpy(dtype=object),
+        'Sector': sectors.to_numpy(dtype=object),
+        'Year': years,
+        'Social Contributions (M€)': payroll.to_numpy() * rates / 100,
+        'Payroll (M€)': payroll.to_numpy(),
+        'Employees': employees.to_numpy(),
+    }
+
+# Colonnes des exports en masse: celles de l'open data, plus le SIREN
+# (facultatif: à défaut, les lignes sont indexées par libellé d'entreprise)
+BULK_COLUMNS = {**OPEN_DATA_COLUMNS, 'Siren': 'siren'}
+
+# Enregistrement de l'index disque: une ligne par (entreprise, année) et par bloc lu
+BULK_RECORD = np.dtype([('key', np.int64), ('year', np.int16), ('employees', np.float64), ('payroll', np.float64)])
+
+def _iter_xml_chunks(path, fields, chunk_rows, record_tag):
+    """Lit un export XML élément par élément (lxml.iterparse), en libérant chaque élément lu"""
+    from lxml import etree
+    
+    source = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+    with source:
+        rows = []
+        for _, element in etree.iterparse(source, events=('end',), tag=record_tag):
+            values = {child.tag: child.text for child in element}
+            rows.append([values.get(field) for field in fields])
+            # Mémoire constante: l'élément et ses frères déjà lus sont retirés de l'arbre
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if len(rows) == chunk_rows:
+                yield pd.DataFrame(rows, columns=fields)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows, columns=fields)
+
+def iter_bulk_chunks(path, columns=BULK_COLUMNS, chunk_rows=100_000, sep=';', record_tag='record'):
+    """
+    Parcourt un export en masse (CSV, XML, éventuellement compressés en .gz)
+    par blocs de chunk_rows lignes, renommées selon columns (colonnes absentes
+    du fichier ignorées)
+    """
+    rename = {source: column for column, source in columns.items()}
+    if path.endswith(('.xml', '.xml.gz')):
+        chunks = _iter_xml_chunks(path, list(rename), chunk_rows, record_tag)
+    else:
+        # Tout en texte: pas d'inférence de types bloc par bloc, zéros initiaux du SIREN conservés
+        chunks = pd.read_csv(path, sep=sep, usecols=lambda name: name in rename, dtype=str, chunksize=chunk_rows)
+    for chunk in chunks:
+        yield chunk.rename(columns=rename).dropna(axis=1, how='all')
+
+def _normalize_bulk_chunk(chunk):
+    """Clé (SIREN, sinon libellé), année et séries numériques d'un bloc; lignes sans clé ni année écartées"""
+    def text(column):
+        return chunk[column].fillna('').astype(str).str.strip() if column in chunk else pd.Series('', index=chunk.index)
+    
+    def number(column):
+        return pd.to_numeric(chunk[column], errors='coerce') if column in chunk else np.nan
+    
+    company, siren = text('Company'), text('Siren')
+    data = pd.DataFrame({
+        'Key': siren.where(siren != '', company),
+        'Company': company.where(company != '', siren),
+        'Sector': text('Sector'),
+        'Year': number('Year'),
+        'Employees': number('Employees'),
+        'Payroll': number('Payroll'),
+    })
+    return data[(data['Key'] != '') & data['Year'].notna()]
+
+class BulkIndex:
+    """
+    Index disque des exports en masse, par SIREN (ou entreprise) et par année.
+    
+    Les fichiers sont lus par blocs (mémoire constante pendant la lecture);
+    les lignes normalisées sont ensuite triées par (entreprise, année) dans
+    records.npy, et offsets.npy donne la tranche de chaque entreprise:
+    relire une entreprise est une lecture contiguë, sans reparcourir les
+    exports. Le tri est un tri par comptage sur disque: la mémoire dépend du
+    nombre d'entreprises et de la taille des blocs, pas de celle des exports.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.keys = manifest['keys']
+        self.companies = manifest['companies']
+        self.sectors = manifest['sectors']
+        self.years = np.array(manifest['years'], dtype=int)
+        self.rows_read = manifest['rows_read']
+        self.records = np.load(os.path.join(directory, 'records.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        
+        # Recherche par SIREN ou par nom d'entreprise
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self.key_index.update({company: i for i, company in enumerate(self.companies)})
+    
+    @classmethod
+    def build(cls, paths, directory, columns=BULK_COLUMNS, chunk_rows=100_000, sep=';', record_tag='record'):
+        """Lit les exports (CSV ou XML) et écrit l'index dans directory"""
+        os.makedirs(directory, exist_ok=True)
+        raw_path = os.path.join(directory, 'records.tmp')
+        key_ids, names, sectors = {}, [], []
+        n_records = rows_read = 0
+        # Nombre d'enregistrements de chaque entreprise et années rencontrées
+        counts = np.zeros(0, dtype=np.int64)
+        years = set()
+        
+        with open(raw_path, 'wb') as raw:
+            for path in paths:
+                for chunk in iter_bulk_chunks(path, columns, chunk_rows, sep, record_tag):
+                    rows_read += len(chunk)
+                    data = _normalize_bulk_chunk(chunk)
+                    # Une ligne par (entreprise, année) et par bloc (départements, établissements...)
+                    grouped = data.groupby(['Key', 'Year'], sort=False)[['Employees', 'Payroll']].sum(min_count=1)
+                    first = data.drop_duplicates('Key')
+                    for key, company, sector in zip(first['Key'], first['Company'], first['Sector']):
+                        if key not in key_ids:
+                            key_ids[key] = len(names)
+                            names.append(company)
+                            sectors.append(sector)
+                    
+                    records = np.empty(len(grouped), dtype=BULK_RECORD)
+                    records['key'] = grouped.index.get_level_values('Key').map(key_ids).to_numpy()
+                    records['year'] = grouped.index.get_level_values('Year').to_numpy()
+                    records['employees'] = grouped['Employees'].to_numpy(dtype=np.float64)
+                    records['payroll'] = grouped['Payroll'].to_numpy(dtype=np.float64)
+                    raw.write(records.tobytes())
+                    n_records += len(records)
+                    counts = np.pad(counts, (0, len(names) - len(counts)))
+                    counts += np.bincount(records['key'], minlength=len(names))
+                    years.update(np.unique(records['year']).tolist())
+        
+        # Tranche de chaque entreprise, connue avant le tri
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        records = np.lib.format.open_memmap(os.path.join(directory, 'records.npy'), mode='w+',
+                                            dtype=BULK_RECORD, shape=(n_records,))
+        if n_records:
+            unsorted = np.memmap(raw_path, dtype=BULK_RECORD, mode='r', shape=(n_records,))
+            # Répartition bloc par bloc: chaque enregistrement est écrit à la
+            # suite de ceux de son entreprise déjà placés
+            filled = offsets[:-1].copy()
+            for start in range(0, n_records, chunk_rows):
+                block = np.asarray(unsorted[start:start + chunk_rows])
+                block = block[np.argsort(block['key'], kind='stable')]
+                keys, first_positions, block_counts = np.unique(block['key'], return_index=True, return_counts=True)
+                ranks = np.arange(len(block)) - np.repeat(first_positions, block_counts)
+                records[filled[block['key']] + ranks] = block
+                filled[keys] += block_counts
+            del unsorted
+            
+            # Années triées à l'intérieur de chaque entreprise, par groupes
+            # d'entreprises entières d'au plus chunk_rows enregistrements
+            first_key = 0
+            while first_key < len(names):
+                last_key = max(first_key + 1, int(np.searchsorted(offsets, offsets[first_key] + chunk_rows, side='right')) - 1)
+                part = slice(offsets[first_key], offsets[last_key])
+                block = np.asarray(records[part])
+                records[part] = block[np.lexsort((block['year'], block['key']))]
+                first_key = last_key
+        records.flush()
+        np.save(os.path.join(directory, 'offsets.npy'), offsets)
+        del records
+        os.remove(raw_path)
+        years = sorted(int(year) for year in years)
+        
+        # Noms d'entreprises uniques (un même libellé peut couvrir plusieurs SIREN)
+        counts = pd.Series(names).value_counts()
+        keys = list(key_ids)
+        companies = [f'{name} ({key})' if counts[name] > 1 else name for name, key in zip(names, keys)]
+        
+        manifest = {'keys': keys, 'companies': companies, 'sectors': sectors, 'years': years,
+                    'sources': [os.path.abspath(path) for path in paths],
+                    'rows_read': rows_read, 'records': n_records}
+        with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        return cls(directory)
+    
+    def company_records(self, company):
+        """Enregistrements d'une entreprise (SIREN ou nom): une seule lecture contiguë"""
+        i = self.key_index.get(company)
+        if i is None:
+            return self.records[:0]
+        return np.asarray(self.records[self.offsets[i]:self.offsets[i + 1]])
+    
+    def batch(self, social_rates, companies=None):
+        """
+        Séries entreprises × années (toutes les entreprises, ou seulement
+        celles demandées, lues par accès direct) pour build_companies_frame
+        """
+        if companies is None:
+            ids = np.arange(len(self.keys))
+            records = np.asarray(self.records)
+            rows = records['key']
+        else:
+            ids = np.array([self.key_index[company] for company in companies if company in self.key_index], dtype=int)
+            parts = [self.company_records(self.keys[i]) for i in ids]
+            records = np.concatenate(parts) if parts else self.records[:0]
+            rows = np.repeat(np.arange(len(ids)), [len(part) for part in parts])
+        
+        # Somme des lignes d'une même (entreprise, année), NaN si aucune valeur
+        shape = (len(ids), len(self.years))
+        positions = (rows, np.searchsorted(self.years, records['year']))
+        series = {}
+        for column in ('employees', 'payroll'):
+            values = records[column]
+            totals, counts = np.zeros(shape), np.zeros(shape)
+            np.add.at(totals, positions, np.nan_to_num(values))
+            np.add.at(counts, positions, ~np.isnan(values))
+            series[column] = np.where(counts > 0, totals, np.nan)
+        
+        payroll = series['payroll'] / 1e6
+        rates = np.array([social_rates.get(str(year), np.nan) for year in self.years])
+        return {
+            'Company': np.array(self.companies, dtype=object)[ids],
+            'Sector': np.array(self.sectors, dtype=object)[ids],
+            'Year': self.years.copy(),
+            'Social Contributions (M€)': payroll * rates / 100,
+            'Payroll (M€)': payroll,
+            'Employees': series['employees'],
+        }
+    
+    def company_rows(self, company, social_rates):
+        """Lignes d'une entreprise, dans les colonnes de get_all_companies_data (vide si inconnue)"""
+        return build_companies_frame(self.batch(social_rates, [company]), social_rates)
+
+# Indicateurs agrégés par l'AggregateCube
+CUBE_METRICS = ['Social Contributions (M€)', 'Payroll (M€)', 'Employees', 'Social Rate (%)',
+                'Avg Salary (€)', 'Social/Payroll Ratio (%)', 'Social per Employee (€)',
+                'Payroll per Employee (€)']
+
+class TopKRanking:
+    """
+    Classements top-K par (indicateur, année, secteur), alimentés bloc par
+    bloc. Seules les k meilleures lignes de chaque (Year, Sector) sont
+    conservées: chaque bloc est fusionné avec elles par un seul tri vectorisé
+    (groupe, valeur décroissante, ordre de lecture). Le classement d'une année
+    tous secteurs confondus s'en déduit, ses k meilleures lignes étant parmi
+    celles des secteurs.
+    """
+    def __init__(self, k=10, metrics=None):
+        self.k = k
+        self.metrics = list(CUBE_METRICS if metrics is None else metrics)
+        # {indicateur: DataFrame des lignes retenues, avec leur rang de lecture '_seq'}
+        self.kept = {}
+        self.rows_seen = 0
+    
+    @classmethod
+    def from_chunks(cls, chunks, k=10, metrics=None):
+        """Construit le classement à partir d'un itérable de DataFrames"""
+        ranking = cls(k, metrics)
+        for chunk in chunks:
+            ranking.update(chunk)
+        return ranking
+    
+    def _select(self, frame, metric, groups=None):
+        """Les k meilleures lignes de chaque (Year, Sector) de frame (groups: numéros de groupe déjà calculés)"""
+        if groups is None:
+            groups = frame.groupby(['Year', 'Sector'], sort=False).ngroup().to_numpy()
+        # À valeur égale, la première ligne lue l'emporte (comme DataFrame.nlargest)
+        order = np.lexsort((frame['_seq'].to_numpy(), -frame[metric].to_numpy(), groups))
+        sorted_groups = groups[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]) if len(order) else np.array([], dtype=int)
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        return frame.iloc[order[ranks < self.k]].reset_index(drop=True)
+    
+    def update(self, chunk):
+        """Ajoute un bloc de lignes (Company, Sector, Year et indicateurs) au classement"""
+        columns = ['Company', 'Sector', 'Year'] + CUBE_METRICS
+        records = chunk[columns].assign(Company=chunk['Company'].astype(str),
+                                        Sector=chunk['Sector'].astype(str),
+                                        _seq=self.rows_seen + np.arange(len(chunk))).reset_index(drop=True)
+        # Groupes (Year, Sector) du bloc, communs à tous les indicateurs
+        groups = records.groupby(['Year', 'Sector'], sort=False).ngroup().to_numpy()
+        for metric in self.metrics:
+            valid = records[metric].notna().to_numpy()
+            candidates = self._select(records[valid], metric, groups[valid])
+            kept = self.kept.get(metric)
+            self.kept[metric] = candidates if kept is None else self._select(
+                pd.concat([kept, candidates], ignore_index=True), metric)
+        self.rows_seen += len(records)
+    
+    def top(self, metric, year=None, sector=None, n=None):
+        """Les n meilleures lignes (n <= k) pour un indicateur, une année et/ou un secteur"""
+        n = self.k if n is None else n
+        if n > self.k:
+            raise ValueError(f"Classement limité à {self.k} lignes (demandé: {n})")
+        if metric not in self.metrics:
+            raise KeyError(metric)
+        
+        columns = ['Company', 'Sector', 'Year'] + CUBE_METRICS
+        kept = self.kept.get(metric)
+        if kept is None:
+            return pd.DataFrame(columns=columns)
+        mask = np.ones(len(kept), dtype=bool)
+        if year is not None:
+            mask &= kept['Year'].to_numpy() == year
+        if sector is not None:
+            mask &= kept['Sector'].to_numpy() == sector
+        rows = kept[mask].sort_values([metric, '_seq'], ascending=[False, True], kind='stable').head(n)
+        return rows[columns].reset_index(drop=True)
+
+class AggregateCube:
+    """
+    Agrégats par (Sector, Year) et index des lignes de chaque entreprise et de
+    chaque secteur, calculés une seule fois pour toutes les fonctions de rapport
+    """
+    def __init__(self, df, quantiles=(0.25, 0.5, 0.75)):
+        # Disposition compacte: les indicateurs calculés sont recalculés ici
+        df = add_derived_columns(df)
+        self.df = df
+        
+        grouped = df.groupby(['Sector', 'Year'], observed=True)[CUBE_METRICS]
+        self.mean = grouped.mean()
+        self.count = grouped.size()
+        self.quantiles = grouped.quantile(list(quantiles))
+        self._rankings = {}
+        self._trends = None
+        self._peers = None
+        
+        self.company_order, self.company_bounds = self._build_index(df['Company'])
+        self.sector_order, self.sector_bounds = self._build_index(df['Sector'])
+        self.sectors = list(self.sector_bounds)
+        self.years = np.sort(df['Year'].unique())
+        self.latest_year = df['Year'].max()
+    
+    @staticmethod
+    def _build_index(column):
+        """Associe chaque valeur à sa tranche dans la permutation triée des lignes"""
+        codes, uniques = pd.factorize(column)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        return order, {value: (bounds[i], bounds[i + 1]) for i, value in enumerate(uniques)}
+    
+    def company_rows(self, company):
+        """Renvoie les lignes d'une entreprise (DataFrame vide si inconnue)"""
+        start, stop = self.company_bounds.get(company, (0, 0))
+        return self.df.iloc[self.company_order[start:stop]]
+    
+    def companies_rows(self, companies):
+        """Renvoie les lignes de plusieurs entreprises, dans l'ordre demandé"""
+        bounds = [self.company_bounds.get(company, (0, 0)) for company in companies]
+        positions = [self.company_order[start:stop] for start, stop in bounds]
+        return self.df.iloc[np.concatenate(positions) if positions else []]
+    
+    def sector_rows(self, sector):
+        """Renvoie les lignes d'un secteur (DataFrame vide si inconnu)"""
+        start, stop = self.sector_bounds.get(sector, (0, 0))
+        return self.df.iloc[self.sector_order[start:stop]]
+    
+    def sector_mean(self, sector, year, column):
+        """Moyenne d'un indicateur pour un secteur et une année"""
+        return self.mean.at[(sector, year), column]
+    
+    def sector_values(self, sector, column):
+        """Valeurs d'un indicateur pour toutes les lignes d'un secteur"""
+        return self.sector_rows(sector)[column].to_numpy()
+    
+    def year_mean(self, column):
+        """Moyenne d'un indicateur par année, tous secteurs confondus"""
+        return self.df.groupby('Year')[column].mean()
+    
+    def iter_chunks(self, chunk_size=1_000_000):
+        """Parcourt le jeu de données par blocs de lignes"""
+        for start in range(0, len(self.df), chunk_size):
+            yield self.df.iloc[start:start + chunk_size]
+    
+    def ranking(self, k=10):
+        """Classement top-K partagé, calculé une seule fois par valeur de k"""
+        if k not in self._rankings:
+            self._rankings[k] = TopKRanking.from_chunks(self.iter_chunks(), k)
+        return self._rankings[k]
+    
+    def nlargest(self, n, column, year=None, sector=None):
+        """Les n lignes de plus forte valeur pour un indicateur (éventuellement pour une année ou un secteur)"""
+        return self.ranking(max(n, 10)).top(column, year, sector, n)
+    
+    def describe(self, columns):
+        """Statistiques descriptives des indicateurs"""
+        return self.df[columns].describe()
+    
+    def trends(self, companies=None):
+        """
+        Indicateurs de tendance de toutes les entreprises, calculés une seule
+        fois (le jeu étant en mémoire, companies ne restreint rien)
+        """
+        if self._trends is None:
+            self._trends = TrendAnalytics.from_frame(self.df)
+        return self._trends
+    
+    def crisis_impact(self, metrics):
+        """Médiane, sur toutes les entreprises, des écarts de crise de chaque indicateur"""
+        return self.trends().crisis_impact(metrics)
+    
+    def peers(self):
+        """Index des entreprises comparables, construit une seule fois"""
+        if self._peers is None:
+            self._peers = PeerIndex(self.trends())
+        return self._peers
+    
+    def peers_of(self, company, k=10, same_sector=False):
+        """Les k entreprises les plus comparables à une entreprise (KeyError si inconnue)"""
+        return self.peers().query(company, k, same_sector)
+
+def _crisis_periods(shocks=CRISIS_SHOCKS):
+    """Regroupe les années de choc consécutives en périodes: {'2008-2009': (2008, 2009), ...}"""
+    years = sorted({year for metric_shocks in shocks.values() for year in metric_shocks})
+    periods = []
+    for year in years:
+        if periods and year == periods[-1][1] + 1:
+            periods[-1][1] = year
+        else:
+            periods.append([year, year])
+    return {(f'{start}-{end}' if end > start else f'{start}'): (start, end) for start, end in periods}
+
+# Périodes de crise mesurées par TrendAnalytics (celles des simulateurs)
+CRISIS_PERIODS = _crisis_periods()
+
+class TrendAnalytics:
+    """
+    Indicateurs de tendance de toutes les entreprises à la fois: croissance
+    annuelle, TCAM sur une fenêtre quelconque, moyennes et volatilités
+    glissantes, écarts avant/après crise. Chaque indicateur est une matrice
+    entreprises × années; tous les calculs sont des opérations vectorisées
+    sur l'axe des années, sans boucle par entreprise.
+    """
+    def __init__(self, companies, sectors, years, values, window=3, crises=None):
+        self.companies = np.asarray(companies, dtype=object)
+        self.sectors = np.asarray(sectors, dtype=object)
+        self.years = np.asarray(years)
+        # {indicateur: matrice float64 entreprises × années}, NaN pour les années manquantes
+        self.values = values
+        self.metrics = list(values)
+        self.window = window
+        self.crises = CRISIS_PERIODS if crises is None else crises
+        self.company_index = {company: i for i, company in enumerate(self.companies)}
+        self._summary = None
+    
+    @classmethod
+    def from_frame(cls, df, metrics=None, years=None, window=3, crises=None):
+        """Construit les matrices à partir du panel (une ligne par entreprise et par année)"""
+        metrics = CUBE_METRICS if metrics is None else metrics
+        df = add_derived_columns(df, [metric for metric in metrics if metric in DERIVED_COLUMNS])
+        codes, companies = pd.factorize(df['Company'])
+        years = np.unique(df['Year'].to_numpy()) if years is None else np.asarray(years)
+        year_positions = np.searchsorted(years, df['Year'].to_numpy())
+        
+        # Secteur de chaque entreprise: celui de sa première ligne
+        first = np.full(len(companies), len(df))
+        np.minimum.at(first, codes, np.arange(len(df)))
+        sectors = np.asarray(df['Sector'].to_numpy(dtype=object))[first]
+        
+        values = {}
+        for metric in metrics:
+            matrix = np.full((len(companies), len(years)), np.nan)
+            matrix[codes, year_positions] = df[metric].to_numpy(dtype=np.float64)
+            values[metric] = matrix
+        return cls(np.asarray(companies, dtype=object).astype(str), sectors.astype(str), years,
+                   values, window, crises)
+    
+    def _year_position(self, year):
+        positions = np.flatnonzero(self.years == year)
+        return positions[0] if len(positions) else None
+    
+    def yoy(self, metric):
+        """Croissance annuelle (%) par entreprise et par année (NaN la première année)"""
+        matrix = self.values[metric]
+        growth = np.full(matrix.shape, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth[:, 1:] = np.where(matrix[:, :-1] > 0, (matrix[:, 1:] / matrix[:, :-1] - 1) * 100, np.nan)
+        return growth
+    
+    def cagr(self, metric, start=None, end=None):
+        """Taux de croissance annuel moyen (%) entre deux années, pour chaque entreprise"""
+        start = self.years[0] if start is None else start
+        end = self.years[-1] if end is None else end
+        i, j = self._year_position(start), self._year_position(end)
+        if i is None or j is None or j <= i:
+            return np.full(len(self.companies), np.nan)
+        matrix = self.values[metric]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(matrix[:, i] > 0, matrix[:, j] / matrix[:, i], np.nan)
+            return (np.power(ratio, 1 / (end - start)) - 1) * 100
+    
+    def _rolling(self, matrix, window, reduce):
+        """Statistique glissante sur window années (NaN tant que la fenêtre n'est pas pleine)"""
+        result = np.full(matrix.shape, np.nan)
+        if matrix.shape[1] >= window:
+            windows = np.lib.stride_tricks.sliding_window_view(matrix, window, axis=1)
+            result[:, window - 1:] = reduce(windows)
+        return result
+    
+    def rolling_mean(self, metric, window=None):
+        """Moyenne glissante d'un indicateur sur window années"""
+        return self._rolling(self.values[metric], window or self.window, lambda w: w.mean(axis=-1))
+    
+    def rolling_volatility(self, metric, window=None):
+        """Écart-type glissant (points de %) de la croissance annuelle sur window années"""
+        window = max(window or self.window, 2)
+        return self._rolling(self.yoy(metric), window, lambda w: w.std(axis=-1, ddof=1))
+    
+    def crisis_deltas(self, metric):
+        """
+        Pour chaque crise: évolution (%) entre l'année précédant la crise et sa
+        dernière année, et écart (%) entre les moyennes des window années
+        suivant et précédant la crise
+        """
+        matrix = self.values[metric]
+        n_years = len(self.years)
+        deltas = {}
+        for name, (start, end) in self.crises.items():
+            i, j = self._year_position(start), self._year_position(end)
+            shock = post_pre = np.full(len(self.companies), np.nan)
+            if i is not None and j is not None and i > 0:
+                before = matrix[:, max(0, i - self.window):i].mean(axis=1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    shock = np.where(matrix[:, i - 1] > 0, (matrix[:, j] / matrix[:, i - 1] - 1) * 100, np.nan)
+                    if j + 1 < n_years:
+                        after = matrix[:, j + 1:j + 1 + self.window].mean(axis=1)
+                        post_pre = np.where(before > 0, (after / before - 1) * 100, np.nan)
+            deltas[f'Crisis {name} (%)'] = shock
+            deltas[f'Post/Pre {name} (%)'] = post_pre
+        return deltas
+    
+    def metric_summary(self, metric):
+        """Tendance d'un indicateur: une ligne par entreprise"""
+        matrix = self.values[metric]
+        valid = ~np.isnan(matrix)
+        any_valid = valid.any(axis=1)
+        count = valid.sum(axis=1)
+        filled_low, filled_high = np.where(valid, matrix, np.inf), np.where(valid, matrix, -np.inf)
+        max_position, min_position = filled_high.argmax(axis=1), filled_low.argmin(axis=1)
+        rows = np.arange(len(matrix))
+        growth = self.yoy(metric)
+        growth_valid = ~np.isnan(growth)
+        growth_count = growth_valid.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth_mean = np.where(growth_valid, growth, 0).sum(axis=1) / growth_count
+            volatility = np.sqrt(np.where(growth_valid, (growth - growth_mean[:, None]) ** 2, 0).sum(axis=1)
+                                 / (growth_count - 1))
+            mean = np.where(valid, matrix, 0).sum(axis=1) / count
+        
+        summary = {
+            'Company': self.companies,
+            'Sector': self.sectors,
+            'Metric': metric,
+            'Max': np.where(any_valid, matrix[rows, max_position], np.nan),
+            'Max Year': np.where(any_valid, self.years[max_position], np.nan),
+            'Min': np.where(any_valid, matrix[rows, min_position], np.nan),
+            'Min Year': np.where(any_valid, self.years[min_position], np.nan),
+            'Mean': mean,
+            'CAGR (%)': self.cagr(metric),
+            f'CAGR {self.window}y (%)': self.cagr(metric, self.years[-1] - self.window, self.years[-1]),
+            'Last YoY (%)': growth[:, -1],
+            'YoY Volatility (%)': volatility,
+        }
+        summary.update(self.crisis_deltas(metric))
+        return pd.DataFrame(summary)
+    
+    @property
+    def summary(self):
+        """Tableau de synthèse: une ligne par (indicateur, entreprise), calculé une seule fois"""
+        if self._summary is None:
+            self._summary = pd.concat([self.metric_summary(metric) for metric in self.metrics], ignore_index=True)
+        return self._summary
+    
+    def company(self, company, metric='Social Contributions (M€)'):
+        """Ligne de synthèse d'une entreprise pour un indicateur (None si inconnue)"""
+        i = self.company_index.get(company)
+        if i is None:
+            return None
+        return self.summary.iloc[self.metrics.index(metric) * len(self.companies) + i]
+    
+    def companies_summary(self, companies, metric='Social Contributions (M€)'):
+        """Lignes de synthèse de plusieurs entreprises, dans l'ordre demandé (inconnues ignorées)"""
+        positions = [self.company_index[company] for company in companies if company in self.company_index]
+        return self.summary.iloc[self.metrics.index(metric) * len(self.companies) + np.asarray(positions, dtype=int)]
+    
+    def table(self, metrics=None):
+        """
+        Tableau par (entreprise, indicateur, année): valeur, croissance annuelle,
+        moyenne et volatilité glissantes
+        """
+        metrics = self.metrics if metrics is None else metrics
+        n_companies, n_years = len(self.companies), len(self.years)
+        frames = [pd.DataFrame({
+            'Company': np.repeat(self.companies, n_years),
+            'Sector': np.repeat(self.sectors, n_years),
+            'Metric': metric,
+            'Year': np.tile(self.years, n_companies),
+            'Value': self.values[metric].ravel(),
+            'YoY (%)': self.yoy(metric).ravel(),
+            'Rolling Mean': self.rolling_mean(metric).ravel(),
+            'Rolling Volatility (%)': self.rolling_volatility(metric).ravel(),
+        }) for metric in metrics]
+        table = pd.concat(frames, ignore_index=True)
+        return table.astype({'Company': 'category', 'Sector': 'category', 'Metric': 'category'})
+    
+    def crisis_impact(self, metrics=None):
+        """Médiane, sur toutes les entreprises, des écarts de crise de chaque indicateur"""
+        metrics = self.metrics if metrics is None else metrics
+        return self.median_crisis_impact(self.summary, metrics)
+    
+    @staticmethod
+    def median_crisis_impact(summary, metrics):
+        """Médiane par indicateur des colonnes d'écarts de crise d'un tableau de synthèse"""
+        summary = summary[summary['Metric'].isin(metrics)]
+        columns = [column for column in summary.columns if column.startswith(('Crisis ', 'Post/Pre '))]
+        return summary.groupby('Metric', sort=False)[columns].median().reindex(metrics)
+
+# Indicateurs décrivant une entreprise pour la recherche de pairs; les
+# indicateurs de taille sont comparés en logarithme (écarts relatifs)
+PEER_METRICS = {
+    'Social Contributions (M€)': True,
+    'Payroll (M€)': True,
+    'Employees': True,
+    'Social/Payroll Ratio (%)': False,
+    'Social per Employee (€)': True,
+}
+
+# (en-tête, colonne, format printf, largeur)
+PEER_COLUMNS = [
+    ('Entreprise', 'Company', '%s', 20),
+    ('Rang', 'Rank', '%d', 5),
+    ('Pair', 'Peer', '%s', 20),
+    ('Secteur', 'Sector', '%s', 22),
+    ('Distance', 'Distance', '%.3f', 9),
+]
+
+class PeerIndex:
+    """
+    Index des plus proches voisins sur les trajectoires des entreprises:
+    chaque entreprise est un vecteur (indicateurs × années) dont chaque
+    coordonnée est centrée-réduite sur l'ensemble des entreprises. Les
+    distances euclidiennes sont calculées par blocs de lignes
+    (|x|² + |y|² - 2 x·y, un produit matriciel par bloc), la mémoire restant
+    bornée à max_cells distances à la fois.
+    """
+    def __init__(self, trends, metrics=None, max_cells=2 ** 24):
+        metrics = PEER_METRICS if metrics is None else metrics
+        self.companies = trends.companies
+        self.sectors = trends.sectors
+        self.company_index = trends.company_index
+        self.max_cells = max_cells
+        
+        columns = []
+        for metric, use_log in metrics.items():
+            matrix = trends.values[metric]
+            if use_log:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    matrix = np.where(matrix > 0, np.log(matrix), np.nan)
+            valid = ~np.isnan(matrix)
+            count = np.maximum(valid.sum(axis=0), 1)
+            mean = np.where(valid, matrix, 0).sum(axis=0) / count
+            std = np.sqrt(np.where(valid, (matrix - mean) ** 2, 0).sum(axis=0) / count)
+            # Valeur manquante: moyenne de l'année (coordonnée nulle); chaque
+            # indicateur pèse autant quel que soit le nombre d'années
+            z = np.where(valid, (matrix - mean) / np.where(std > 0, std, 1), 0)
+            columns.append(z / np.sqrt(matrix.shape[1]))
+        self.features = np.hstack(columns).astype(np.float32)
+        self.norms = np.einsum('ij,ij->i', self.features, self.features)
+    
+    def _nearest(self, rows, candidates, k):
+        """k plus proches candidats de chaque ligne (hors elle-même), par blocs de lignes"""
+        k = min(k, max(len(candidates) - 1, 0))
+        neighbours = np.empty((len(rows), k), dtype=np.int64)
+        distances = np.empty((len(rows), k), dtype=np.float32)
+        if k == 0:
+            return neighbours, distances
+        # Position de chaque ligne parmi les candidats (-1 si absente), pour s'exclure elle-même
+        positions = np.full(len(self.companies), -1)
+        positions[candidates] = np.arange(len(candidates))
+        y, y_norms = self.features[candidates], self.norms[candidates]
+        block = max(1, self.max_cells // len(candidates))
+        
+        for start in range(0, len(rows), block):
+            part = rows[start:start + block]
+            # |y|² - 2 x·y suffit à ordonner les candidats de chaque ligne; |x|²
+            # et la racine ne sont ajoutés qu'aux k distances retenues
+            scores = self.features[part] @ y.T
+            scores *= -2
+            scores += y_norms
+            own = positions[part]
+            scores[np.flatnonzero(own >= 0), own[own >= 0]] = np.inf
+            nearest = np.argpartition(scores, k - 1, axis=1)[:, :k]
+            nearest_scores = np.take_along_axis(scores, nearest, axis=1)
+            order = np.argsort(nearest_scores, axis=1, kind='stable')
+            neighbours[start:start + block] = candidates[np.take_along_axis(nearest, order, axis=1)]
+            squared = np.take_along_axis(nearest_scores, order, axis=1) + self.norms[part][:, None]
+            distances[start:start + block] = np.sqrt(np.maximum(squared, 0))
+        return neighbours, distances
+    
+    def _frame(self, rows, neighbours, distances):
+        k = neighbours.shape[1]
+        return pd.DataFrame({
+            'Company': np.repeat(self.companies[rows], k),
+            'Rank': np.tile(np.arange(1, k + 1), len(rows)),
+            'Peer': self.companies[neighbours.ravel()],
+            'Sector': self.sectors[neighbours.ravel()],
+            'Distance': distances.ravel(),
+        })
+    
+    def query(self, company, k=10, same_sector=False):
+        """Les k entreprises les plus proches d'une entreprise (éventuellement du même secteur)"""
+        if company not in self.company_index:
+            raise KeyError(company)
+        row = np.array([self.company_index[company]])
+        candidates = np.arange(len(self.companies))
+        if same_sector:
+            candidates = np.flatnonzero(self.sectors == self.sectors[row[0]])
+        return self._frame(row, *self._nearest(row, candidates, k))
+    
+    def all_pairs(self, k=10, same_sector=False):
+        """
+        Les k plus proches voisins de toutes les entreprises, en un seul
+        tableau (Company, Rank, Peer, Sector, Distance). same_sector: les
+        secteurs sont traités séparément, chacun par blocs.
+        """
+        if not same_sector:
+            rows = np.arange(len(self.companies))
+            return self._frame(rows, *self._nearest(rows, rows, k))
+        frames = [self._frame(rows, *self._nearest(rows, rows, k))
+                  for rows in (np.flatnonzero(self.sectors == sector) for sector in pd.unique(self.sectors))]
+        return pd.concat(frames, ignore_index=True)
+
+class ColumnStore:
+    """
+    Stockage hors mémoire du jeu de données: un fichier .npy par colonne et
+    par secteur, lu par mappage mémoire. Expose la même interface que
+    AggregateCube, calculée par blocs de lignes sans charger le jeu complet.
+    """
+    def __init__(self, directory, block_rows=1_000_000):
+        self.directory = directory
+        self.block_rows = block_rows
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        self.years = np.array(manifest['years'])
+        self.columns = manifest['columns']
+        self.partitions = {partition['sector']: partition for partition in manifest['partitions']}
+        self.sectors = list(self.partitions)
+        self.latest_year = int(self.years.max())
+        
+        self.company_index = {}
+        for partition in manifest['partitions']:
+            for i, company in enumerate(partition['companies']):
+                self.company_index[company] = (partition['sector'], i)
+        
+        self.mean, self.count = self._sector_year_stats()
+        self._rankings = {}
+        self._peers = None
+    
+    @classmethod
+    def write(cls, analyzer, directory, chunk_size=1000, companies=None):
+        """Génère le jeu de données par blocs d'entreprises directement dans les fichiers"""
+        names = list(analyzer.companies) if companies is None else list(companies)
+        n_years = len(analyzer.years)
+        
+        by_sector = {}
+        for company in names:
+            by_sector.setdefault(analyzer.companies[company]['sector'], []).append(company)
+        
+        columns = ['Year'] + CUBE_METRICS
+        partitions = []
+        for p, (sector, sector_companies) in enumerate(by_sector.items()):
+            partition_dir = os.path.join(directory, f"sector_{p:03d}")
+            os.makedirs(partition_dir, exist_ok=True)
+            n_rows = len(sector_companies) * n_years
+            arrays = [np.lib.format.open_memmap(os.path.join(partition_dir, f"col_{c:02d}.npy"), mode='w+',
+                                                dtype=np.int16 if column == 'Year' else np.float64,
+                                                shape=(n_rows,))
+                      for c, column in enumerate(columns)]
+            
+            for start in range(0, len(sector_companies), chunk_size):
+                chunk = sector_companies[start:start + chunk_size]
+                frame = build_companies_frame(analyzer.simulate_companies_batch(chunk), analyzer.social_rates)
+                rows = slice(start * n_years, start * n_years + len(frame))
+                for array, column in zip(arrays, columns):
+                    array[rows] = frame[column].to_numpy()
+            
+            for array in arrays:
+                array.flush()
+            partitions.append({'sector': sector, 'path': f"sector_{p:03d}", 'rows': n_rows,
+                               'companies': sector_companies})
+        
+        with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'years': [int(year) for year in analyzer.years], 'columns': columns,
+                       'partitions': partitions}, f, ensure_ascii=False)
+        return cls(directory)
+    
+    def column(self, sector, column):
+        """Colonne d'un secteur, mappée en mémoire"""
+        partition = self.partitions[sector]
+        index = self.columns.index(column)
+        return np.load(os.path.join(self.directory, partition['path'], f"col_{index:02d}.npy"), mmap_mode='r')
+    
+    def _blocks(self, sector):
+        for start in range(0, self.partitions[sector]['rows'], self.block_rows):
+            yield slice(start, start + self.block_rows)
+    
+    def _sector_year_stats(self):
+        """Moyennes et effectifs par (Sector, Year), par sommes cumulées bloc par bloc"""
+        n_years = len(self.years)
+        index, means, counts = [], [], []
+        for sector in self.sectors:
+            years = self.column(sector, 'Year')
+            sums = np.zeros((len(CUBE_METRICS), n_years))
+            valid = np.zeros((len(CUBE_METRICS), n_years))
+            rows = np.zeros(n_years)
+            for block in self._blocks(sector):
+                offsets = np.searchsorted(self.years, years[block])
+                rows += np.bincount(offsets, minlength=n_years)
+                for m, column in enumerate(CUBE_METRICS):
+                    values = np.asarray(self.column(sector, column)[block])
+                    known = ~np.isnan(values)
+                    sums[m] += np.bincount(offsets[known], weights=values[known], minlength=n_years)
+                    valid[m] += np.bincount(offsets[known], minlength=n_years)
+            present = rows > 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means.append((sums / valid).T[present])
+            counts.append(rows[present])
+            index.extend((sector, int(year)) for year in self.years[present])
+        
+        multi_index = pd.MultiIndex.from_tuples(index, names=['Sector', 'Year'])
+        mean = pd.DataFrame(np.vstack(means), index=multi_index, columns=CUBE_METRICS)
+        count = pd.Series(np.concatenate(counts).astype(np.int64), index=multi_index)
+        return mean, count
+    
+    def _rows_frame(self, sector, rows):
+        """DataFrame des lignes rows (indices) d'un secteur"""
+        companies = np.array(self.partitions[sector]['companies'], dtype=object)
+        data = {'Company': companies[np.asarray(rows, dtype=np.int64) // len(self.years)], 'Sector': sector}
+        for column in self.columns:
+            data[column] = np.asarray(self.column(sector, column)[rows])
+        return pd.DataFrame(data, columns=['Company', 'Sector'] + self.columns)
+    
+    def company_rows(self, company):
+        """Renvoie les lignes d'une entreprise (DataFrame vide si inconnue)"""
+        if company not in self.company_index:
+            return pd.DataFrame(columns=['Company', 'Sector'] + self.columns)
+        sector, i = self.company_index[company]
+        n_years = len(self.years)
+        return self._rows_frame(sector, np.arange(i * n_years, (i + 1) * n_years))
+    
+    def companies_rows(self, companies):
+        """Renvoie les lignes de plusieurs entreprises, lues secteur par secteur"""
+        n_years = len(self.years)
+        by_sector = {}
+        for company in companies:
+            if company in self.company_index:
+                sector, i = self.company_index[company]
+                by_sector.setdefault(sector, []).append(i)
+        frames = [self._rows_frame(sector, (np.array(indices)[:, None] * n_years + np.arange(n_years)).ravel())
+                  for sector, indices in by_sector.items()]
+        if not frames:
+            return pd.DataFrame(columns=['Company', 'Sector'] + self.columns)
+        return pd.concat(frames, ignore_index=True)
+    
+    def sector_rows(self, sector):
+        """Renvoie les lignes d'un secteur (chargées en mémoire)"""
+        return self._rows_frame(sector, np.arange(self.partitions[sector]['rows']))
+    
+    def sector_mean(self, sector, year, column):
+        """Moyenne d'un indicateur pour un secteur et une année"""
+        return self.mean.at[(sector, year), column]
+    
+    def sector_values(self, sector, column):
+        """Valeurs d'un indicateur pour un secteur, mappées en mémoire"""
+        return self.column(sector, column)
+    
+    def year_mean(self, column):
+        """Moyenne d'un indicateur par année, tous secteurs confondus"""
+        weighted = (self.mean[column] * self.count).groupby(level='Year').sum()
+        return weighted / self.count.groupby(level='Year').sum()
+    
+    def iter_chunks(self):
+        """Parcourt les partitions par blocs de lignes, sous forme de DataFrames"""
+        n_years = len(self.years)
+        for sector in self.sectors:
+            companies = np.array(self.partitions[sector]['companies'], dtype=object)
+            for block in self._blocks(sector):
+                rows = np.arange(block.start, min(block.stop, self.partitions[sector]['rows']))
+                data = {'Company': companies[rows // n_years], 'Sector': sector}
+                for column in self.columns:
+                    data[column] = np.asarray(self.column(sector, column)[block])
+                yield pd.DataFrame(data, columns=['Company', 'Sector'] + self.columns)
+    
+    def ranking(self, k=10):
+        """Classement top-K partagé, calculé en un seul parcours des blocs"""
+        if k not in self._rankings:
+            self._rankings[k] = TopKRanking.from_chunks(self.iter_chunks(), k)
+        return self._rankings[k]
+    
+    def nlargest(self, n, column, year=None, sector=None):
+        """Les n lignes de plus forte valeur pour un indicateur (éventuellement pour une année ou un secteur)"""
+        return self.ranking(max(n, 10)).top(column, year, sector, n)
+    
+    def _partition_matrices(self, sector, positions=None, metrics=None):
+        """
+        Matrices entreprises × années d'une partition (ou de certaines de ses
+        entreprises): les lignes d'une entreprise étant contiguës (une par
+        année), chaque colonne se lit directement comme une matrice.
+        """
+        n_years = len(self.years)
+        companies = np.array(self.partitions[sector]['companies'], dtype=object)
+        rows = slice(None) if positions is None else np.asarray(positions, dtype=int)
+        values = {metric: np.asarray(np.asarray(self.column(sector, metric)).reshape(-1, n_years)[rows],
+                                     dtype=np.float64)
+                  for metric in (CUBE_METRICS if metrics is None else metrics)}
+        companies = companies[rows]
+        return companies, np.full(len(companies), sector, dtype=object), self.years, values
+    
+    def trends(self, companies=None):
+        """
+        Indicateurs de tendance des entreprises demandées, lues dans leurs
+        seules partitions. Sans companies, toutes les partitions sont chargées.
+        """
+        selection = {}
+        if companies is None:
+            selection = {sector: None for sector in self.sectors}
+        else:
+            for company in companies:
+                if company in self.company_index:
+                    sector, position = self.company_index[company]
+                    selection.setdefault(sector, []).append(position)
+        
+        parts = [self._partition_matrices(sector, positions) for sector, positions in selection.items()]
+        if not parts:
+            return TrendAnalytics([], [], self.years, {metric: np.empty((0, len(self.years))) for metric in CUBE_METRICS})
+        return TrendAnalytics(np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]),
+                              self.years, {metric: np.concatenate([part[3][metric] for part in parts])
+                                           for metric in CUBE_METRICS})
+    
+    def crisis_impact(self, metrics):
+        """
+        Médiane des écarts de crise de chaque indicateur, calculés partition
+        par partition: seules les colonnes d'écarts de toutes les entreprises
+        sont gardées en mémoire
+        """
+        summaries = []
+        for sector in self.sectors:
+            summary = TrendAnalytics(*self._partition_matrices(sector, metrics=metrics)).summary
+            summaries.append(summary[['Metric'] + [column for column in summary.columns
+                                                    if column.startswith(('Crisis ', 'Post/Pre '))]])
+        return TrendAnalytics.median_crisis_impact(pd.concat(summaries, ignore_index=True), metrics)
+    
+    def peers(self):
+        """
+        Index des entreprises comparables, construit une seule fois à partir
+        des seules colonnes de PEER_METRICS, lues partition par partition:
+        les coordonnées sont centrées-réduites sur toutes les entreprises,
+        comme pour AggregateCube
+        """
+        if self._peers is None:
+            parts = [self._partition_matrices(sector, metrics=list(PEER_METRICS)) for sector in self.sectors]
+            self._peers = PeerIndex(TrendAnalytics(
+                np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]),
+                self.years, {metric: np.concatenate([part[3][metric] for part in parts]) for metric in PEER_METRICS}))
+        return self._peers
+    
+    def peers_of(self, company, k=10, same_sector=False):
+        """Les k entreprises les plus comparables à une entreprise (KeyError si inconnue)"""
+        return self.peers().query(company, k, same_sector)
+    
+    def describe(self, columns, sample_size=1_000_000):
+        """
+        Statistiques descriptives calculées bloc par bloc. Les quartiles sont
+        estimés sur un échantillon régulier d'au plus sample_size valeurs.
+        """
+        total_rows = sum(partition['rows'] for partition in self.partitions.values())
+        step = max(1, total_rows // sample_size)
+        
+        stats = {}
+        for column in columns:
+            count, total, squares = 0, 0.0, 0.0
+            low, high = np.inf, -np.inf
+            samples = []
+            for sector in self.sectors:
+                values_all = self.column(sector, column)
+                for block in self._blocks(sector):
+                    values = np.asarray(values_all[block], dtype=np.float64)
+                    values = values[~np.isnan(values)]
+                    if not len(values):
+                        continue
+                    count += len(values)
+                    total += values.sum()
+                    squares += np.square(values).sum()
+                    low, high = min(low, values.min()), max(high, values.max())
+                    samples.append(values[::step])
+            
+            mean = total / count if count else np.nan
+            std = np.sqrt(max(squares - count * mean ** 2, 0) / (count - 1)) if count > 1 else np.nan
+            quartiles = np.percentile(np.concatenate(samples), [25, 50, 75]) if samples else [np.nan] * 3
+            stats[column] = [count, mean, std, low, *quartiles, high]
+        
+        return pd.DataFrame(stats, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'])
+
+# Rendu des rapports texte: chaque colonne est formatée d'un bloc (np.char),
+# puis les lignes sont assemblées par concaténation de colonnes
+REPORT_FORMATS = ('txt', 'md', 'html', 'json')
+
+# (en-tête, colonne, format printf, largeur)
+RANKING_COLUMNS = [
+    ('Rang', 'Rank', '%d', 5),
+    ('Entreprise', 'Company', '%s', 20),
+    ('Cotisations (M€)', 'Social Contributions (M€)', '%.0f', 15),
+    ('Ratio (%)', 'Social/Payroll Ratio (%)', '%.1f', 10),
+    ('Par employé (€)', 'Social per Employee (€)', '%.0f', 15),
+]
+
+COMPARATIVE_COLUMNS = [
+    ('Entreprise', 'Company', '%s', 20),
+    ('Cotisations (M€)', 'Social Contributions (M€)', '%.0f', 15),
+    ('Masse Salariale (M€)', 'Payroll (M€)', '%.0f', 18),
+    ('Effectifs', 'Employees', '%.0f', 10),
+    ('Ratio (%)', 'Social/Payroll Ratio (%)', '%.1f', 10),
+    ('Par employé (€)', 'Social per Employee (€)', '%.0f', 15),
+]
+
+COMPANY_SUMMARY_COLUMNS = [
+    ('Entreprise', 'Company', '%s', 20),
+    ('Secteur', 'Sector', '%s', 18),
+    ('Année', 'Year', '%d', 6),
+    ('Cotisations (M€)', 'Social Contributions (M€)', '%.0f', 15),
+    ('Masse Salariale (M€)', 'Payroll (M€)', '%.0f', 18),
+    ('Effectifs', 'Employees', '%.0f', 10),
+    ('Salaire moyen (€)', 'Avg Salary (€)', '%.0f', 15),
+    ('Taux (%)', 'Social Rate (%)', '%.1f', 9),
+    ('Ratio (%)', 'Social/Payroll Ratio (%)', '%.1f', 10),
+    ('Ratio secteur (%)', 'Sector Social/Payroll Ratio (%)', '%.1f', 15),
+    ('Par employé (€)', 'Social per Employee (€)', '%.0f', 15),
+    ('Par employé secteur (€)', 'Sector Social per Employee (€)', '%.0f', 20),
+    ('Maximum (M€)', 'Social Max (M€)', '%.0f', 13),
+    ('Année max', 'Social Max Year', '%d', 9),
+    ('Minimum (M€)', 'Social Min (M€)', '%.0f', 13),
+    ('Année min', 'Social Min Year', '%d', 9),
+    ('Moyenne (M€)', 'Social Mean (M€)', '%.0f', 13),
+    ('TCAM (%)', 'Social CAGR (%)', '%.1f', 9),
+    ('Croissance (%)', 'Social Last YoY (%)', '%.1f', 14),
+]
+
+def format_column(values, spec, width=None):
+    """Formate une colonne entière avec un format printf, éventuellement alignée à gauche"""
+    values = np.asarray(values)
+    if spec == '%s':
+        values = values.astype(str)
+    elif spec == '%d':
+        values = values.astype(np.int64)
+    return np.char.mod(f'%-{width}{spec[1:]}' if width else spec, values)
+
+def format_lines(frame, template):
+    """
+    Construit une ligne de texte par ligne de frame à partir d'un gabarit
+    mêlant texte littéral et couples (colonne, format printf)
+    """
+    lines = np.full(len(frame), '', dtype=object)
+    for part in template:
+        if isinstance(part, str):
+            lines = lines + part
+        else:
+            column, spec = part
+            lines = lines + format_column(frame[column], spec).astype(object)
+    return lines
+
+def _escape_html(values):
+    values = np.asarray(values).astype(str)
+    if not values.size:
+        return values
+    for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;')):
+        values = np.char.replace(values, char, entity)
+    return values
+
+def render_table(frame, columns, fmt='txt'):
+    """Rend un tableau (spécification de colonnes) au format txt, md, html ou json"""
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Format de rapport inconnu: {fmt} (attendu: {', '.join(REPORT_FORMATS)})")
+    headers = [header for header, _, _, _ in columns]
+    
+    if fmt == 'json':
+        data = frame[[column for _, column, _, _ in columns]].copy()
+        data.columns = headers
+        for header in headers:
+            if isinstance(data[header].dtype, pd.CategoricalDtype):
+                data[header] = data[header].astype(str)
+        return data.to_json(orient='records', force_ascii=False)
+    
+    if fmt == 'txt':
+        header_line = ' '.join(f"{header:<{width}}" for header, _, _, width in columns)
+        cells = [format_column(frame[column], spec, width).astype(object) for _, column, spec, width in columns]
+        separator, prefix, suffix = ' ', '', ''
+        head = [header_line, '-' * len(header_line)]
+        tail = []
+    elif fmt == 'md':
+        cells = [format_column(frame[column], spec).astype(object) for _, column, spec, _ in columns]
+        separator, prefix, suffix = ' | ', '| ', ' |'
+        head = ['| ' + ' | '.join(headers) + ' |', '|' + '---|' * len(columns)]
+        tail = []
+    else:
+        cells = [_escape_html(format_column(frame[column], spec)).astype(object) for _, column, spec, _ in columns]
+        separator, prefix, suffix = '</td><td>', '<tr><td>', '</td></tr>'
+        head = ['<table>', '<thead><tr>' + ''.join(f'<th>{header}</th>' for header in headers) + '</tr></thead>',
+                '<tbody>']
+        tail = ['</tbody>', '</table>']
+    
+    lines = np.full(len(frame), prefix, dtype=object)
+    for i, column in enumerate(cells):
+        lines = lines + (column if i == 0 else separator + column)
+    lines = lines + suffix
+    if fmt == 'txt':
+        lines = np.char.rstrip(lines.astype(str)).astype(object)
+    return '\n'.join(head + lines.tolist() + tail)
+
+def render_report(sections, fmt='txt'):
+    """Assemble des sections (titre, DataFrame, colonnes) en un seul document"""
+    if fmt == 'json':
+        return '{' + ', '.join(f'{json.dumps(title, ensure_ascii=False)}: {render_table(frame, columns, fmt)}'
+                               for title, frame, columns in sections) + '}\n'
+    
+    parts = []
+    for title, frame, columns in sections:
+        if fmt == 'txt':
+            parts.append(f"{title}\n{'=' * len(title)}")
+        elif fmt == 'md':
+            parts.append(f"## {title}")
+        else:
+            parts.append(f"<h2>{_escape_html([title])[0]}</h2>")
+        parts.append(render_table(frame, columns, fmt))
+    document = '\n\n'.join(parts) + '\n'
+    if fmt == 'html':
+        document = ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Rapport URSSAF</title></head><body>\n'
+                    + document + '</body></html>\n')
+    return document
+
+def company_summary(cube, companies):
+    """
+    Une ligne par entreprise: dernière année, moyennes du secteur pour cette
+    année et tendance des cotisations (TrendAnalytics du cube, calculée pour
+    toutes les entreprises à la fois)
+    """
+    rows = cube.companies_rows(companies)
+    rows = rows.assign(Company=rows['Company'].astype(str), Sector=rows['Sector'].astype(str)).reset_index(drop=True)
+    
+    # Ordre des entreprises demandé, quel que soit l'ordre de stockage des lignes
+    order = pd.Index([str(company) for company in companies], name='Company').intersection(rows['Company'].unique(), sort=False)
+    latest = rows.sort_values('Year', kind='stable').drop_duplicates('Company', keep='last').set_index('Company')
+    latest = latest.reindex(order)
+    sector_means = cube.mean.copy()
+    sector_means.index = pd.MultiIndex.from_arrays([sector_means.index.get_level_values(0).astype(str),
+                                                    sector_means.index.get_level_values(1).astype(int)])
+    means = sector_means.reindex(pd.MultiIndex.from_arrays([latest['Sector'], latest['Year'].astype(int)]))
+    trend = cube.trends(order).companies_summary(order)
+    
+    summary = latest.assign(**{
+        'Sector Social/Payroll Ratio (%)': means['Social/Payroll Ratio (%)'].to_numpy(),
+        'Sector Social per Employee (€)': means['Social per Employee (€)'].to_numpy(),
+        'Social Max (M€)': trend['Max'].to_numpy(),
+        'Social Max Year': trend['Max Year'].to_numpy(),
+        'Social Min (M€)': trend['Min'].to_numpy(),
+        'Social Min Year': trend['Min Year'].to_numpy(),
+        'Social Mean (M€)': trend['Mean'].to_numpy(),
+        'Social CAGR (%)': trend['CAGR (%)'].to_numpy(),
+        'Social Last YoY (%)': trend['Last YoY (%)'].to_numpy(),
+    })
+    return summary.reset_index()
+
+def plot_global_analysis(df, cube=None):
+    """Dessine la figure d'analyse globale des cotisations sociales"""
+    import matplotlib.pyplot as plt
+    cube = cube if cube is not None else AggregateCube(df)
+    plt.style.use('seaborn-v0_8')
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(18, 14))
+    
+    # 1. Cotisations sociales moyennes par secteur au fil du temps
+    sector_social = cube.mean['Social Contributions (M€)']
+    
+    for sector in cube.sectors:
+        sector_data = sector_social.loc[sector]
+        ax1.plot(sector_data.index, sector_data.values, 
+                label=sector, linewidth=2)
+    
+    ax1.set_title('Cotisations Sociales Moyennes par Secteur (2002-2025)', fontsize=12, fontweight='bold')
+    ax1.set_ylabel('Cotisations Sociales (M€)')
+    ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    ax1.grid(True, alpha=0.3)
+    
+    # 2. Ratio Cotisations/Masse Salariale par secteur (boxplot)
+    sector_data = [cube.sector_values(sector, 'Social/Payroll Ratio (%)') 
+                  for sector in cube.sectors]
+    ax2.boxplot(sector_data, labels=cube.sectors)
+    ax2.set_title('Ratio Cotisations/Masse Salariale par Secteur', fontsize=12, fontweight='bold')
+    ax2.set_ylabel('Cotisations/Masse Salariale (%)')
+    ax2.tick_params(axis='x', rotation=45)
+    ax2.grid(True, alpha=0.3)
+    
+    # 3. Entreprises avec les cotisations les plus élevées (2024)
+    latest_year = cube.latest_year
+    top_social = cube.nlargest(10, 'Social Contributions (M€)', latest_year)
+    
+    bars = ax3.barh(top_social['Company'], top_social['Social Contributions (M€)'])
+    ax3.set_title(f'Top 10 des Entreprises avec les Cotisations les plus Élevées ({latest_year})', 
+                 fontsize=12, fontweight='bold')
+    ax3.set_xlabel('Cotisations Sociales (M€)')
+    
+    # Ajouter les valeurs sur les barres
+    for bar in bars:
+        width = bar.get_width()
+        ax3.text(width + 10, bar.get_y() + bar.get_height()/2, 
+                f'{width:.0f} M€', ha='left', va='center')
+    
+    # 4. Évolution du taux de cotisations sociales
+    social_rate_evolution = cube.year_mean('Social Rate (%)')
+    ax4.plot(social_rate_evolution.index, social_rate_evolution.values, 
+            linewidth=2, color='red')
+    ax4.set_title('Évolution du Taux de Cotisations Sociales en France', 
+                 fontsize=12, fontweight='bold')
+    ax4.set_ylabel('Taux de Cotisations (%)')
+    ax4.grid(True, alpha=0.3)
+    
+    plt.tight_layout()
+    return fig
+
+def _plot_band(ax, bands, column, color, label):
+    """Bande p5-p95 et médiane Monte Carlo d'un indicateur"""
+    low, high = (f'{column} p{q}' for q in (5, 95))
+    if low not in bands or high not in bands:
+        return
+    ax.fill_between(bands.index, bands[low], bands[high], color=color, alpha=0.15, label=f'{label} (p5-p95)')
+    if f'{column} p50' in bands:
+        ax.plot(bands.index, bands[f'{column} p50'], color=color, linewidth=1, linestyle=':')
+
+def plot_company_report(company_data, company_name, bands=None):
+    """
+    Dessine la figure du rapport spécifique d'une entreprise, avec les bandes
+    Monte Carlo (voir URSSAFAnalysis.monte_carlo_bands) si elles sont fournies
+    """
+    import matplotlib.pyplot as plt
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 12))
+    
+    # 1. Cotisations sociales et masse salariale
+    ax1.plot(company_data['Year'], company_data['Social Contributions (M€)'], 
+            label='Cotisations Sociales', linewidth=2, color='blue')
+    ax1_twin = ax1.twinx()
+    ax1_twin.plot(company_data['Year'], company_data['Payroll (M€)'], 
+                 label='Masse Salariale', linewidth=2, color='green', linestyle='--')
+    if bands is not None:
+        _plot_band(ax1, bands, 'Social Contributions (M€)', 'blue', 'Cotisations Sociales')
+        _plot_band(ax1_twin, bands, 'Payroll (M€)', 'green', 'Masse Salariale')
+    ax1.set_title(f'Évolution des Cotisations et de la Masse Salariale ({company_name})', fontsize=12, fontweight='bold')
+    ax1.set_ylabel('Cotisations Sociales (M€)', color='blue')
+    ax1_twin.set_ylabel('Masse Salariale (M€)', color='green')
+    ax1.legend(loc='upper left')
+    ax1_twin.legend(loc='upper right')
+    ax1.grid(True, alpha=0.3)
+    
+    # 2. Ratio Cotisations/Masse Salariale
+    ax2.plot(company_data['Year'], company_data['Social/Payroll Ratio (%)'], 
+            label='Ratio Cotisations/Masse Salariale', linewidth=2, color='red')
+    ax2.plot(company_data['Year'], company_data['Social Rate (%)'], 
+            label='Taux Officiel', linewidth=2, color='purple', linestyle='--')
+    ax2.set_title(f'Ratios de Cotisations ({company_name})', fontsize=12, fontweight='bold')
+    ax2.set_ylabel('Ratio (%)')
+    ax2.legend()
+    ax2.grid(True, alpha=0.3)
+    
+    # 3. Effectifs et salaire moyen
+    ax3.plot(company_data['Year'], company_data['Employees'], 
+            label='Effectifs', linewidth=2, color='orange')
+    if bands is not None:
+        _plot_band(ax3, bands, 'Employees', 'orange', 'Effectifs')
+    ax3_twin = ax3.twinx()
+    ax3_twin.plot(company_data['Year'], company_data['Avg Salary (€)'], 
+                 label='Salaire Moyen', linewidth=2, color='brown')
+    ax3.set_title(f'Effectifs et Salaire Moyen ({company_name})', fontsize=12, fontweight='bold')
+    ax3.set_ylabel('Effectifs', color='orange')
+    ax3_twin.set_ylabel('Salaire Moyen (€)', color='brown')
+    ax3.legend(loc='upper left')
+    ax3_twin.legend(loc='upper right')
+    ax3.grid(True, alpha=0.3)
+    
+    # 4. Cotisations par employé
+    ax4.plot(company_data['Year'], company_data['Social per Employee (€)'], 
+            label='Cotisations par Employé', linewidth=2, color='darkblue')
+    ax4.set_title(f'Cotisations par Employé ({company_name})', fontsize=12, fontweight='bold')
+    ax4.set_ylabel('Cotisations (€)')
+    ax4.grid(True, alpha=0.3)
+    
+    plt.tight_layout()
+    return fig
+
+def plot_comparative_analysis(comparative_data, company_list):
+    """Dessine la figure d'analyse comparative entre plusieurs entreprises"""
+    import matplotlib.pyplot as plt
+    fig, axes = plt.subplots(2, 3, figsize=(18, 12))
+    axes = axes.flatten()
+    
+    indicators = ['Social Contributions (M€)', 'Payroll (M€)', 'Employees', 
+                 'Social/Payroll Ratio (%)', 'Avg Salary (€)', 'Social per Employee (€)']
+    titles = ['Cotisations Sociales (M€)', 'Masse Salariale (M€)', 'Effectifs', 
+             'Ratio Cotisations/Masse Salariale (%)', 'Salaire Moyen (€)', 'Cotisations par Employé (€)']
+    
+    colors = plt.cm.Set3(np.linspace(0, 1, len(company_list)))
+    
+    # Un seul découpage par entreprise, réutilisé pour tous les indicateurs
+    company_frames = [comparative_data[comparative_data['Company'] == company] for company in company_list]
+    
+    for i, (indicator, title) in enumerate(zip(indicators, titles)):
+        ax = axes[i]
+        for j, (company, company_yearly) in enumerate(zip(company_list, company_frames)):
+            ax.plot(company_yearly['Year'], company_yearly[indicator], 
+                   label=company, color=colors[j], linewidth=2)
+        
+        ax.set_title(title, fontsize=11, fontweight='bold')
+        ax.grid(True, alpha=0.3)
+        
+        if i == 0:
+            ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+    
+    plt.tight_layout()
+    return fig
+
+# Profils de sortie des figures: aperçu PNG rapide, vectoriel SVG, impression
+OUTPUT_PROFILES = {
+    'preview': {'format': 'png', 'dpi': 72, 'bbox_inches': None},
+    'svg': {'format': 'svg', 'dpi': 72, 'bbox_inches': 'tight'},
+    'print': {'format': 'png', 'dpi': 300, 'bbox_inches': 'tight'},
+}
+
+def savefig_options(profile='print', dpi=None):
+    """Arguments de savefig d'un profil de sortie (dpi éventuellement imposé)"""
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Profil de sortie inconnu: {profile} (attendu: {', '.join(OUTPUT_PROFILES)})")
+    options = dict(OUTPUT_PROFILES[profile])
+    if dpi is not None:
+        options['dpi'] = dpi
+    return options
+
+def profile_path(path, profile='print'):
+    """Chemin de sortie avec l'extension du format du profil"""
+    return os.path.splitext(path)[0] + '.' + savefig_options(profile)['format']
+
+class CompanyReportFigure:
+    """
+    Figure du rapport par entreprise construite une seule fois, puis mise à
+    jour en place (données des courbes, titres, bandes) pour chaque
+    entreprise. Évite de recréer la grille d'axes et la mise en page à chaque
+    rapport; close() libère la figure.
+    
+    La mise en page n'est recalculée que lorsque l'ordre de grandeur des
+    valeurs d'un axe change (largeur des graduations, facteur 1eN).
+    """
+    def __init__(self, company_data, company_name):
+        self.fig = plot_company_report(company_data, company_name)
+        ax1, ax2, ax3, ax4, ax1_twin, ax3_twin = self.fig.axes
+        self.axes = (ax1, ax2, ax3, ax4, ax1_twin, ax3_twin)
+        self.legend_axes = ((ax1, 'upper left'), (ax1_twin, 'upper right'), (ax3, 'upper left'))
+        # (courbe, colonne) mises à jour à chaque rapport
+        self.lines = [
+            (ax1.lines[0], 'Social Contributions (M€)'),
+            (ax1_twin.lines[0], 'Payroll (M€)'),
+            (ax2.lines[0], 'Social/Payroll Ratio (%)'),
+            (ax2.lines[1], 'Social Rate (%)'),
+            (ax3.lines[0], 'Employees'),
+            (ax3_twin.lines[0], 'Avg Salary (€)'),
+            (ax4.lines[0], 'Social per Employee (€)'),
+        ]
+        self.titles = [
+            (ax1, 'Évolution des Cotisations et de la Masse Salariale ({})'),
+            (ax2, 'Ratios de Cotisations ({})'),
+            (ax3, 'Effectifs et Salaire Moyen ({})'),
+            (ax4, 'Cotisations par Employé ({})'),
+        ]
+        self.band_artists = []
+        self.layout_key = self._magnitudes()
+    
+    def _magnitudes(self):
+        """Ordre de grandeur des valeurs de chaque axe"""
+        key = []
+        for ax in self.axes:
+            values = [np.abs(np.asarray(line.get_ydata(), dtype=np.float64)) for line in ax.lines]
+            values = np.concatenate(values) if values else np.empty(0)
+            values = values[np.isfinite(values) & (values > 0)]
+            key.append(int(np.floor(np.log10(values.max()))) if len(values) else None)
+        return tuple(key)
+    
+    def update(self, company_data, company_name, bands=None):
+        """Remplace les données de la figure par celles d'une entreprise"""
+        years = company_data['Year'].to_numpy()
+        for line, column in self.lines:
+            line.set_data(years, company_data[column].to_numpy())
+        for ax, title in self.titles:
+            ax.title.set_text(title.format(company_name))
+        
+        had_bands = bool(self.band_artists)
+        for artist in self.band_artists:
+            artist.remove()
+        self.band_artists = []
+        if bands is not None:
+            ax1, _, ax3, _, ax1_twin, _ = self.axes
+            for ax, column, color, label in ((ax1, 'Social Contributions (M€)', 'blue', 'Cotisations Sociales'),
+                                             (ax1_twin, 'Payroll (M€)', 'green', 'Masse Salariale'),
+                                             (ax3, 'Employees', 'orange', 'Effectifs')):
+                before = set(ax.collections) | set(ax.lines)
+                _plot_band(ax, bands, column, color, label)
+                self.band_artists.extend(artist for artist in list(ax.collections) + list(ax.lines)
+                                         if artist not in before)
+        # Les légendes ne changent qu'avec la présence des bandes
+        if had_bands or self.band_artists:
+            for ax, loc in self.legend_axes:
+                ax.legend(loc=loc)
+        
+        # relim() ignore les surfaces: leurs sommets sont ajoutés à la main
+        for ax in self.axes:
+            ax.relim()
+            for artist in self.band_artists:
+                if artist.axes is ax and artist in ax.collections:
+                    for path in artist.get_paths():
+                        ax.update_datalim(path.vertices)
+            ax.autoscale_view()
+        
+        layout_key = self._magnitudes()
+        if layout_key != self.layout_key:
+            self.fig.tight_layout()
+            self.layout_key = layout_key
+        return self.fig
+    
+    def save(self, path, profile='print', dpi=None):
+        self.fig.savefig(path, **savefig_options(profile, dpi))
+    
+    def close(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+# Figure par entreprise réutilisée par un processus de rendu
+_worker_company_figure = None
+
+def _init_render_worker():
+    """Initialise un processus de rendu: backend Agg, aucune fenêtre"""
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+def _render_figure_job(job):
+    """Dessine et enregistre une figure dans un processus de rendu"""
+    import matplotlib.pyplot as plt
+    global _worker_company_figure
+    start = time.perf_counter()
+    options = savefig_options(job.get('profile', 'print'), job.get('dpi'))
+    if job['kind'] == 'company':
+        if _worker_company_figure is None:
+            _worker_company_figure = CompanyReportFigure(job['data'], job['name'])
+        _worker_company_figure.update(job['data'], job['name'], job.get('bands'))
+        _worker_company_figure.fig.savefig(job['path'], **options)
+    else:
+        if job['kind'] == 'global':
+            fig = plot_global_analysis(job['data'], job.get('cube'))
+        else:
+            fig = plot_comparative_analysis(job['data'], job['name'])
+        fig.savefig(job['path'], **options)
+        plt.close(fig)
+    
+    return {
+        'kind': job['kind'],
+        'name': job['name'],
+        'path': job['path'],
+        'bytes': os.path.getsize(job['path']),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+def _init_shard_worker():
+    # Sans graine, chaque processus (éventuellement issu d'un fork) doit avoir
+    # son propre état np.random
+    np.random.seed()
+
+def _generate_shard(job):
+    """Génère (ou collecte) un lot d'entreprises et ses indicateurs dans un processus de calcul"""
+    analyzer = URSSAFAnalysis(seed=job['seed'], years=job['years'], headless=True, data_dir=job['data_dir'])
+    analyzer.companies = job['companies']
+    analyzer.social_rates = job['social_rates']
+    names = list(job['companies'])
+    if job['request_delay']:
+        batch = analyzer._collect_companies_series(names, job['request_delay'])
+    else:
+        batch = analyzer.simulate_companies_batch(names)
+    # Matrices NumPy seulement: peu coûteuses à transmettre au processus principal
+    return derive_company_metrics(batch)
+
+class URSSAFAnalysis:
+    def __init__(self, seed=None, cache=None, headless=False, years=None, profiler=None, data_dir=DATA_DIR,
+                 output_profile='print', output_dir='.'):
+        # Graine des simulations: None utilise l'état global de np.random,
+        # un entier rend les séries reproductibles entreprise par entreprise
+        self.seed = seed
+        # Années couvertes (2002-2025 par défaut)
+        self.years = YEARS.copy() if years is None else np.asarray(years)
+        # Cache disque optionnel (DatasetCache), utilisé seulement avec une graine
+        self.cache = cache
+        # Mode sans affichage: les figures sont enregistrées puis fermées, sans plt.show()
+        self.headless = headless
+        # Instrumentation optionnelle des étapes (StageProfiler)
+        self.profiler = profiler
+        # Profil de sortie des figures ('preview', 'svg' ou 'print', voir OUTPUT_PROFILES)
+        self.output_profile = output_profile
+        # Répertoire des figures enregistrées par les rapports
+        self.output_dir = output_dir
+        # Figure par entreprise réutilisée d'un rapport à l'autre en mode sans affichage
+        self._company_figure = None
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        # Registre, taux et historiques chargés une seule fois par processus
+        self.data_dir = data_dir
+        self.reference = load_reference_data(data_dir)
+        self.companies = self.reference.registry()
+        self.social_rates = self.reference.social_rates()
     
     def get_company_social_data(self, company):
         """
         Récupère les données de cotisations sociales pour une entreprise donnée
         """
         try:
-            # Données historiques approximatives de cotisations sociales (en millions d'euros)
-            social_history = {
-                'LVMH': {
-                    '2002': 450, '2003': 480, '2004': 520, '2005': 580,
-                    '2006': 620, '2007': 680, '2008': 720, '2009': 700,
-                    '2010': 780, '2011': 850, '2012': 920, '2013': 980,
-                    '2014': 1050, '2015': 1150, '2016': 1250, '2017': 1350,
-                    '2018': 1450, '2019': 1550, '2020': 1500, '2021': 1650,
-                    '2022': 1800, '2023': 1950, '2024': 2100, '2025': 2250
-                },
-                'TotalEnergies': {
-                    '2002': 1200, '2003': 1300, '2004': 1400, '2005': 1500,
-                    '2006': 1600, '2007': 1700, '2008': 1800, '2009': 1750,
-                    '2010': 1900, '2011': 2100, '2012': 2300, '2013': 2400,
-                    '2014': 2500, '2015': 2600, '2016': 2700, '2017': 2800,
-                    '2018': 2900, '2019': 3000, '2020': 2900, '2021': 3100,
-                    '2022': 3300, '2023': 3500, '2024': 3700, '2025': 3900
-                },
-                'L\'Oréal': {
-                    '2002': 280, '2003': 300, '2004': 320, '2005': 350,
-                    '2006': 380, '2007': 410, '2008': 440, '2009': 430,
-                    '2010': 480, '2011': 520, '2012': 560, '2013': 600,
-                    '2014': 650, '2015': 700, '2016': 750, '2017': 800,
-                    '2018': 850, '2019': 900, '2020': 880, '2021': 950,
-                    '2022': 1020, '2023': 1100, '2024': 1180, '2025': 1260
-                },
-                # Ajouter des données pour les autres entreprises...
-            }
-            
+            history = self.reference.history_series('social', company)
+            if history is not None:
+                return history
+
             # Si nous n'avons pas de données spécifiques, utilisons un modèle par défaut
-            if company not in social_history:
-                # Modèle basé sur le secteur et la masse salariale
-                sector = self.companies[company]['sector']
-                payroll = self.companies[company]['payroll']
-                
-                # Base de cotisations selon le secteur
-                if sector == 'Banque':
-                    base_social = payroll * 0.55  # 55% de la masse salariale
-                elif sector == 'Énergie':
-                    base_social = payroll * 0.50  # 50% de la masse salariale
-                elif sector == 'Luxe':
-                    base_social = payroll * 0.48  # 48% de la masse salariale
-                elif sector == 'Automobile':
-                    base_social = payroll * 0.52  # 52% de la masse salariale
-                else:
-                    base_social = payroll * 0.50  # 50% de la masse salariale
-                
-                # Créer des données simulées
-                social_history[company] = {}
-                for year in range(2002, 2026):
-                    year_str = str(year)
-                    # Croissance annuelle avec variations aléatoires
-                    growth = np.random.normal(0.04, 0.02)  # Croissance moyenne de 4%
-                    # Impact des crises économiques
-                    if year == 2008 or year == 2009:  # Crise financière
-                        growth -= 0.10
-                    if year == 2020:  # COVID-19
-                        growth -= 0.08
-                    
-                    social_value = base_social * (1 + growth) ** (year - 2002)
-                    social_history[company][year_str] = max(10, social_value + np.random.normal(0, social_value * 0.1))
-            
-            return social_history[company]
+            # basé sur le secteur et la masse salariale
+            return self._create_simulated_social_data(company)
             
         except Exception as e:
             print(f"❌ Erreur données sociales pour {company}: {e}")
@@ -130,62 +2376,12 @@ class URSSAFAnalysis:
         Récupère les données de masse salariale pour une entreprise donnée
         """
         try:
-            # Données historiques approximatives de masse salariale (en millions d'euros)
-            payroll_history = {
-                'LVMH': {
-                    '2002': 850, '2003': 900, '2004': 950, '2005': 1000,
-                    '2006': 1100, '2007': 1200, '2008': 1300, '2009': 1250,
-                    '2010': 1400, '2011': 1550, '2012': 1700, '2013': 1850,
-                    '2014': 2000, '2015': 2200, '2016': 2400, '2017': 2600,
-                    '2018': 2800, '2019': 3000, '2020': 2900, '2021': 3200,
-                    '2022': 3500, '2023': 3800, '2024': 4100, '2025': 4400
-                },
-                'TotalEnergies': {
-                    '2002': 2200, '2003': 2300, '2004': 2400, '2005': 2500,
-                    '2006': 2600, '2007': 2700, '2008': 2800, '2009': 2700,
-                    '2010': 2900, '2011': 3100, '2012': 3300, '2013': 3500,
-                    '2014': 3700, '2015': 3900, '2016': 4100, '2017': 4300,
-                    '2018': 4500, '2019': 4700, '2020': 4600, '2021': 4900,
-                    '2022': 5200, '2023': 5500, '2024': 5800, '2025': 6100
-                },
-                # Ajouter des données pour les autres entreprises...
-            }
-            
-            if company not in payroll_history:
-                # Modèle basé sur les effectifs et salaires moyens par secteur
-                employees = self.companies[company]['employees']
-                sector = self.companies[company]['sector']
-                
-                # Salaire moyen annuel par secteur (en milliers d'euros)
-                if sector == 'Banque':
-                    avg_salary = 55
-                elif sector == 'Luxe':
-                    avg_salary = 50
-                elif sector == 'Énergie':
-                    avg_salary = 60
-                elif sector == 'Automobile':
-                    avg_salary = 45
-                else:
-                    avg_salary = 48
-                
-                base_payroll = employees * avg_salary * 1000  # Convertir en euros
-                
-                # Créer des données simulées
-                payroll_history[company] = {}
-                for year in range(2002, 2026):
-                    year_str = str(year)
-                    # Croissance annuelle avec variations aléatoires
-                    growth = np.random.normal(0.03, 0.02)  # Croissance moyenne de 3%
-                    # Impact des crises économiques
-                    if year == 2008 or year == 2009:  # Crise financière
-                        growth -= 0.08
-                    if year == 2020:  # COVID-19
-                        growth -= 0.06
-                    
-                    payroll_value = base_payroll * (1 + growth) ** (year - 2002)
-                    payroll_history[company][year_str] = max(100, payroll_value + np.random.normal(0, payroll_value * 0.1))
+            history = self.reference.history_series('payroll', company)
+            if history is not None:
+                return history
             
-            return payroll_history[company]
+            # Modèle basé sur les effectifs et salaires moyens par secteur
+            return self._create_simulated_payroll_data(company)
             
         except Exception as e:
             print(f"❌ Erreur données masse salariale pour {company}: {e}")
@@ -196,51 +2392,12 @@ class URSSAFAnalysis:
         Récupère les données d'effectifs pour une entreprise donnée
         """
         try:
-            # Données historiques approximatives d'effectifs
-            employees_history = {
-                'LVMH': {
-                    '2002': 45000, '2003': 47000, '2004': 50000, '2005': 53000,
-                    '2006': 56000, '2007': 60000, '2008': 64000, '2009': 65000,
-                    '2010': 70000, '2011': 75000, '2012': 80000, '2013': 85000,
-                    '2014': 90000, '2015': 100000, '2016': 110000, '2017': 120000,
-                    '2018': 130000, '2019': 140000, '2020': 138000, '2021': 145000,
-                    '2022': 148000, '2023': 150000, '2024': 152000, '2025': 155000
-                },
-                'TotalEnergies': {
-                    '2002': 110000, '2003': 105000, '2004': 100000, '2005': 98000,
-                    '2006': 96000, '2007': 95000, '2008': 97000, '2009': 96000,
-                    '2010': 95000, '2011': 96000, '2012': 97000, '2013': 98000,
-                    '2014': 99000, '2015': 100000, '2016': 101000, '2017': 102000,
-                    '2018': 103000, '2019': 104000, '2020': 102000, '2021': 103000,
-                    '2022': 104000, '2023': 105000, '2024': 106000, '2025': 107000
-                },
-                # Ajouter des données pour les autres entreprises...
-            }
-            
-            if company not in employees_history:
-                # Base sur les effectifs actuels avec croissance historique
-                base_employees = self.companies[company]['employees']
-                
-                # Créer des données simulées
-                employees_history[company] = {}
-                for year in range(2002, 2026):
-                    year_str = str(year)
-                    # Croissance ou décroissance annuelle
-                    if year < 2010:
-                        growth = np.random.normal(0.02, 0.01)  # Croissance de 2%
-                    else:
-                        growth = np.random.normal(0.01, 0.005)  # Croissance de 1%
-                    
-                    # Impact des crises économiques
-                    if year == 2008 or year == 2009:  # Crise financière
-                        growth -= 0.03
-                    if year == 2020:  # COVID-19
-                        growth -= 0.02
-                    
-                    employees_value = base_employees * (1 + growth) ** (2002 - year)  # Inverse car on part de maintenant
-                    employees_history[company][year_str] = max(100, employees_value + np.random.normal(0, employees_value * 0.05))
+            history = self.reference.history_series('employees', company)
+            if history is not None:
+                return history
             
-            return employees_history[company]
+            # Base sur les effectifs actuels avec croissance historique
+            return self._create_simulated_employees_data(company)
             
         except Exception as e:
             print(f"❌ Erreur données effectifs pour {company}: {e}")
@@ -248,215 +2405,681 @@ class URSSAFAnalysis:
     
     def _create_simulated_social_data(self, company):
         """Crée des données simulées de cotisations sociales pour une entreprise"""
-        sector = self.companies[company]['sector']
-        payroll = self.companies[company]['payroll']
-        
-        # Base de cotisations selon le secteur
-        if sector == 'Banque':
-            base_social = payroll * 0.55
-        elif sector == 'Énergie':
-            base_social = payroll * 0.50
-        elif sector == 'Luxe':
-            base_social = payroll * 0.48
-        elif sector == 'Automobile':
-            base_social = payroll * 0.52
-        else:
-            base_social = payroll * 0.50
-        
-        social_data = {}
-        for year in range(2002, 2026):
-            year_str = str(year)
-            # Croissance annuelle avec variations aléatoires
-            growth = np.random.normal(0.04, 0.02)
-            # Impact des crises économiques
-            if year == 2008 or year == 2009:
-                growth -= 0.10
-            if year == 2020:
-                growth -= 0.08
-            
-            social_value = base_social * (1 + growth) ** (year - 2002)
-            social_data[year_str] = max(10, social_value + np.random.normal(0, social_value * 0.1))
-        
-        return social_data
+        social_data = self._simulate_metric('social', [company])[0]
+        return dict(zip([str(year) for year in self.years], social_data))
     
     def _create_simulated_payroll_data(self, company):
         """Crée des données simulées de masse salariale pour une entreprise"""
-        employees = self.companies[company]['employees']
-        sector = self.companies[company]['sector']
-        
-        # Salaire moyen annuel par secteur (en milliers d'euros)
-        if sector == 'Banque':
-            avg_salary = 55
-        elif sector == 'Luxe':
-            avg_salary = 50
-        elif sector == 'Énergie':
-            avg_salary = 60
-        elif sector == 'Automobile':
-            avg_salary = 45
-        else:
-            avg_salary = 48
-        
-        base_payroll = employees * avg_salary * 1000
-        
-        payroll_data = {}
-        for year in range(2002, 2026):
-            year_str = str(year)
-            # Croissance annuelle avec variations aléatoires
-            growth = np.random.normal(0.03, 0.02)
-            # Impact des crises économiques
-            if year == 2008 or year == 2009:
-                growth -= 0.08
-            if year == 2020:
-                growth -= 0.06
-            
-            payroll_value = base_payroll * (1 + growth) ** (year - 2002)
-            payroll_data[year_str] = max(100, payroll_value + np.random.normal(0, payroll_value * 0.1))
-        
-        return payroll_data
+        payroll_data = self._simulate_metric('payroll', [company])[0]
+        return dict(zip([str(year) for year in self.years], payroll_data))
     
     def _create_simulated_employees_data(self, company):
         """Crée des données simulées d'effectifs pour une entreprise"""
-        base_employees = self.companies[company]['employees']
-        
-        employees_data = {}
-        for year in range(2002, 2026):
-            year_str = str(year)
-            # Croissance ou décroissance annuelle
-            if year < 2010:
-                growth = np.random.normal(0.02, 0.01)
-            else:
-                growth = np.random.normal(0.01, 0.005)
+        employees_data = self._simulate_metric('employees', [company])[0]
+        return dict(zip([str(year) for year in self.years], employees_data))
+    
+    def _simulate_metric(self, metric, companies, years=None):
+        """
+        Simule une métrique ('social', 'payroll' ou 'employees') pour une liste
+        d'entreprises et renvoie une matrice (entreprises × années)
+        """
+        years = self.years if years is None else np.asarray(years)
+        z_growth, z_noise = self._draw_normals(metric, companies, years)
+        base = self._metric_bases(metric, companies)
+        return METRIC_SIMULATORS[metric](base, z_growth, z_noise, years)
+    
+    def _metric_bases(self, metric, companies):
+        """Valeur de départ des simulations d'une métrique pour chaque entreprise"""
+        if metric == 'social':
+            # Base de cotisations selon le secteur
+            return np.array([
+                self.companies[c]['payroll'] * SECTOR_SOCIAL_RATIOS.get(self.companies[c]['sector'], DEFAULT_SOCIAL_RATIO)
+                for c in companies
+            ], dtype=np.float64)
+        
+        if metric == 'payroll':
+            # Salaire moyen annuel par secteur (en milliers d'euros)
+            return np.array([
+                self.companies[c]['employees'] * SECTOR_AVG_SALARIES.get(self.companies[c]['sector'], DEFAULT_AVG_SALARY) * 1000
+                for c in companies
+            ], dtype=np.float64)
+        
+        if metric == 'employees':
+            return np.array([self.companies[c]['employees'] for c in companies], dtype=np.float64)
+        
+        raise ValueError(f"Métrique inconnue: {metric}")
+    
+    def _company_keys(self, metric, companies):
+        """
+        Clés Philox (deux mots de 64 bits) propres à chaque couple (entreprise,
+        métrique), dérivées de la graine: elles ne dépendent ni de l'ordre des
+        entreprises ni du découpage du travail entre processus
+        """
+        prefix = f"{self.seed}\x00{metric}\x00".encode('utf-8')
+        digests = b''.join(hashlib.blake2b(prefix + company.encode('utf-8'), digest_size=16).digest()
+                           for company in companies)
+        return np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+    
+    def _draw_normals(self, metric, companies, years):
+        """Tire les aléas (croissance, bruit) d'une métrique pour chaque entreprise"""
+        shape = (len(companies), len(years))
+        if self.seed is None:
+            return np.random.standard_normal(shape), np.random.standard_normal(shape)
+        
+        # Un flux Philox par couple (entreprise, métrique), identique à
+        # Generator(Philox(key=clé)): seule la clé de l'état est changée d'un
+        # flux à l'autre, sans recréer de générateur
+        bit_generator = np.random.Philox(key=0)
+        generator = np.random.Generator(bit_generator)
+        state = bit_generator.state
+        
+        # Tirages rangés année par année depuis BASE_YEAR: les aléas d'une année
+        # ne changent pas quand la période est étendue ou restreinte
+        offsets = np.asarray(years) - BASE_YEAR
+        draws = np.empty((len(companies), offsets.max() + 1, 2))
+        for i, key in enumerate(self._company_keys(metric, companies)):
+            state['state']['key'] = key
+            bit_generator.state = state
+            generator.standard_normal(draws.shape[1:], out=draws[i])
+        draws = draws[:, offsets]
+        return draws[:, :, 0], draws[:, :, 1]
+    
+    def simulate_companies_batch(self, companies=None, use_history=True, years=None):
+        """
+        Génère en une seule passe les séries (entreprises × années) des trois
+        métriques et les renvoie sous forme de tableaux colonnes.
+        
+        Les séries historiques connues remplacent les lignes simulées
+        correspondantes lorsque use_history est vrai.
+        """
+        names = list(self.companies) if companies is None else list(companies)
+        years = self.years if years is None else np.asarray(years)
+        
+        batch = {
+            'Company': np.array(names, dtype=object),
+            'Sector': np.array([self.companies[c]['sector'] for c in names], dtype=object),
+            'Year': years.copy(),
+            'Social Contributions (M€)': self._simulate_metric('social', names, years),
+            'Payroll (M€)': self._simulate_metric('payroll', names, years),
+            'Employees': self._simulate_metric('employees', names, years),
+        }
+        
+        if use_history:
+            for metric, column in HISTORY_METRICS.items():
+                self.reference.overlay_history(metric, names, years, batch[column])
+        
+        return batch
+    
+    def run_scenarios(self, scenarios, companies=None, keep_contributions=False):
+        """
+        Évalue un lot de scénarios de cotisations (voir ScenarioEngine) sur les
+        séries des entreprises, générées une seule fois pour tous les scénarios
+        """
+        names = list(self.companies) if companies is None else list(companies)
+        print(f"🧪 Évaluation de {len(scenarios)} scénario(s) sur {len(names)} entreprises...")
+        with self.span('scenarios', scenarios=len(scenarios), rows=len(names) * len(self.years)):
+            engine = ScenarioEngine(self.simulate_companies_batch(names), self.social_rates)
+            return engine.evaluate(scenarios, keep_contributions)
+    
+    def monte_carlo_bands(self, companies, n_paths=2000, workers=None, quantiles=(5, 50, 95), bins=256,
+                          paths_per_job=500, block_paths=100):
+        """
+        Bandes d'incertitude des cotisations, de la masse salariale et des
+        effectifs: n_paths trajectoires par entreprise, tirées en parallèle
+        avec des flux aléatoires indépendants et réduites au fil de l'eau en
+        histogrammes (entreprises × années × classes). La mémoire ne dépend
+        pas du nombre de trajectoires.
+        
+        Renvoie {entreprise: DataFrame indexé par année, colonnes
+        '<indicateur> p<q>'}; les années d'historique connu gardent leur valeur.
+        """
+        names = [company for company in companies if company in self.companies]
+        root = np.random.SeedSequence(self.seed)
+        pilot_seed, *job_seeds = root.spawn(1 + -(-n_paths // paths_per_job))
+        bases = {metric: self._metric_bases(metric, names) for metric in HISTORY_METRICS}
+        
+        print(f"🎲 Monte Carlo: {n_paths} trajectoires pour {len(names)} entreprise(s)...")
+        with self.span('monte_carlo', paths=n_paths, companies=len(names)):
+            # Bornes des histogrammes estimées sur un tirage pilote, élargies
+            pilot = np.random.Generator(np.random.PCG64(pilot_seed))
+            low, high = {}, {}
+            for metric, base in bases.items():
+                logs = np.log(simulate_paths(metric, base, pilot, 200, self.years))
+                margin = 0.5 * (logs.max(axis=0) - logs.min(axis=0)) + 1e-9
+                low[metric] = logs.min(axis=0) - margin
+                high[metric] = logs.max(axis=0) + margin
+            
+            jobs = [{'seed': seed, 'paths': min(paths_per_job, n_paths - i * paths_per_job),
+                     'block_paths': block_paths, 'bases': bases, 'years': self.years,
+                     'low': low, 'high': high, 'bins': bins}
+                    for i, seed in enumerate(job_seeds)]
             
-            # Impact des crises économiques
-            if year == 2008 or year == 2009:
-                growth -= 0.03
-            if year == 2020:
-                growth -= 0.02
+            # Réduction au fil des résultats, avec un nombre borné de lots en cours
+            counts = {metric: 0 for metric in bases}
+            def reduce(done):
+                for future in done:
+                    for metric, job_counts in future.result().items():
+                        counts[metric] = counts[metric] + job_counts
             
-            employees_value = base_employees * (1 + growth) ** (2002 - year)
-            employees_data[year_str] = max(100, employees_value + np.random.normal(0, employees_value * 0.05))
+            max_pending = 2 * (workers or os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = set()
+                for job in jobs:
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        reduce(done)
+                    pending.add(pool.submit(_monte_carlo_job, job))
+                reduce(wait(pending)[0])
+        
+        bands = {company: {} for company in names}
+        for metric, column in HISTORY_METRICS.items():
+            histograms = counts[metric].reshape(len(names), len(self.years), bins)
+            for q in quantiles:
+                values = _histogram_quantiles(histograms, low[metric], high[metric], q)
+                self.reference.overlay_history(metric, names, self.years, values)
+                for i, company in enumerate(names):
+                    bands[company][f'{column} p{q}'] = values[i]
+        
+        return {company: pd.DataFrame(data, index=pd.Index(self.years, name='Year'))
+                for company, data in bands.items()}
+    
+    def shard_companies(self, names, shard_by='sector', n_shards=4):
+        """
+        Répartit les entreprises en lots de positions dans names: par secteur
+        (les secteurs trop gros étant découpés en lots d'au plus
+        len(names) / n_shards entreprises) ou par hachage du nom
+        """
+        if shard_by == 'sector':
+            by_sector = {}
+            for position, company in enumerate(names):
+                by_sector.setdefault(self.companies[company]['sector'], []).append(position)
+            max_size = max(1, -(-len(names) // n_shards))
+            return [positions[start:start + max_size]
+                    for positions in by_sector.values()
+                    for start in range(0, len(positions), max_size)]
+        
+        if shard_by == 'hash':
+            shards = [[] for _ in range(n_shards)]
+            for position, company in enumerate(names):
+                digest = hashlib.blake2b(company.encode('utf-8'), digest_size=8).digest()
+                shards[int.from_bytes(digest, 'little') % n_shards].append(position)
+            return [positions for positions in shards if positions]
+        
+        raise ValueError(f"Découpage inconnu: {shard_by} (attendu: 'sector' ou 'hash')")
+    
+    def _generate_sharded(self, names, workers, shard_by='sector', request_delay=0):
+        """
+        Génère les lots d'entreprises dans des processus de calcul et fusionne
+        leurs matrices dans l'ordre de names, quel que soit le découpage
+        """
+        n_shards = 4 * (workers or os.cpu_count() or 1)
+        shards = self.shard_companies(names, shard_by, n_shards)
+        jobs = [{'seed': self.seed, 'years': self.years, 'data_dir': self.data_dir,
+                 'social_rates': self.social_rates, 'request_delay': request_delay,
+                 'companies': {names[position]: self.companies[names[position]] for position in positions}}
+                for positions in shards]
         
-        return employees_data
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker) as pool:
+            results = list(pool.map(_generate_shard, jobs))
+        
+        # Lignes des lots concaténées puis remises dans l'ordre de names
+        inverse = np.argsort(np.concatenate([np.asarray(positions) for positions in shards]), kind='stable')
+        metrics = {column: np.concatenate([result[column] for result in results])[inverse]
+                   for column in results[0]}
+        batch = {
+            'Company': np.array(names, dtype=object),
+            'Sector': np.array([self.companies[c]['sector'] for c in names], dtype=object),
+            'Year': self.years.copy(),
+        }
+        return batch, metrics
     
-    def get_all_companies_data(self):
+    def get_all_companies_data(self, companies=None, request_delay=0, workers=None, shard_by='sector', compact=False):
         """
         Récupère toutes les données pour toutes les entreprises
+        
+        request_delay: pause (en secondes) entre deux entreprises, uniquement
+        utile pour limiter le débit d'une source distante interrogée entreprise
+        par entreprise. Sans délai, les séries sont générées en bloc.
+        
+        workers: si renseigné, les entreprises sont réparties en lots
+        (shard_by: 'sector' ou 'hash') traités par autant de processus. Avec
+        une graine, le résultat est identique à celui d'une exécution en série;
+        sans graine, chaque processus tire ses propres aléas.
+        
+        compact: renvoie la disposition compacte (voir compact_frame), les
+        indicateurs calculés étant recalculés à la demande.
         """
         print("🚀 Début de la récupération des données URSSAF des entreprises françaises...\n")
         
-        all_data = []
+        names = list(self.companies) if companies is None else list(companies)
+        
+        # Sans graine les séries sont aléatoires à chaque appel: rien à mettre en cache
+        cache_key = None
+        if self.cache is not None and self.seed is not None and not request_delay:
+            cache_key = self.cache.make_key({c: self.companies[c] for c in names},
+                                            self.social_rates, self.years, self.seed,
+                                            self.reference.history_digest)
+            df = self.cache.load(cache_key)
+            if df is not None:
+                print(f"♻️ Données chargées depuis le cache ({cache_key[:12]})")
+                return compact_frame(df) if compact else df
+        
+        metrics = None
+        if workers and names:
+            print(f"📊 Traitement des données pour {len(names)} entreprises ({workers} processus, lots par {shard_by})...")
+            with self.span('generation', rows=len(names) * len(self.years), workers=workers, shard_by=shard_by):
+                batch, metrics = self._generate_sharded(names, workers, shard_by, request_delay)
+        elif request_delay:
+            batch = self._collect_companies_series(names, request_delay)
+        else:
+            print(f"📊 Traitement des données pour {len(names)} entreprises...")
+            with self.span('generation', rows=len(names) * len(self.years)):
+                batch = self.simulate_companies_batch(names)
+        
+        # Créer le DataFrame final
+        with self.span('dataframe_build') as span:
+            # Le cache conserve la disposition standard, quelle que soit la demande
+            df = build_companies_frame(batch, self.social_rates, metrics, compact=compact and cache_key is None)
+            span['rows'] = len(df)
+        
+        if cache_key is not None:
+            self.cache.store(cache_key, df)
+            df = compact_frame(df) if compact else df
+        
+        return df
+    
+    def memory_report(self, df):
+        """Affiche l'occupation mémoire du panel selon les dispositions object, standard et compacte"""
+        report = memory_report(df)
+        megabytes = report.loc[:'Total', ['object', 'standard', 'compact']].astype(float) / 1024 ** 2
+        
+        print(f"\n🧮 Mémoire du panel ({len(df)} lignes, Mo):")
+        print(f"{'Colonne':<28} {'object':>10} {'standard':>10} {'compact':>10}  {'type compact'}")
+        for column, row in megabytes.iterrows():
+            print(f"{column:<28} {row['object']:>10.2f} {row['standard']:>10.2f} {row['compact']:>10.2f}  "
+                  f"{report.at[column, 'compact dtype']}")
+        per_row = report.loc['Octets par ligne']
+        print(f"Octets par ligne: {per_row['object']} / {per_row['standard']} / {per_row['compact']} "
+              f"(compacte: x{per_row['object'] / per_row['compact']:.1f} vs object, "
+              f"x{per_row['standard'] / per_row['compact']:.1f} vs standard)")
+        return report
+    
+    def get_open_data(self, datasets, client=None, columns=OPEN_DATA_COLUMNS):
+        """
+        Récupère en parallèle des exports open data URSSAF et les convertit
+        dans les colonnes produites par get_all_companies_data
+        """
+        print(f"🌐 Téléchargement de {len(datasets)} export(s) open data URSSAF...")
+        own_client = client is None
+        client = client if client is not None else URSSAFOpenDataClient(headers=self.headers)
+        try:
+            with self.span('fetch', datasets=list(datasets)) as span:
+                bodies = asyncio.run(client.fetch_datasets(list(datasets)))
+                span['bytes_read'] = sum(len(body) for body in bodies.values())
+        finally:
+            if own_client:
+                client.close()
+        
+        with self.span('dataframe_build') as span:
+            frames = [build_companies_frame(normalize_open_data(body, self.social_rates, columns), self.social_rates)
+                      for body in bodies.values()]
+            df = pd.concat(frames, ignore_index=True)
+            span['rows'] = len(df)
+        return df
+    
+    def ingest_bulk(self, paths, directory, columns=BULK_COLUMNS, chunk_rows=100_000, sep=';', record_tag='record'):
+        """
+        Lit des exports en masse URSSAF (CSV ou XML, éventuellement .gz) par
+        blocs et construit leur index disque par SIREN et par année (BulkIndex)
+        """
+        print(f"📥 Lecture de {len(paths)} export(s) en masse...")
+        with self.span('bulk_ingest', files=list(paths)) as span:
+            index = BulkIndex.build(paths, directory, columns, chunk_rows, sep, record_tag)
+            span['rows'] = index.rows_read
+        print(f"🗂️ {index.rows_read} lignes lues, {len(index.keys)} entreprises indexées dans '{directory}'")
+        return index
+    
+    def get_bulk_data(self, index, companies=None, compact=False):
+        """
+        Jeu de données d'un index d'exports en masse (BulkIndex ou son
+        répertoire), dans les colonnes de get_all_companies_data. Avec
+        companies, seules les tranches de ces entreprises sont lues.
+        """
+        index = BulkIndex(index) if isinstance(index, str) else index
+        with self.span('dataframe_build') as span:
+            df = build_companies_frame(index.batch(self.social_rates, companies), self.social_rates, compact=compact)
+            span['rows'] = len(df)
+        return df
+    
+    def _company_fingerprints(self, companies):
+        """
+        Empreinte de chaque couple (entreprise, année): {entreprise: {'année': empreinte}}.
+        Une valeur simulée ne dépend que du registre de l'entreprise, de la
+        graine, des aléas de son année et de l'historique de cette année.
+        """
+        fingerprints = {}
+        for company in companies:
+            prefix = json.dumps([ENGINE_VERSION, self.seed, self.companies[company]], sort_keys=True, ensure_ascii=False)
+            history = [self.reference.history_series(metric, company) or {} for metric in HISTORY_METRICS]
+            fingerprints[company] = {
+                str(year): hashlib.sha256(json.dumps([prefix] + [series.get(str(year)) for series in history])
+                                          .encode('utf-8')).hexdigest()[:16]
+                for year in self.years
+            }
+        return fingerprints
+    
+    def dataset_state(self, companies=None):
+        """État des sources d'un jeu de données, conservé pour les mises à jour incrémentales"""
+        names = list(self.companies) if companies is None else list(companies)
+        return {
+            'companies': self._company_fingerprints(names),
+            'social_rates': {str(year): self.social_rates.get(str(year)) for year in self.years},
+        }
+    
+    def save_dataset(self, df, path):
+        """
+        Sauvegarde le jeu de données en CSV, accompagné de son état
+        (path.state.json). Le fichier est toujours dans la disposition
+        standard: les indicateurs calculés d'un panel compact sont ajoutés.
+        """
+        df = add_derived_columns(df)
+        with self.span('save_dataset', path=path, rows=len(df)) as span:
+            df.to_csv(path, index=False)
+            with open(f"{path}.state.json", 'w', encoding='utf-8') as f:
+                json.dump(self.dataset_state(), f, ensure_ascii=False)
+            span['bytes_written'] = os.path.getsize(path) + os.path.getsize(f"{path}.state.json")
+        print(f"\n💾 Données sauvegardées dans '{path}'")
+    
+    def refresh_companies_data(self, previous, previous_state):
+        """
+        Met à jour un jeu de données existant en ne recalculant que les couples
+        (entreprise, année) nouveaux ou modifiés: empreinte différente (registre,
+        graine ou historique de l'année), entreprise ou année ajoutée. Les
+        années dont seul le taux a changé ne sont pas régénérées.
+        
+        Renvoie le DataFrame à jour et le détail des changements.
+        """
+        names = list(self.companies)
+        state = self.dataset_state(names)
+        old_companies = previous_state.get('companies', {})
+        old_rates = previous_state.get('social_rates', {})
+        
+        new_years = [year for year in self.years if str(year) not in old_rates]
+        rate_years = [year for year in self.years
+                      if str(year) in old_rates and old_rates[str(year)] != state['social_rates'][str(year)]]
+        
+        # Années à recalculer par entreprise (un état sans empreintes par année
+        # fait tout recalculer)
+        stale = {}
+        for company in names:
+            old = old_companies.get(company)
+            old = old if isinstance(old, dict) else {}
+            years = [year for year in self.years if old.get(str(year)) != state['companies'][company][str(year)]]
+            if years:
+                stale[company] = years
+        removed = [c for c in old_companies if c not in self.companies]
+        # Entreprises modifiées au-delà des seules années ajoutées
+        changed = [c for c, years in stale.items() if not set(years) <= set(new_years) or c not in old_companies]
+        
+        # Secteurs dont les moyennes peuvent avoir changé
+        touched = set(changed) | set(removed)
+        sectors = set(previous.loc[previous['Company'].isin(touched), 'Sector'].astype(str))
+        sectors |= {self.companies[c]['sector'] for c in changed}
+        
+        # Lignes conservées: couples inchangés, sur les années toujours couvertes
+        cells = pd.MultiIndex.from_tuples([(c, int(year)) for c, years in stale.items() for year in years],
+                                          names=['Company', 'Year'])
+        rows = pd.MultiIndex.from_arrays([previous['Company'].astype(str), previous['Year'].astype(int)])
+        kept = previous[previous['Company'].isin(names) & previous['Year'].isin(self.years)
+                        & ~rows.isin(cells)].copy()
+        kept['Company'] = kept['Company'].astype(str)
+        kept['Sector'] = kept['Sector'].astype(str)
+        if rate_years:
+            rates = kept['Year'].map(lambda year: self.social_rates.get(str(year), np.nan))
+            kept['Social Rate (%)'] = rates.to_numpy(dtype=np.float64)
+        
+        # Une simulation par ensemble d'années à recalculer
+        groups = {}
+        for company, years in stale.items():
+            groups.setdefault(tuple(years), []).append(company)
+        frames = [kept]
+        for years, companies in groups.items():
+            frames.append(build_companies_frame(self.simulate_companies_batch(companies, years=np.array(years)),
+                                                self.social_rates))
+        rows_recomputed = sum(len(frame) for frame in frames[1:])
+        
+        for frame in frames[1:]:
+            frame['Company'] = frame['Company'].astype(str)
+            frame['Sector'] = frame['Sector'].astype(str)
+        df = pd.concat(frames, ignore_index=True)
+        
+        # Remettre les lignes dans l'ordre du registre puis des années
+        company_codes = pd.Categorical(df['Company'], categories=names).codes
+        df = df.iloc[np.lexsort((df['Year'].to_numpy(), company_codes))].reset_index(drop=True)
+        df['Company'] = pd.Categorical(df['Company'], categories=names)
+        df['Sector'] = pd.Categorical(df['Sector'], categories=list(pd.unique(df['Sector'])))
+        df['Year'] = df['Year'].astype(np.int16)
+        
+        changes = {
+            'companies': changed,
+            'removed': removed,
+            'sectors': sorted(sectors),
+            'new_years': [int(year) for year in new_years],
+            'rate_years': [int(year) for year in rate_years],
+            'rows_recomputed': rows_recomputed,
+        }
+        return df, changes
+    
+    def refresh_dataset(self, path):
+        """
+        Met à jour de façon incrémentale le fichier CSV path, ou le crée s'il
+        n'existe pas encore. Renvoie le DataFrame et le détail des changements.
+        """
+        state_path = f"{path}.state.json"
+        if not (os.path.exists(path) and os.path.exists(state_path)):
+            df = self.get_all_companies_data()
+            self.save_dataset(df, path)
+            return df, {
+                'companies': list(self.companies),
+                'removed': [],
+                'sectors': sorted({info['sector'] for info in self.companies.values()}),
+                'new_years': [int(year) for year in self.years],
+                'rate_years': [],
+                'rows_recomputed': len(df),
+            }
+        
+        print(f"🔄 Mise à jour incrémentale de '{path}'...")
+        with open(state_path, encoding='utf-8') as f:
+            previous_state = json.load(f)
+        df, changes = self.refresh_companies_data(pd.read_csv(path), previous_state)
+        # Un fichier écrit en disposition compacte n'a pas d'indicateurs calculés
+        df = add_derived_columns(df)
+        print(f"🔄 {changes['rows_recomputed']} lignes recalculées "
+              f"({len(changes['companies'])} entreprises modifiées, années ajoutées: {changes['new_years']})")
+        
+        if changes['rows_recomputed'] or changes['removed'] or changes['rate_years']:
+            self.save_dataset(df, path)
+        return df, changes
+    
+    def stale_reports(self, changes, companies, comparative=()):
+        """
+        Indique quels rapports dépendent de données modifiées: la figure
+        globale, les rapports par entreprise (données propres et moyenne du
+        secteur) et l'analyse comparative
+        """
+        every_year = bool(changes['new_years'] or changes['rate_years'])
+        changed = set(changes['companies'])
+        sectors = set(changes['sectors'])
+        
+        return {
+            'global': every_year or bool(changed) or bool(changes['removed']),
+            'companies': [c for c in companies
+                          if every_year or c in changed or self.companies[c]['sector'] in sectors],
+            'comparative': every_year or any(c in changed for c in comparative),
+        }
+    
+    def _collect_companies_series(self, companies, request_delay):
+        """Collecte les séries entreprise par entreprise via les accesseurs"""
+        shape = (len(companies), len(self.years))
+        year_labels = [str(year) for year in self.years]
+        batch = {
+            'Company': np.array(companies, dtype=object),
+            'Sector': np.array([self.companies[c]['sector'] for c in companies], dtype=object),
+            'Year': self.years.copy(),
+            'Social Contributions (M€)': np.empty(shape),
+            'Payroll (M€)': np.empty(shape),
+            'Employees': np.empty(shape),
+        }
         
-        for company in self.companies:
+        for i, company in enumerate(companies):
             print(f"📊 Traitement des données pour {company}...")
             
             # Récupérer toutes les données pour cette entreprise
-            social_contributions = self.get_company_social_data(company)
-            payroll = self.get_company_payroll(company)
-            employees = self.get_company_employees(company)
+            with self.span('fetch', company=company, rows=len(self.years)):
+                social_contributions = self.get_company_social_data(company)
+                payroll = self.get_company_payroll(company)
+                employees = self.get_company_employees(company)
             
-            # Créer un DataFrame pour cette entreprise
-            for year in range(2002, 2026):
-                year_str = str(year)
-                
-                company_data = {
-                    'Company': company,
-                    'Sector': self.companies[company]['sector'],
-                    'Year': year,
-                    'Social Contributions (M€)': social_contributions[year_str],
-                    'Payroll (M€)': payroll[year_str],
-                    'Employees': employees[year_str],
-                    'Social Rate (%)': self.social_rates[year_str],
-                    'Avg Salary (€)': payroll[year_str] * 1e6 / employees[year_str] if employees[year_str] > 0 else 0
-                }
-                all_data.append(company_data)
+            batch['Social Contributions (M€)'][i] = [social_contributions.get(year, np.nan) for year in year_labels]
+            batch['Payroll (M€)'][i] = [payroll.get(year, np.nan) for year in year_labels]
+            batch['Employees'][i] = [employees.get(year, np.nan) for year in year_labels]
             
-            time.sleep(0.1)  # Pause pour éviter de surcharger
+            time.sleep(request_delay)  # Pause pour éviter de surcharger la source
         
-        # Créer le DataFrame final
-        df = pd.DataFrame(all_data)
+        return batch
+    
+    def build_column_store(self, directory, chunk_size=1000, companies=None):
+        """
+        Génère le jeu de données dans un ColumnStore (colonnes mappées en
+        mémoire, partitionnées par secteur), utilisable comme cube par les
+        fonctions de rapport sans DataFrame complet en mémoire
+        """
+        print(f"💾 Construction du stockage hors mémoire dans '{directory}'...")
+        with self.span('column_store', path=directory) as span:
+            store = ColumnStore.write(self, directory, chunk_size, companies)
+            span['rows'] = int(store.count.sum())
+        return store
+    
+    def iter_company_chunks(self, chunk_size=1000, companies=None):
+        """Génère le jeu de données par blocs de chunk_size entreprises"""
+        names = list(self.companies) if companies is None else list(companies)
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            yield build_companies_frame(self.simulate_companies_batch(chunk), self.social_rates)
+    
+    def export_streaming(self, path, fmt='csv', chunk_size=1000, companies=None, chunks=None):
+        """
+        Exporte le jeu de données bloc par bloc, sans jamais le garder en entier
+        en mémoire.
+        
+        fmt: 'csv', 'csv.gz' (CSV compressé) ou 'parquet' (jeu de données
+        partitionné par Sector/Year dans le répertoire path)
+        chunks: blocs (DataFrame) à écrire à la place du jeu simulé, par
+        exemple lus depuis un fichier existant
+        """
+        if fmt not in ('csv', 'csv.gz', 'parquet'):
+            raise ValueError(f"Format d'export inconnu: {fmt}")
+        blocks = self.iter_company_chunks(chunk_size, companies) if chunks is None else chunks
         
-        # Ajouter des indicateurs calculés
-        df['Social/Payroll Ratio (%)'] = df['Social Contributions (M€)'] / df['Payroll (M€)'] * 100
-        df['Social per Employee (€)'] = df['Social Contributions (M€)'] * 1e6 / df['Employees']
-        df['Payroll per Employee (€)'] = df['Payroll (M€)'] * 1e6 / df['Employees']
+        print(f"💾 Export par blocs de {chunk_size} entreprises vers '{path}' ({fmt})...")
+        rows = 0
+        chunks = 0
         
-        return df
+        with self.span('export', path=path, format=fmt) as span:
+            if fmt == 'parquet':
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                
+                for chunks, chunk_df in enumerate(blocks, 1):
+                    chunk_df['Company'] = chunk_df['Company'].astype(str)
+                    chunk_df['Sector'] = chunk_df['Sector'].astype(str)
+                    table = pa.Table.from_pandas(chunk_df, preserve_index=False)
+                    pq.write_to_dataset(table, root_path=path, partition_cols=['Sector', 'Year'],
+                                        basename_template=f"part-{chunks:05d}-{{i}}.parquet")
+                    rows += len(chunk_df)
+            else:
+                opener = gzip.open if fmt == 'csv.gz' else open
+                with opener(path, 'wt', encoding='utf-8', newline='') as handle:
+                    for chunks, chunk_df in enumerate(blocks, 1):
+                        chunk_df.to_csv(handle, index=False, header=(chunks == 1))
+                        rows += len(chunk_df)
+            
+            span['rows'] = rows
+            if os.path.isdir(path):
+                span['bytes_written'] = sum(os.path.getsize(os.path.join(root, name))
+                                            for root, _, names in os.walk(path) for name in names)
+            else:
+                span['bytes_written'] = os.path.getsize(path)
+        print(f"💾 {rows} lignes exportées en {chunks} blocs")
+        return {'path': path, 'format': fmt, 'rows': rows, 'chunks': chunks}
+    
+    def span(self, stage, **fields):
+        """Mesure une étape si un StageProfiler est configuré"""
+        if self.profiler is None:
+            return nullcontext(dict(fields))
+        return self.profiler.span(stage, **fields)
+    
+    def _savefig(self, path, fig=None, **fields):
+        """Enregistre une figure (la figure courante par défaut) selon le profil de sortie, en mesurant l'écriture"""
+        import matplotlib.pyplot as plt
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = profile_path(os.path.join(self.output_dir, path), self.output_profile)
+        with self.span('savefig', path=path, profile=self.output_profile, **fields) as span:
+            (fig if fig is not None else plt.gcf()).savefig(path, **savefig_options(self.output_profile))
+            span['bytes_written'] = os.path.getsize(path)
     
-    def create_global_analysis_visualization(self, df):
+    def _show(self, fig):
+        """Affiche la figure puis la ferme, ou la ferme simplement en mode sans affichage"""
+        import matplotlib.pyplot as plt
+        if not self.headless:
+            plt.show()
+        plt.close(fig)
+    
+    def close_figures(self):
+        """Libère la figure réutilisée par les rapports par entreprise"""
+        if self._company_figure is not None:
+            self._company_figure.close()
+            self._company_figure = None
+    
+    def create_global_analysis_visualization(self, df, plot=True, cube=None):
         """Crée des visualisations complètes pour l'analyse des cotisations sociales"""
-        plt.style.use('seaborn-v0_8')
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(18, 14))
-        
-        # 1. Cotisations sociales moyennes par secteur au fil du temps
-        sector_social = df.groupby(['Sector', 'Year'])['Social Contributions (M€)'].mean().reset_index()
-        sectors = sector_social['Sector'].unique()
-        
-        for sector in sectors:
-            sector_data = sector_social[sector_social['Sector'] == sector]
-            ax1.plot(sector_data['Year'], sector_data['Social Contributions (M€)'], 
-                    label=sector, linewidth=2)
-        
-        ax1.set_title('Cotisations Sociales Moyennes par Secteur (2002-2025)', fontsize=12, fontweight='bold')
-        ax1.set_ylabel('Cotisations Sociales (M€)')
-        ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        ax1.grid(True, alpha=0.3)
-        
-        # 2. Ratio Cotisations/Masse Salariale par secteur (boxplot)
-        sector_data = [df[df['Sector'] == sector]['Social/Payroll Ratio (%)'] 
-                      for sector in df['Sector'].unique()]
-        ax2.boxplot(sector_data, labels=df['Sector'].unique())
-        ax2.set_title('Ratio Cotisations/Masse Salariale par Secteur', fontsize=12, fontweight='bold')
-        ax2.set_ylabel('Cotisations/Masse Salariale (%)')
-        ax2.tick_params(axis='x', rotation=45)
-        ax2.grid(True, alpha=0.3)
-        
-        # 3. Entreprises avec les cotisations les plus élevées (2024)
-        latest_year = df['Year'].max()
-        latest_data = df[df['Year'] == latest_year]
-        top_social = latest_data.nlargest(10, 'Social Contributions (M€)')
-        
-        bars = ax3.barh(top_social['Company'], top_social['Social Contributions (M€)'])
-        ax3.set_title(f'Top 10 des Entreprises avec les Cotisations les plus Élevées ({latest_year})', 
-                     fontsize=12, fontweight='bold')
-        ax3.set_xlabel('Cotisations Sociales (M€)')
-        
-        # Ajouter les valeurs sur les barres
-        for bar in bars:
-            width = bar.get_width()
-            ax3.text(width + 10, bar.get_y() + bar.get_height()/2, 
-                    f'{width:.0f} M€', ha='left', va='center')
-        
-        # 4. Évolution du taux de cotisations sociales
-        social_rate_evolution = df.groupby('Year')['Social Rate (%)'].mean().reset_index()
-        ax4.plot(social_rate_evolution['Year'], social_rate_evolution['Social Rate (%)'], 
-                linewidth=2, color='red')
-        ax4.set_title('Évolution du Taux de Cotisations Sociales en France', 
-                     fontsize=12, fontweight='bold')
-        ax4.set_ylabel('Taux de Cotisations (%)')
-        ax4.grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-        plt.savefig('urssaf_social_analysis_2002_2025.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        cube = cube if cube is not None else AggregateCube(df)
+        if plot:
+            fig = plot_global_analysis(df, cube)
+            self._savefig('urssaf_social_analysis_2002_2025.png', figure='global')
+            self._show(fig)
         
         # Statistiques et analyse
         print("\n📈 Statistiques descriptives des cotisations sociales (2002-2025):")
-        print(df[['Social Contributions (M€)', 'Payroll (M€)', 'Employees', 
-                 'Social/Payroll Ratio (%)', 'Social per Employee (€)']].describe())
+        print(cube.describe(['Social Contributions (M€)', 'Payroll (M€)', 'Employees', 
+                             'Social/Payroll Ratio (%)', 'Social per Employee (€)']))
         
         # Analyse des entreprises avec les cotisations les plus élevées
-        latest_data = df[df['Year'] == latest_year]
-        high_social = latest_data.nlargest(10, 'Social Contributions (M€)')
+        latest_year = cube.latest_year
+        high_social = cube.nlargest(10, 'Social Contributions (M€)', latest_year)
         
         print(f"\n🔍 Entreprises avec les cotisations les plus élevées en {latest_year}:")
-        for _, row in high_social.iterrows():
-            print(f"   - {row['Company']}: {row['Social Contributions (M€)']:.0f} M€ "
-                  f"(Ratio: {row['Social/Payroll Ratio (%)']:.1f}%, "
-                  f"Par employé: {row['Social per Employee (€)']:.0f} €)")
+        print('\n'.join(format_lines(high_social, [
+            '   - ', ('Company', '%s'), ': ', ('Social Contributions (M€)', '%.0f'), ' M€ ',
+            '(Ratio: ', ('Social/Payroll Ratio (%)', '%.1f'), '%, ',
+            'Par employé: ', ('Social per Employee (€)', '%.0f'), ' €)'])))
+        
+        # Impact des crises sur toutes les entreprises (médianes)
+        impact = cube.crisis_impact(['Social Contributions (M€)', 'Payroll (M€)', 'Employees'])
+        crises = [name for name in CRISIS_PERIODS if impact[f'Crisis {name} (%)'].notna().any()]
+        if crises:
+            print("\n⚠️ Impact des crises (médiane des entreprises; entre parenthèses, moyenne après / avant):")
+            for metric, row in impact.iterrows():
+                print(f"   {metric}: " + ', '.join(f"{name} {row[f'Crisis {name} (%)']:+.1f}% "
+                                               f"({row[f'Post/Pre {name} (%)']:+.1f}%)" for name in crises))
     
-    def create_company_specific_report(self, df, company_name):
-        """Crée un rapport spécifique pour une entreprise"""
-        company_data = df[df['Company'] == company_name]
+    def create_company_specific_report(self, df, company_name, plot=True, cube=None, bands=None):
+        """
+        Crée un rapport spécifique pour une entreprise. bands: bandes Monte
+        Carlo de l'entreprise (DataFrame de monte_carlo_bands), optionnelles
+        """
+        cube = cube if cube is not None else AggregateCube(df)
+        company_data = cube.company_rows(company_name)
         
         if company_data.empty:
             print(f"❌ Aucune donnée trouvée pour {company_name}")
@@ -481,74 +3104,66 @@ class URSSAFAnalysis:
         
         # Comparaison avec la moyenne du secteur
         sector = latest['Sector']
-        sector_data = df[(df['Sector'] == sector) & (df['Year'] == latest_year)]
-        sector_avg_social_ratio = sector_data['Social/Payroll Ratio (%)'].mean()
-        sector_avg_social_per_emp = sector_data['Social per Employee (€)'].mean()
+        sector_avg_social_ratio = cube.sector_mean(sector, latest_year, 'Social/Payroll Ratio (%)')
+        sector_avg_social_per_emp = cube.sector_mean(sector, latest_year, 'Social per Employee (€)')
         
         print(f"\n📊 Comparaison avec la moyenne du secteur ({sector}):")
         print(f"   Ratio Cotisations/Masse Salariale: {latest['Social/Payroll Ratio (%)']:.1f}% vs {sector_avg_social_ratio:.1f}% (moyenne secteur)")
         print(f"   Cotisations par employé: {latest['Social per Employee (€)']:.0f} € vs {sector_avg_social_per_emp:.0f} € (moyenne secteur)")
         
-        # Tendance historique
-        social_trend = company_data[['Year', 'Social Contributions (M€)']].set_index('Year')
+        # Comparaison avec les entreprises aux trajectoires les plus proches (tous secteurs)
+        peers = cube.peers_of(company_name, k=5)
+        if len(peers):
+            peer_rows = cube.companies_rows(list(peers['Peer']))
+            peer_means = peer_rows.loc[peer_rows['Year'] == latest_year,
+                                       ['Social/Payroll Ratio (%)', 'Social per Employee (€)']].mean()
+            print(f"\n🤝 Comparaison avec les entreprises comparables ({', '.join(peers['Peer'])}):")
+            print(f"   Ratio Cotisations/Masse Salariale: {latest['Social/Payroll Ratio (%)']:.1f}% vs {peer_means['Social/Payroll Ratio (%)']:.1f}% (moyenne des pairs)")
+            print(f"   Cotisations par employé: {latest['Social per Employee (€)']:.0f} € vs {peer_means['Social per Employee (€)']:.0f} € (moyenne des pairs)")
+        
+        # Tendance historique (calculée une seule fois pour toutes les entreprises
+        # d'un AggregateCube; lue dans la seule partition de l'entreprise pour un ColumnStore)
+        trends = cube.trends([company_name])
+        trend = trends.company(company_name)
         print(f"\n📈 Tendance des cotisations sociales:")
-        print(f"   Maximum: {social_trend['Social Contributions (M€)'].max():.0f} M€ ({social_trend['Social Contributions (M€)'].idxmax()})")
-        print(f"   Minimum: {social_trend['Social Contributions (M€)'].min():.0f} M€ ({social_trend['Social Contributions (M€)'].idxmin()})")
-        print(f"   Moyenne (2002-2025): {social_trend['Social Contributions (M€)'].mean():.0f} M€")
+        print(f"   Maximum: {trend['Max']:.0f} M€ ({trend['Max Year']:.0f})")
+        print(f"   Minimum: {trend['Min']:.0f} M€ ({trend['Min Year']:.0f})")
+        print(f"   Moyenne ({trends.years[0]}-{trends.years[-1]}): {trend['Mean']:.0f} M€")
+        print(f"   Croissance annuelle moyenne: {trend['CAGR (%)']:+.1f}% "
+              f"({trends.window} dernières années: {trend[f'CAGR {trends.window}y (%)']:+.1f}%)")
+        print(f"   Croissance {latest_year}: {trend['Last YoY (%)']:+.1f}% "
+              f"(volatilité annuelle: {trend['YoY Volatility (%)']:.1f} pts)")
+        for name in trends.crises:
+            if not np.isnan(trend[f'Crisis {name} (%)']):
+                print(f"   Crise {name}: {trend[f'Crisis {name} (%)']:+.1f}% "
+                      f"(moyenne après / avant: {trend[f'Post/Pre {name} (%)']:+.1f}%)")
+        
+        if bands is not None and latest_year in bands.index:
+            band = bands.loc[latest_year]
+            print(f"\n🎲 Incertitude Monte Carlo ({latest_year}, p5 / p50 / p95):")
+            print(f"   Cotisations sociales: {band['Social Contributions (M€) p5']:.0f} / "
+                  f"{band['Social Contributions (M€) p50']:.0f} / {band['Social Contributions (M€) p95']:.0f} M€")
+            print(f"   Masse salariale: {band['Payroll (M€) p5']:.0f} / "
+                  f"{band['Payroll (M€) p50']:.0f} / {band['Payroll (M€) p95']:.0f} M€")
+            print(f"   Effectifs: {band['Employees p5']:.0f} / {band['Employees p50']:.0f} / {band['Employees p95']:.0f}")
         
         # Visualisation pour l'entreprise spécifique
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 12))
-        
-        # 1. Cotisations sociales et masse salariale
-        ax1.plot(company_data['Year'], company_data['Social Contributions (M€)'], 
-                label='Cotisations Sociales', linewidth=2, color='blue')
-        ax1_twin = ax1.twinx()
-        ax1_twin.plot(company_data['Year'], company_data['Payroll (M€)'], 
-                     label='Masse Salariale', linewidth=2, color='green', linestyle='--')
-        ax1.set_title(f'Évolution des Cotisations et de la Masse Salariale ({company_name})', fontsize=12, fontweight='bold')
-        ax1.set_ylabel('Cotisations Sociales (M€)', color='blue')
-        ax1_twin.set_ylabel('Masse Salariale (M€)', color='green')
-        ax1.legend(loc='upper left')
-        ax1_twin.legend(loc='upper right')
-        ax1.grid(True, alpha=0.3)
-        
-        # 2. Ratio Cotisations/Masse Salariale
-        ax2.plot(company_data['Year'], company_data['Social/Payroll Ratio (%)'], 
-                label='Ratio Cotisations/Masse Salariale', linewidth=2, color='red')
-        ax2.plot(company_data['Year'], company_data['Social Rate (%)'], 
-                label='Taux Officiel', linewidth=2, color='purple', linestyle='--')
-        ax2.set_title(f'Ratios de Cotisations ({company_name})', fontsize=12, fontweight='bold')
-        ax2.set_ylabel('Ratio (%)')
-        ax2.legend()
-        ax2.grid(True, alpha=0.3)
-        
-        # 3. Effectifs et salaire moyen
-        ax3.plot(company_data['Year'], company_data['Employees'], 
-                label='Effectifs', linewidth=2, color='orange')
-        ax3_twin = ax3.twinx()
-        ax3_twin.plot(company_data['Year'], company_data['Avg Salary (€)'], 
-                     label='Salaire Moyen', linewidth=2, color='brown')
-        ax3.set_title(f'Effectifs et Salaire Moyen ({company_name})', fontsize=12, fontweight='bold')
-        ax3.set_ylabel('Effectifs', color='orange')
-        ax3_twin.set_ylabel('Salaire Moyen (€)', color='brown')
-        ax3.legend(loc='upper left')
-        ax3_twin.legend(loc='upper right')
-        ax3.grid(True, alpha=0.3)
-        
-        # 4. Cotisations par employé
-        ax4.plot(company_data['Year'], company_data['Social per Employee (€)'], 
-                label='Cotisations par Employé', linewidth=2, color='darkblue')
-        ax4.set_title(f'Cotisations par Employé ({company_name})', fontsize=12, fontweight='bold')
-        ax4.set_ylabel('Cotisations (€)')
-        ax4.grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-        plt.savefig(f'{company_name}_social_analysis_2002_2025.png', dpi=300, bbox_inches='tight')
-        plt.show()
-    
-    def create_comparative_analysis(self, df, company_list):
+        if plot and self.headless:
+            # Sans affichage: une seule figure, mise à jour d'une entreprise à l'autre
+            if self._company_figure is None:
+                self._company_figure = CompanyReportFigure(company_data, company_name)
+            fig = self._company_figure.update(company_data, company_name, bands)
+            self._savefig(f'{company_name}_social_analysis_2002_2025.png', fig=fig, figure='company',
+                          company=company_name)
+        elif plot:
+            fig = plot_company_report(company_data, company_name, bands)
+            self._savefig(f'{company_name}_social_analysis_2002_2025.png', figure='company', company=company_name)
+            self._show(fig)
+    
+    def create_comparative_analysis(self, df, company_list, plot=True, cube=None):
         """Crée une analyse comparative entre plusieurs entreprises"""
-        if not all(company in self.companies for company in company_list):
+        cube = cube if cube is not None else AggregateCube(df)
+        if any(cube.company_rows(company).empty for company in company_list):
             print("❌ Une ou plusieurs entreprises ne sont pas dans la liste des entreprises françaises")
             return
         
@@ -556,80 +3171,692 @@ class URSSAFAnalysis:
         print("=" * 70)
         
         # Filtrer les données pour les entreprises sélectionnées
-        comparative_data = df[df['Company'].isin(company_list)]
+        comparative_data = pd.concat([cube.company_rows(company) for company in company_list])
         latest_year = comparative_data['Year'].max()
         latest_data = comparative_data[comparative_data['Year'] == latest_year]
         
         # Tableau comparatif
         print(f"\nIndicateurs sociaux clés ({latest_year}):")
-        print("-" * 120)
-        print(f"{'Entreprise':<20} {'Cotisations (M€)':<15} {'Masse Salariale (M€)':<18} {'Effectifs':<10} {'Ratio (%)':<10} {'Par employé (€)':<15}")
-        print("-" * 120)
-        
-        for _, row in latest_data.iterrows():
-            print(f"{row['Company']:<20} {row['Social Contributions (M€)']:<15.0f} {row['Payroll (M€)']:<18.0f} "
-                  f"{row['Employees']:<10.0f} {row['Social/Payroll Ratio (%)']:<10.1f} "
-                  f"{row['Social per Employee (€)']:<15.0f}")
+        print(render_table(latest_data, COMPARATIVE_COLUMNS))
         
         # Visualisation comparative
-        fig, axes = plt.subplots(2, 3, figsize=(18, 12))
-        axes = axes.flatten()
-        
-        indicators = ['Social Contributions (M€)', 'Payroll (M€)', 'Employees', 
-                     'Social/Payroll Ratio (%)', 'Avg Salary (€)', 'Social per Employee (€)']
-        titles = ['Cotisations Sociales (M€)', 'Masse Salariale (M€)', 'Effectifs', 
-                 'Ratio Cotisations/Masse Salariale (%)', 'Salaire Moyen (€)', 'Cotisations par Employé (€)']
-        
-        colors = plt.cm.Set3(np.linspace(0, 1, len(company_list)))
-        
-        for i, (indicator, title) in enumerate(zip(indicators, titles)):
-            ax = axes[i]
-            for j, company in enumerate(company_list):
-                company_yearly = comparative_data[comparative_data['Company'] == company]
-                ax.plot(company_yearly['Year'], company_yearly[indicator], 
-                       label=company, color=colors[j], linewidth=2)
-            
-            ax.set_title(title, fontsize=11, fontweight='bold')
-            ax.grid(True, alpha=0.3)
+        if plot:
+            fig = plot_comparative_analysis(comparative_data, company_list)
+            self._savefig('comparative_social_analysis.png', figure='comparative')
+            self._show(fig)
+    
+    def create_peer_analysis(self, df, company_name, k=5, plot=True, cube=None, same_sector=False):
+        """
+        Recherche les k entreprises les plus comparables (PeerIndex) et les
+        compare à l'entreprise dans l'analyse comparative
+        """
+        cube = cube if cube is not None else AggregateCube(df)
+        try:
+            peers = cube.peers_of(company_name, k, same_sector)
+        except KeyError:
+            print(f"❌ Aucune donnée trouvée pour {company_name}")
+            return None
+        
+        print(f"\n🤝 Entreprises les plus comparables à {company_name}"
+              f"{' (même secteur)' if same_sector else ''}:")
+        print(render_table(peers, PEER_COLUMNS))
+        self.create_comparative_analysis(df, [company_name] + list(peers['Peer']), plot=plot, cube=cube)
+        return peers
+    
+    def write_text_report(self, path, cube, companies=None, comparative=None, fmt=None, top=10, peers=0):
+        """
+        Écrit en une seule fois le classement, le tableau comparatif et le
+        résumé par entreprise (toutes les entreprises par défaut) au format
+        txt, md, html ou json (déduit de l'extension si fmt n'est pas donné).
+        peers: nombre d'entreprises comparables listées pour chaque entreprise
+        """
+        fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower() or 'txt'
+        fmt = 'md' if fmt == 'markdown' else 'html' if fmt == 'htm' else fmt
+        companies = list(self.companies) if companies is None else companies
+        latest_year = cube.latest_year
+        
+        with self.span('text_report', path=path, format=fmt, companies=len(companies)) as span:
+            ranking = cube.nlargest(top, 'Social Contributions (M€)', latest_year)
+            sections = [(f"Classement des entreprises par cotisations sociales en {latest_year}",
+                         ranking.assign(Rank=np.arange(1, len(ranking) + 1)), RANKING_COLUMNS)]
+            if comparative:
+                comparative_data = cube.companies_rows(comparative)
+                sections.append((f"Indicateurs sociaux clés ({latest_year})",
+                                 comparative_data[comparative_data['Year'] == latest_year], COMPARATIVE_COLUMNS))
+            sections.append(("Rapports par entreprise", company_summary(cube, companies), COMPANY_SUMMARY_COLUMNS))
+            if peers:
+                tables = [cube.peers_of(company, peers) for company in companies if not cube.company_rows(company).empty]
+                sections.append(("Entreprises comparables",
+                                 pd.concat(tables, ignore_index=True) if tables
+                                 else pd.DataFrame(columns=[column for _, column, _, _ in PEER_COLUMNS]),
+                                 PEER_COLUMNS))
             
-            if i == 0:
-                ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+            document = render_report(sections, fmt)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(document)
+            span['bytes_written'] = len(document.encode('utf-8'))
+        
+        print(f"📝 Rapport texte ({fmt}) enregistré dans '{path}'")
+        return path
+    
+    def render_reports(self, df, companies, comparative=None, output_dir='.', workers=None, dpi=None, cube=None,
+                       include_global=True, bands=None, profile=None):
+        """
+        Rend en parallèle (backend Agg, sans affichage) la figure globale, les
+        rapports par entreprise et l'analyse comparative, selon le profil de
+        sortie (celui de l'analyseur par défaut; dpi l'emporte sur le profil).
+        Chaque processus réutilise une seule figure pour les rapports par
+        entreprise.
+        
+        Renvoie le manifeste des fichiers écrits, dans l'ordre des travaux.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        cube = cube if cube is not None else AggregateCube(df)
+        profile = profile or self.output_profile
+        
+        jobs = []
+        if include_global:
+            jobs.append({'kind': 'global', 'name': 'global', 'data': df, 'cube': cube,
+                         'path': os.path.join(output_dir, 'urssaf_social_analysis_2002_2025.png')})
+        for company in companies:
+            company_data = cube.company_rows(company)
+            if company_data.empty:
+                print(f"❌ Aucune donnée trouvée pour {company}")
+                continue
+            jobs.append({'kind': 'company', 'name': company, 'data': company_data,
+                         'bands': (bands or {}).get(company),
+                         'path': os.path.join(output_dir, f'{company}_social_analysis_2002_2025.png')})
+        if comparative:
+            jobs.append({'kind': 'comparative', 'name': list(comparative),
+                         'data': pd.concat([cube.company_rows(company) for company in comparative]),
+                         'path': os.path.join(output_dir, 'comparative_social_analysis.png')})
+        for job in jobs:
+            job['path'] = profile_path(job['path'], profile)
+            job['profile'] = profile
+            job['dpi'] = dpi
+        
+        if not jobs:
+            return []
+        with self.span('render_reports', figures=len(jobs)) as span:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as pool:
+                manifest = list(pool.map(_render_figure_job, jobs))
+            span['bytes_written'] = sum(entry['bytes'] for entry in manifest)
+        
+        if self.profiler is not None:
+            for entry in manifest:
+                self.profiler.record({'stage': 'savefig', 'figure': entry['kind'], 'name': entry['name'],
+                                      'path': entry['path'], 'seconds': entry['seconds'],
+                                      'bytes_written': entry['bytes']})
+        
+        print(f"\n🖼️ {len(manifest)} figures enregistrées dans '{output_dir}'")
+        return manifest
+
+class ResponseCache:
+    """Cache LRU en mémoire des réponses du service de requêtes"""
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            response = self.entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return response
+    
+    def put(self, key, response):
+        with self.lock:
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+class QueryError(Exception):
+    """Erreur d'une requête, renvoyée au client avec son statut HTTP et son message"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _query_list(value):
+    """Liste de valeurs séparées par des virgules, sans éléments vides"""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+class QueryService:
+    """
+    Service de requêtes sur un jeu de données chargé une seule fois:
+    historique d'une entreprise, agrégats sectoriels, classements, analyses
+    comparatives et graphiques. Les réponses sont mises en cache (LRU) par
+    requête et par version du jeu de données.
+    
+        /companies
+        /company?name=LVMH
+        /sector?name=Luxe[&year=2025]
+        /top?year=2025[&metric=...][&k=10][&sector=...][&format=json|txt|md|html]
+        /compare?companies=LVMH,Sanofi[&format=...]
+        /peers?name=LVMH[&k=10][&same_sector=1][&format=...]
+        /chart/company?name=LVMH[&profile=preview|svg|print]
+        /chart/comparative?companies=LVMH,Sanofi[&profile=...]
+        /health
+    """
+    CONTENT_TYPES = {'json': 'application/json; charset=utf-8', 'txt': 'text/plain; charset=utf-8',
+                     'md': 'text/markdown; charset=utf-8', 'html': 'text/html; charset=utf-8',
+                     'png': 'image/png', 'svg': 'image/svg+xml'}
+    # Réponses jamais mises en cache (compteurs du service)
+    UNCACHED = {'/health'}
+    # Paramètres de chaque requête: nom -> (type, obligatoire). Ils sont
+    # validés avant l'appel de la route: seul un paramètre obligatoire
+    # absent donne "Paramètre manquant", un paramètre obligatoire vide (ou
+    # une liste sans élément) "Paramètre vide".
+    PARAMS = {
+        '/companies': {},
+        '/company': {'name': (str, True)},
+        '/sector': {'name': (str, True), 'year': (int, False)},
+        '/top': {'year': (int, False), 'metric': (str, False), 'k': (int, False), 'sector': (str, False),
+                 'format': (str, False)},
+        '/compare': {'companies': (_query_list, True), 'year': (int, False), 'format': (str, False)},
+        '/peers': {'name': (str, True), 'k': (int, False), 'same_sector': (str, False), 'format': (str, False)},
+        '/chart/company': {'name': (str, True), 'profile': (str, False)},
+        '/chart/comparative': {'companies': (_query_list, True), 'profile': (str, False)},
+        '/health': {},
+    }
+    # Taille maximale des classements: un seul classement top-K est construit et partagé
+    MAX_K = 100
+    
+    def __init__(self, analyzer, df=None, cache_size=1024):
+        self.analyzer = analyzer
+        self.cache = ResponseCache(cache_size)
+        # Les graphiques sont dessinés hors écran, un à la fois
+        import matplotlib
+        matplotlib.use('Agg')
+        self.chart_lock = threading.Lock()
+        self.company_figure = None
+        self.load(df if df is not None else analyzer.get_all_companies_data())
+        self.routes = {
+            '/companies': self._companies,
+            '/company': self._company,
+            '/sector': self._sector,
+            '/top': self._top,
+            '/compare': self._compare,
+            '/peers': self._peers,
+            '/chart/company': self._company_chart,
+            '/chart/comparative': self._comparative_chart,
+            '/health': self._health,
+        }
+    
+    def load(self, df):
+        """Remplace le jeu de données; les réponses de l'ancienne version ne sont plus servies"""
+        cube = AggregateCube(df)
+        digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        self.df, self.cube, self.version = cube.df, cube, digest.hexdigest()[:16]
+    
+    def handle(self, target):
+        """Répond à une requête (chemin et paramètres): renvoie (statut, type de contenu, corps)"""
+        parsed = urllib.parse.urlsplit(target)
+        params = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+        key = (self.version, parsed.path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        response = self.cache.get(key)
+        if response is not None:
+            return response
         
-        plt.tight_layout()
-        plt.savefig('comparative_social_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        path = parsed.path.rstrip('/') or '/'
+        route = self.routes.get(path)
+        if route is None:
+            return self._error(404, f"Requête inconnue: {parsed.path}")
+        try:
+            values = self._parse_params(path, {name: values[-1] for name, values in params.items()})
+            response = route(values)
+        except QueryError as e:
+            return self._error(e.status, e.message)
+        except Exception:
+            # Détails réservés au journal du serveur
+            print(f"❌ Erreur interne sur {target}:\n{traceback.format_exc()}", file=sys.stderr)
+            return self._error(500, "Erreur interne")
+        if response[0] == 200 and parsed.path not in self.UNCACHED:
+            self.cache.put(key, response)
+        return response
+    
+    def _parse_params(self, path, params):
+        """Paramètres typés d'une requête (QueryError 400 si manquant, vide ou invalide)"""
+        values = {}
+        for name, (kind, required) in self.PARAMS[path].items():
+            if name not in params:
+                if required:
+                    raise QueryError(400, f"Paramètre manquant: {name}")
+                continue
+            try:
+                values[name] = kind(params[name].strip())
+            except ValueError:
+                raise QueryError(400, f"Paramètre invalide: {name}={params[name]}")
+            if required and not values[name]:
+                raise QueryError(400, f"Paramètre vide: {name}")
+        return values
+    
+    def _year(self, params, default=None):
+        """Année demandée (ou default); QueryError 404 si absente du jeu de données"""
+        year = params.get('year', default)
+        if year not in set(int(value) for value in self.cube.years):
+            raise QueryError(404, f"Année inconnue: {year}")
+        return year
+    
+    def _k(self, params, default=10):
+        k = params.get('k', default)
+        if not 1 <= k <= self.MAX_K:
+            raise QueryError(400, f"k doit être compris entre 1 et {self.MAX_K}")
+        return k
+    
+    def _profile(self, params):
+        profile = params.get('profile', 'preview')
+        if profile not in OUTPUT_PROFILES:
+            raise QueryError(400, f"Profil inconnu: {profile}")
+        return profile
+    
+    def _json(self, payload):
+        return 200, self.CONTENT_TYPES['json'], payload.encode('utf-8')
+    
+    def _error(self, status, message):
+        return status, self.CONTENT_TYPES['json'], json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+    
+    def _table(self, frame, columns, fmt):
+        if fmt not in REPORT_FORMATS:
+            raise QueryError(400, f"Format inconnu: {fmt}")
+        return 200, self.CONTENT_TYPES[fmt], render_table(frame, columns, fmt).encode('utf-8')
+    
+    def _companies(self, params):
+        return self._json(json.dumps({company: info['sector'] for company, info in self.analyzer.companies.items()},
+                                     ensure_ascii=False))
+    
+    def _company(self, params):
+        rows = self.cube.company_rows(params['name'])
+        if rows.empty:
+            return self._error(404, f"Entreprise inconnue: {params['name']}")
+        return self._json(rows.astype({'Company': str, 'Sector': str}).to_json(orient='records', force_ascii=False))
+    
+    def _sector(self, params):
+        sector = params['name']
+        if sector not in set(self.cube.sectors):
+            return self._error(404, f"Secteur inconnu: {sector}")
+        means = self.cube.mean.xs(sector, level='Sector')
+        if 'year' in params:
+            means = means.loc[means.index.isin([self._year(params)])]
+        return self._json(means.reset_index().to_json(orient='records', force_ascii=False))
+    
+    def _top(self, params):
+        metric = params.get('metric', 'Social Contributions (M€)')
+        if metric not in CUBE_METRICS:
+            raise QueryError(400, f"Indicateur inconnu: {metric}")
+        year = self._year(params, int(self.cube.latest_year))
+        top = self.cube.ranking(self.MAX_K).top(metric, year, params.get('sector'), self._k(params))
+        columns = RANKING_COLUMNS + ([(metric, metric, '%.2f', 15)]
+                                     if metric not in [column for _, column, _, _ in RANKING_COLUMNS] else [])
+        return self._table(top.assign(Rank=np.arange(1, len(top) + 1)), columns, params.get('format', 'json'))
+    
+    def _comparative_data(self, params):
+        companies = params['companies']
+        unknown = [company for company in companies if company not in self.analyzer.companies]
+        if unknown:
+            raise QueryError(400, f"Entreprise(s) inconnue(s): {', '.join(unknown)}")
+        return companies, self.cube.companies_rows(companies)
+    
+    def _compare(self, params):
+        companies, data = self._comparative_data(params)
+        year = self._year(params, int(data['Year'].max()))
+        latest = data[data['Year'] == year]
+        return self._table(latest, COMPARATIVE_COLUMNS, params.get('format', 'json'))
+    
+    def _peers(self, params):
+        company = params['name']
+        try:
+            peers = self.cube.peers_of(company, self._k(params),
+                                       params.get('same_sector', '0') not in ('0', 'false', ''))
+        except KeyError:
+            return self._error(404, f"Entreprise inconnue: {company}")
+        return self._table(peers, PEER_COLUMNS, params.get('format', 'json'))
+    
+    def _render(self, fig, profile, reuse=False):
+        import matplotlib.pyplot as plt
+        buffer = io.BytesIO()
+        fig.savefig(buffer, **savefig_options(profile))
+        if not reuse:
+            plt.close(fig)
+        return 200, self.CONTENT_TYPES[OUTPUT_PROFILES[profile]['format']], buffer.getvalue()
+    
+    def _company_chart(self, params):
+        rows = self.cube.company_rows(params['name'])
+        if rows.empty:
+            return self._error(404, f"Entreprise inconnue: {params['name']}")
+        profile = self._profile(params)
+        with self.chart_lock:
+            if self.company_figure is None:
+                self.company_figure = CompanyReportFigure(rows, params['name'])
+            fig = self.company_figure.update(rows, params['name'])
+            return self._render(fig, profile, reuse=True)
+    
+    def _comparative_chart(self, params):
+        companies, data = self._comparative_data(params)
+        profile = self._profile(params)
+        with self.chart_lock:
+            return self._render(plot_comparative_analysis(data, companies), profile)
+    
+    def _health(self, params):
+        return self._json(json.dumps({
+            'version': self.version, 'rows': len(self.df), 'cache_entries': len(self.cache.entries),
+            'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses}))
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """Transmet les requêtes GET au QueryService du serveur"""
+    def do_GET(self):
+        status, content_type, body = self.server.service.handle(self.path)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Dataset-Version', self.server.service.version)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def make_query_server(service, host='127.0.0.1', port=8000):
+    """Crée le serveur HTTP local (multi-thread) du service de requêtes"""
+    server = ThreadingHTTPServer((host, port), QueryRequestHandler)
+    server.service = service
+    return server
+
+def serve(analyzer, host='127.0.0.1', port=8000, df=None):
+    """Charge le jeu de données une fois et sert les requêtes jusqu'à interruption"""
+    server = make_query_server(QueryService(analyzer, df), host, port)
+    print(f"🌐 Service de requêtes sur http://{host}:{server.server_address[1]}/ (Ctrl+C pour arrêter)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 # Fonction principale
-def main():
+def main(seed=None, cache_dir=None, headless=False, workers=None, incremental=False,
+         profile_log=None, profile_dir=None, report_path=None, monte_carlo_paths=0, output_profile='print',
+         years=None, output_dir='.', compact=False):
     # Initialiser l'analyseur
-    analyzer = URSSAFAnalysis()
+    cache = DatasetCache(cache_dir) if cache_dir else None
+    profiler = StageProfiler(profile_log, profile_dir) if (profile_log or profile_dir) else None
+    analyzer = URSSAFAnalysis(seed=seed, cache=cache, headless=headless, profiler=profiler,
+                              output_profile=output_profile, years=years, output_dir=output_dir)
+    dataset_path = os.path.join(output_dir, 'urssaf_social_data_2002_2025.csv')
     
-    # Récupérer toutes les données
-    social_data = analyzer.get_all_companies_data()
+    companies_for_report = ['LVMH', 'TotalEnergies', 'L\'Oréal', 'Sanofi', 'BNP Paribas']
+    companies_for_comparison = ['LVMH', 'TotalEnergies', 'L\'Oréal', 'BNP Paribas']
+    
+    if incremental:
+        # Ne recalculer que les lignes modifiées, puis seulement les rapports concernés
+        social_data, changes = analyzer.refresh_dataset(dataset_path)
+        social_data = compact_frame(social_data) if compact else social_data
+        stale = analyzer.stale_reports(changes, companies_for_report, companies_for_comparison)
+    else:
+        # Récupérer toutes les données
+        social_data = analyzer.get_all_companies_data(workers=workers, compact=compact)
+        
+        # Sauvegarder les données dans un fichier CSV
+        analyzer.save_dataset(social_data, dataset_path)
+        stale = {'global': True, 'companies': companies_for_report, 'comparative': True}
+    
+    # En mode sans affichage, les figures sont rendues en parallèle après les rapports texte
+    plot = not headless
     
-    # Sauvegarder les données dans un fichier CSV
-    social_data.to_csv('urssaf_social_data_2002_2025.csv', index=False)
-    print(f"\n💾 Données sauvegardées dans 'urssaf_social_data_2002_2025.csv'")
+    # Agrégats calculés une seule fois pour tous les rapports
+    with analyzer.span('aggregation', rows=len(social_data)):
+        cube = AggregateCube(social_data)
     
     # Créer une analyse globale
-    analyzer.create_global_analysis_visualization(social_data)
+    if stale['global']:
+        with analyzer.span('global_report'):
+            analyzer.create_global_analysis_visualization(social_data, plot=plot, cube=cube)
+    
+    # Bandes d'incertitude Monte Carlo des rapports par entreprise (optionnelles)
+    bands = {}
+    if monte_carlo_paths and stale['companies']:
+        bands = analyzer.monte_carlo_bands(stale['companies'], monte_carlo_paths, workers=workers)
     
     # Créer des rapports spécifiques pour certaines entreprises
-    companies_for_report = ['LVMH', 'TotalEnergies', 'L\'Oréal', 'Sanofi', 'BNP Paribas']
-    for company in companies_for_report:
-        analyzer.create_company_specific_report(social_data, company)
+    for company in stale['companies']:
+        with analyzer.span('company_report', company=company):
+            analyzer.create_company_specific_report(social_data, company, plot=plot, cube=cube,
+                                                    bands=bands.get(company))
     
     # Créer une analyse comparative
-    analyzer.create_comparative_analysis(social_data, ['LVMH', 'TotalEnergies', 'L\'Oréal', 'BNP Paribas'])
+    if stale['comparative']:
+        with analyzer.span('comparative_report', companies=companies_for_comparison):
+            analyzer.create_comparative_analysis(social_data, companies_for_comparison, plot=plot, cube=cube)
+    
+    if headless:
+        analyzer.render_reports(social_data, stale['companies'],
+                                comparative=companies_for_comparison if stale['comparative'] else None,
+                                output_dir=output_dir, workers=workers, cube=cube, include_global=stale['global'], bands=bands)
     
     # Afficher un résumé des entreprises avec les cotisations les plus élevées
-    latest_year = social_data['Year'].max()
-    latest_data = social_data[social_data['Year'] == latest_year]
+    # (même classement précalculé que la figure et le rapport global)
+    latest_year = cube.latest_year
     
     print(f"\n🏆 Classement des entreprises par cotisations sociales en {latest_year}:")
-    top_social = latest_data.nlargest(10, 'Social Contributions (M€)')[['Company', 'Social Contributions (M€)', 'Social/Payroll Ratio (%)']]
-    for i, (_, row) in enumerate(top_social.iterrows(), 1):
-        print(f"{i}. {row['Company']}: {row['Social Contributions (M€)']:.0f} M€ (Ratio: {row['Social/Payroll Ratio (%)']:.1f}%)")
+    top_social = cube.nlargest(10, 'Social Contributions (M€)', latest_year)
+    print('\n'.join(format_lines(top_social.assign(Rank=np.arange(1, len(top_social) + 1)), [
+        ('Rank', '%d'), '. ', ('Company', '%s'), ': ', ('Social Contributions (M€)', '%.0f'), ' M€ ',
+        '(Ratio: ', ('Social/Payroll Ratio (%)', '%.1f'), '%)'])))
+    
+    if report_path:
+        analyzer.write_text_report(os.path.join(output_dir, report_path), cube, companies_for_report, companies_for_comparison, peers=5)
+
+def _year_range(value):
+    """Période de la ligne de commande: 'AAAA-AAAA' ou une seule année"""
+    start, _, end = value.partition('-')
+    try:
+        start, end = int(start), int(end or start)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"période invalide: {value} (attendu par exemple 2002-2025)")
+    if start < BASE_YEAR or end < start:
+        raise argparse.ArgumentTypeError(f"période invalide: {value} (début à partir de {BASE_YEAR})")
+    return np.arange(start, end + 1)
+
+def _cli_dataset(analyzer, args):
+    """Jeu de données d'une commande: index d'exports (--index), fichier CSV (--input) ou génération"""
+    if args.index:
+        df = analyzer.get_bulk_data(args.index, compact=args.compact)
+        return df[df['Year'].isin(analyzer.years)].reset_index(drop=True)
+    if args.input:
+        df = pd.read_csv(args.input)
+        df = df[df['Year'].isin(analyzer.years)].reset_index(drop=True)
+        return compact_frame(df) if args.compact else df
+    return analyzer.get_all_companies_data(workers=args.workers, compact=args.compact)
+
+def _cli_chunks(analyzer, args):
+    """
+    Blocs du jeu de données d'une commande d'export (mêmes sources que
+    _cli_dataset), lus ou générés args.chunk_size entreprises à la fois
+    """
+    if args.index:
+        index = BulkIndex(args.index)
+        for start in range(0, len(index.keys), args.chunk_size):
+            df = analyzer.get_bulk_data(index, index.keys[start:start + args.chunk_size], compact=args.compact)
+            yield df[df['Year'].isin(analyzer.years)].reset_index(drop=True)
+    elif args.input:
+        for df in pd.read_csv(args.input, chunksize=args.chunk_size * len(analyzer.years)):
+            df = df[df['Year'].isin(analyzer.years)].reset_index(drop=True)
+            if len(df):
+                yield compact_frame(df) if args.compact else df
+    else:
+        for df in analyzer.iter_company_chunks(args.chunk_size):
+            yield compact_frame(df) if args.compact else df
+
+def _add_common_options(parser):
+    parser.add_argument('--seed', type=int, help="graine des simulations (séries reproductibles)")
+    parser.add_argument('--years', type=_year_range, help="période analysée, par exemple 2010-2025")
+    parser.add_argument('--input', help="jeu de données CSV existant au lieu d'une génération")
+    parser.add_argument('--index', help="index d'exports en masse (voir la commande ingest) au lieu d'une génération")
+    parser.add_argument('--output-dir', help="répertoire des fichiers produits")
+    parser.add_argument('--headless', action='store_true', help="aucune fenêtre: figures enregistrées puis fermées")
+    parser.add_argument('--cache-dir', help="cache disque des jeux de données générés")
+    parser.add_argument('--workers', type=int, help="nombre de processus de calcul et de rendu")
+    parser.add_argument('--profile', choices=list(OUTPUT_PROFILES), help="profil de sortie des figures")
+    parser.add_argument('--compact', action='store_true',
+                        help="disposition mémoire compacte (float32, indicateurs calculés à la demande)")
+
+def cli(argv=None):
+    """
+    Ligne de commande. Sans sous-commande, exécute toute l'analyse (main).
+    matplotlib, requests et pyarrow ne sont importés que par les commandes
+    qui en ont besoin: rank, export et les rapports --no-plot démarrent vite.
+    """
+    # Options communes acceptées avant ou après la sous-commande; côté
+    # sous-commande, elles n'écrasent pas les valeurs déjà données
+    common = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    _add_common_options(common)
+    
+    parser = argparse.ArgumentParser(description="Analyses des données URSSAF des grandes entreprises françaises")
+    _add_common_options(parser)
+    parser.set_defaults(output_dir='.', profile='print')
+    commands = parser.add_subparsers(dest='command')
+    
+    run = commands.add_parser('run', parents=[common], help="analyse complète (comportement par défaut)")
+    run.add_argument('--incremental', action='store_true', help="ne recalculer que les lignes modifiées")
+    run.add_argument('--text-report', help="rapport texte (.txt, .md, .html ou .json)")
+    run.add_argument('--monte-carlo', type=int, default=0, help="trajectoires Monte Carlo par entreprise")
+    
+    generate = commands.add_parser('generate', parents=[common], help="génère et sauvegarde le jeu de données")
+    generate.add_argument('--output', default='urssaf_social_data_2002_2025.csv', help="fichier CSV produit")
+    generate.add_argument('--incremental', action='store_true', help="ne recalculer que les lignes modifiées")
+    
+    export = commands.add_parser('export', parents=[common], help="exporte le jeu de données ou les rapports texte")
+    export.add_argument('--format', choices=['csv', 'csv.gz', 'parquet'] + list(REPORT_FORMATS), default='csv')
+    export.add_argument('--output', required=True, help="fichier (ou répertoire parquet) produit")
+    export.add_argument('--chunk-size', type=int, default=1000, help="entreprises par bloc")
+    
+    report = commands.add_parser('report', parents=[common], help="rapport détaillé d'une ou plusieurs entreprises")
+    report.add_argument('companies', nargs='+', metavar='company')
+    report.add_argument('--no-plot', action='store_true', help="rapport texte seulement")
+    report.add_argument('--monte-carlo', type=int, default=0, help="trajectoires Monte Carlo par entreprise")
+    
+    compare = commands.add_parser('compare', parents=[common], help="analyse comparative de plusieurs entreprises")
+    compare.add_argument('companies', nargs='+', metavar='company')
+    compare.add_argument('--no-plot', action='store_true', help="tableau comparatif seulement")
+    
+    peers = commands.add_parser('peers', parents=[common], help="entreprises les plus comparables et analyse comparative")
+    peers.add_argument('company')
+    peers.add_argument('-k', type=int, default=5, help="nombre d'entreprises comparables")
+    peers.add_argument('--same-sector', action='store_true', help="pairs limités au secteur de l'entreprise")
+    peers.add_argument('--no-plot', action='store_true', help="tableaux seulement")
+    
+    rank = commands.add_parser('rank', parents=[common], help="classement des entreprises pour une année")
+    rank.add_argument('--year', type=int, help="année du classement (dernière année par défaut)")
+    rank.add_argument('--metric', choices=CUBE_METRICS, default='Social Contributions (M€)')
+    rank.add_argument('-k', type=int, default=10, help="nombre d'entreprises classées")
+    rank.add_argument('--sector', help="classement limité à un secteur")
+    rank.add_argument('--format', choices=list(REPORT_FORMATS), default='txt')
+    
+    ingest = commands.add_parser('ingest', parents=[common], help="indexe des exports en masse URSSAF (CSV ou XML)")
+    ingest.add_argument('files', nargs='+', metavar='file')
+    ingest.add_argument('--index-dir', default='urssaf_bulk_index', help="répertoire de l'index produit")
+    ingest.add_argument('--sep', default=';', help="séparateur des exports CSV")
+    ingest.add_argument('--record-tag', default='record', help="élément XML d'une ligne d'export")
+    ingest.add_argument('--chunk-rows', type=int, default=100_000, help="lignes lues par bloc")
+    
+    commands.add_parser('memory', parents=[common], help="occupation mémoire du panel selon sa disposition")
+    
+    serve_parser = commands.add_parser('serve', parents=[common], help="service de requêtes HTTP local")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    
+    args = parser.parse_args(argv)
+    if args.headless:
+        # Avant tout import de matplotlib.pyplot: aucun backend graphique
+        os.environ['MPLBACKEND'] = 'Agg'
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.command in (None, 'run'):
+        main(seed=args.seed, cache_dir=args.cache_dir, headless=args.headless, workers=args.workers,
+             incremental=getattr(args, 'incremental', False), report_path=getattr(args, 'text_report', None),
+             monte_carlo_paths=getattr(args, 'monte_carlo', 0), output_profile=args.profile,
+             years=args.years, output_dir=args.output_dir, compact=args.compact)
+        return 0
+    
+    analyzer = URSSAFAnalysis(seed=args.seed, cache=DatasetCache(args.cache_dir) if args.cache_dir else None,
+                              headless=args.headless, years=args.years, output_profile=args.profile,
+                              output_dir=args.output_dir)
+    
+    if args.command == 'generate':
+        path = os.path.join(args.output_dir, args.output)
+        if args.incremental:
+            analyzer.refresh_dataset(path)
+        else:
+            analyzer.save_dataset(analyzer.get_all_companies_data(workers=args.workers), path)
+        return 0
+    
+    if args.command == 'export':
+        path = os.path.join(args.output_dir, args.output)
+        if args.format in REPORT_FORMATS:
+            analyzer.write_text_report(path, AggregateCube(_cli_dataset(analyzer, args)), fmt=args.format)
+        else:
+            analyzer.export_streaming(path, args.format, args.chunk_size, chunks=_cli_chunks(analyzer, args))
+        return 0
+    
+    if args.command == 'ingest':
+        analyzer.ingest_bulk(args.files, os.path.join(args.output_dir, args.index_dir),
+                             chunk_rows=args.chunk_rows, sep=args.sep, record_tag=args.record_tag)
+        return 0
+    
+    if args.command == 'serve':
+        serve(analyzer, args.host, args.port, _cli_dataset(analyzer, args) if args.input or args.index else None)
+        return 0
+    
+    df = _cli_dataset(analyzer, args)
+    if args.index and args.command in ('report', 'compare', 'peers'):
+        # Entreprises désignées par SIREN ou par nom dans l'index
+        index = BulkIndex(args.index)
+        def resolve(company):
+            return index.companies[index.key_index[company]] if company in index.key_index else company
+        if args.command == 'peers':
+            args.company = resolve(args.company)
+        else:
+            args.companies = [resolve(company) for company in args.companies]
+    if args.command == 'memory':
+        analyzer.memory_report(df)
+        return 0
+    
+    cube = AggregateCube(df)
+    
+    if args.command == 'rank':
+        year = args.year if args.year is not None else cube.latest_year
+        top = cube.nlargest(args.k, args.metric, year, args.sector)
+        print(f"\n🏆 Classement des entreprises ({args.metric}) en {year}:")
+        columns = RANKING_COLUMNS + ([(args.metric, args.metric, '%.2f', 15)]
+                                     if args.metric not in [column for _, column, _, _ in RANKING_COLUMNS] else [])
+        print(render_table(top.assign(Rank=np.arange(1, len(top) + 1)), columns, args.format))
+        return 0
+    
+    if args.command == 'report':
+        bands = {}
+        if args.monte_carlo:
+            bands = analyzer.monte_carlo_bands(args.companies, args.monte_carlo, workers=args.workers)
+        for company in args.companies:
+            analyzer.create_company_specific_report(df, company, plot=not args.no_plot, cube=cube,
+                                                    bands=bands.get(company))
+        analyzer.close_figures()
+        return 0
+    
+    if args.command == 'compare':
+        analyzer.create_comparative_analysis(df, args.companies, plot=not args.no_plot, cube=cube)
+        return 0
+    
+    if args.command == 'peers':
+        peers = analyzer.create_peer_analysis(df, args.company, args.k, plot=not args.no_plot, cube=cube,
+                                              same_sector=args.same_sector)
+        return 0 if peers is not None else 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai des étapes du pipeline URSSAF (génération, indicateurs calculés,
+agrégation, rapports, enregistrement des figures) sur des univers
+d'entreprises synthétiques, hors ligne.
+
+    python3 benchmark.py --sizes 20 1000 10000 100000 --output bench.json
+    python3 benchmark.py --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+import Urssaf
+
+DEFAULT_SIZES = [20, 1000, 10000, 100000]
+
+def make_synthetic_universe(analyzer, n_companies, seed=0):
+    """Remplace le registre par n_companies entreprises (réelles puis synthétiques)"""
+    rng = np.random.default_rng(seed)
+    real = list(analyzer.companies.items())
+    companies = dict(real[:n_companies])
+    sectors = sorted({info['sector'] for _, info in real})
+
+    for i in range(n_companies - len(companies)):
+        employees = int(rng.lognormal(9, 1.2)) + 50
+        companies[f'Entreprise {i:06d}'] = {
+            'sector': sectors[i % len(sectors)],
+            'employees': employees,
+            'payroll': employees * rng.uniform(35, 65) * 1000,
+        }
+    analyzer.companies = companies
+
+def _proc_status_mb(field):
+    """Valeur d'un champ mémoire de /proc/self/status (Mo), ou None hors Linux"""
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss():
+    """Remet à zéro le pic RSS du processus (Linux); False si impossible"""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb():
+    """Pic de mémoire résidente (Mo): depuis la dernière remise à zéro sous Linux, sinon du processus entier"""
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        # Windows: ni /proc ni getrusage
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets sous Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def _measure(results, size, stage, rows, func):
+    """
+    Exécute une étape en silence et enregistre sa durée, son débit et sa
+    mémoire: pic RSS de l'étape seule lorsque le système permet de remettre
+    le pic à zéro (peak_rss_scope 'stage'), sinon pic cumulé du processus
+    ('process'), et variation du RSS courant
+    """
+    rss_before = _proc_status_mb('VmRSS')
+    scope = 'stage' if _reset_peak_rss() else 'process'
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        value = func()
+    seconds = time.perf_counter() - start
+    peak = _peak_rss_mb()
+    rss_after = _proc_status_mb('VmRSS')
+
+    results.append({
+        'companies': size,
+        'stage': stage,
+        'seconds': round(seconds, 6),
+        'rows': rows,
+        'rows_per_s': round(rows / seconds, 1) if seconds > 0 else None,
+        'peak_rss_mb': round(peak, 1),
+        'peak_rss_scope': scope,
+        'rss_delta_mb': round(rss_after - rss_before, 1) if rss_before is not None else None,
+    })
+    print(f"   {stage:<22} {seconds:>9.3f} s  {rows:>10} lignes  {peak:>8.1f} Mo ({scope})")
+    return value
+
+def run_size(size, dpi=100, report_companies=5):
+    """Mesure toutes les étapes pour un univers de size entreprises"""
+    results = []
+    analyzer = Urssaf.URSSAFAnalysis(seed=42, headless=True)
+    make_synthetic_universe(analyzer, size)
+    n_rows = size * len(analyzer.years)
+
+    df = _measure(results, size, 'generation', n_rows, analyzer.get_all_companies_data)
+    # Indicateurs calculés seuls, à partir des séries déjà générées
+    batch = analyzer.simulate_companies_batch()
+    metrics = _measure(results, size, 'derived_columns', n_rows, lambda: Urssaf.derive_company_metrics(batch))
+    _measure(results, size, 'frame_build', n_rows,
+             lambda: Urssaf.build_companies_frame(batch, analyzer.social_rates, metrics))
+    cube = _measure(results, size, 'aggregation', n_rows, lambda: Urssaf.AggregateCube(df))
+
+    sample = list(analyzer.companies)[:report_companies]
+    _measure(results, size, 'global_report', n_rows,
+             lambda: analyzer.create_global_analysis_visualization(df, plot=False, cube=cube))
+    _measure(results, size, 'company_reports', len(sample) * len(analyzer.years),
+             lambda: [analyzer.create_company_specific_report(df, c, plot=False, cube=cube) for c in sample])
+    _measure(results, size, 'comparative_report', len(sample) * len(analyzer.years),
+             lambda: analyzer.create_comparative_analysis(df, sample[:4], plot=False, cube=cube))
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        _measure(results, size, 'savefig_global', n_rows,
+                 lambda: Urssaf._render_figure_job({
+                     'kind': 'global', 'name': 'global', 'data': df, 'cube': cube, 'dpi': dpi,
+                     'path': os.path.join(output_dir, 'global.png')}))
+        _measure(results, size, 'savefig_company', len(analyzer.years),
+                 lambda: Urssaf._render_figure_job({
+                     'kind': 'company', 'name': sample[0], 'data': cube.company_rows(sample[0]),
+                     'dpi': dpi, 'path': os.path.join(output_dir, 'company.png')}))
+    return results
+
+def _run_size_in_child(args):
+    # Un processus par taille: hors Linux, le pic RSS cumulé ne dépend pas des tailles précédentes
+    size, dpi = args
+    print(f"\n⏱️ Univers de {size} entreprises")
+    return run_size(size, dpi=dpi)
+
+def compare(current, previous_path, threshold=1.2, floor=0.01):
+    """
+    Compare les durées à un précédent fichier de résultats et signale les
+    régressions. Les étapes de moins de floor secondes dans les deux passages
+    ne sont pas signalées: leur écart relatif n'est que du bruit.
+    """
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    reference = {(r['companies'], r['stage']): r['seconds'] for r in previous['results']}
+
+    print(f"\n📊 Comparaison avec '{previous_path}' ({previous['timestamp']}):")
+    regressions = 0
+    for result in current['results']:
+        before = reference.get((result['companies'], result['stage']))
+        if not before:
+            continue
+        ratio = result['seconds'] / before
+        regressed = ratio > threshold and max(result['seconds'], before) >= floor
+        flag = '⚠️' if regressed else '  '
+        regressions += regressed
+        print(f"{flag} {result['companies']:>7} {result['stage']:<22} {before:>9.3f} s -> {result['seconds']:>9.3f} s (x{ratio:.2f})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="tailles d'univers (nombre d'entreprises)")
+    parser.add_argument('--dpi', type=int, default=100, help="résolution des figures mesurées")
+    parser.add_argument('--output', default='benchmark_results.json', help="fichier JSON des résultats")
+    parser.add_argument('--compare', help="fichier JSON d'un précédent passage à comparer")
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help="durée en dessous de laquelle un écart n'est pas signalé")
+    args = parser.parse_args(argv)
+
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for size in args.sizes:
+        with ctx.Pool(1) as pool:
+            results.extend(pool.apply(_run_size_in_child, ((size, args.dpi),)))
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    # Comparer avant d'écrire: --output peut désigner le fichier de référence
+    regressions = compare(report, args.compare, floor=args.min_seconds) if args.compare else 0
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Résultats sauvegardés dans '{args.output}'")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
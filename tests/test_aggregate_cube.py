@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+
+@pytest.fixture(scope='module')
+def df():
+    df = Urssaf.URSSAFAnalysis(seed=13, headless=True).get_all_companies_data()
+    # Lignes mélangées: le cube ne doit rien supposer de l'ordre d'entrée
+    return df.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def cube(df):
+    return Urssaf.AggregateCube(df)
+
+
+def test_aggregates_match_groupby(df, cube):
+    grouped = df.groupby(['Sector', 'Year'], observed=True)[Urssaf.CUBE_METRICS]
+    
+    pd.testing.assert_frame_equal(cube.mean.sort_index(), grouped.mean().sort_index())
+    pd.testing.assert_series_equal(cube.count.sort_index(), grouped.size().sort_index())
+    pd.testing.assert_frame_equal(cube.quantiles.sort_index(),
+                                  grouped.quantile([0.25, 0.5, 0.75]).sort_index())
+    
+    sector, year = 'Luxe', 2010
+    rows = df[(df['Sector'] == sector) & (df['Year'] == year)]
+    assert cube.sector_mean(sector, year, 'Payroll (M€)') == pytest.approx(rows['Payroll (M€)'].mean())
+    pd.testing.assert_series_equal(cube.year_mean('Employees'), df.groupby('Year')['Employees'].mean())
+
+
+def test_row_indexes(df, cube):
+    for company in ('LVMH', 'TotalEnergies'):
+        pd.testing.assert_frame_equal(cube.company_rows(company), df[df['Company'] == company])
+    pd.testing.assert_frame_equal(cube.sector_rows('Luxe'), df[df['Sector'] == 'Luxe'])
+    np.testing.assert_array_equal(cube.sector_values('Luxe', 'Employees'),
+                                  df.loc[df['Sector'] == 'Luxe', 'Employees'].to_numpy())
+    
+    both = cube.companies_rows(['Sanofi', 'LVMH'])
+    assert list(both['Company'].unique()) == ['Sanofi', 'LVMH']
+    assert len(both) == 2 * len(cube.years)
+    
+    assert cube.company_rows('Inconnue').empty
+    assert cube.sector_rows('Inconnu').empty
+    assert cube.companies_rows([]).empty
+
+
+def test_metadata_and_nlargest(df, cube):
+    np.testing.assert_array_equal(cube.years, np.sort(df['Year'].unique()))
+    assert cube.latest_year == df['Year'].max()
+    assert sorted(cube.sectors) == sorted(df['Sector'].unique())
+    assert sum(len(chunk) for chunk in cube.iter_chunks(100)) == len(df)
+    
+    metric = 'Social Contributions (M€)'
+    top = cube.nlargest(5, metric, year=cube.latest_year)
+    expected = df[df['Year'] == cube.latest_year].nlargest(5, metric)
+    assert list(top['Company'].astype(str)) == list(expected['Company'].astype(str))
+
+
+def test_compact_layout_gives_same_aggregates(df, cube):
+    compact = Urssaf.AggregateCube(Urssaf.compact_frame(df))
+    pd.testing.assert_frame_equal(compact.mean.sort_index(), cube.mean.sort_index(),
+                                  check_dtype=False, check_index_type=False, rtol=1e-5)
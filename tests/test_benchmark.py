@@ -0,0 +1,24 @@
+import json
+import math
+import sys
+
+import benchmark
+
+
+def results(seconds):
+    return {'timestamp': 'now', 'results': [{'companies': 20, 'stage': stage, 'seconds': value}
+                                            for stage, value in seconds.items()]}
+
+
+def test_compare_ignores_sub_floor_noise(tmp_path):
+    previous = tmp_path / 'previous.json'
+    previous.write_text(json.dumps(results({'tiny': 0.0004, 'slow': 1.0, 'steady': 2.0})))
+    current = results({'tiny': 0.002, 'slow': 1.5, 'steady': 2.1})
+    assert benchmark.compare(current, str(previous)) == 1
+    assert benchmark.compare(current, str(previous), floor=0) == 2
+
+
+def test_peak_rss_without_proc_or_resource(monkeypatch):
+    monkeypatch.setattr(benchmark, '_proc_status_mb', lambda field: None)
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    assert math.isnan(benchmark._peak_rss_mb())
@@ -0,0 +1,126 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+RATES = {str(year): 40.0 for year in range(2015, 2021)}
+COLUMNS = ['siren', 'raison_sociale', 'secteur_na17', 'annee', 'effectifs_salaries', 'masse_salariale']
+
+
+def export_rows(n_companies=40, seed=0):
+    """Lignes d'établissements: plusieurs par (entreprise, année), dans le désordre"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_companies):
+        siren = f"{i:09d}"
+        name = 'Homonyme' if i in (3, 7) else f"Entreprise {i}"
+        for year in range(2015, 2021):
+            for _ in range(rng.integers(1, 4)):
+                rows.append([siren, name, f"Secteur {i % 3}", year,
+                             int(rng.integers(1, 500)), float(rng.integers(10_000, 1_000_000))])
+    rows = [rows[i] for i in rng.permutation(len(rows))]
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def write_xml(df, path):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write('<export>')
+        for row in df.itertuples(index=False):
+            f.write('<record>' + ''.join(f'<{column}>{value}</{column}>' for column, value in zip(COLUMNS, row))
+                    + '</record>')
+        f.write('</export>')
+
+
+@pytest.fixture
+def export(tmp_path):
+    df = export_rows()
+    path = tmp_path / 'export.csv'
+    df.to_csv(path, sep=';', index=False)
+    return df, str(path)
+
+
+def expected_totals(df):
+    return df.groupby(['siren', 'annee'])[['effectifs_salaries', 'masse_salariale']].sum()
+
+
+def test_csv_ingest_matches_groupby(export, tmp_path):
+    df, path = export
+    index = Urssaf.BulkIndex.build([path], str(tmp_path / 'index'), chunk_rows=37)
+    assert index.rows_read == len(df)
+    assert list(index.years) == list(range(2015, 2021))
+    
+    records = np.asarray(index.records)
+    order = np.lexsort((records['year'], records['key']))
+    assert np.array_equal(order, np.arange(len(records)))
+    
+    batch = index.batch(RATES)
+    totals = expected_totals(df)
+    for i, key in enumerate(index.keys):
+        np.testing.assert_allclose(batch['Employees'][i], totals.loc[key, 'effectifs_salaries'].to_numpy())
+        np.testing.assert_allclose(batch['Payroll (M€)'][i], totals.loc[key, 'masse_salariale'].to_numpy() / 1e6)
+
+
+def test_chunk_size_does_not_change_index(export, tmp_path):
+    df, path = export
+    small = Urssaf.BulkIndex.build([path], str(tmp_path / 'small'), chunk_rows=5)
+    large = Urssaf.BulkIndex.build([path], str(tmp_path / 'large'), chunk_rows=100_000)
+    assert small.keys == large.keys
+    for column in ('Employees', 'Payroll (M€)'):
+        np.testing.assert_allclose(small.batch(RATES)[column], large.batch(RATES)[column])
+
+
+def test_xml_ingest_matches_csv(export, tmp_path):
+    df, path = export
+    xml_path = str(tmp_path / 'export.xml.gz')
+    write_xml(df, xml_path)
+    from_csv = Urssaf.BulkIndex.build([path], str(tmp_path / 'csv'), chunk_rows=50)
+    from_xml = Urssaf.BulkIndex.build([xml_path], str(tmp_path / 'xml'), chunk_rows=50)
+    assert from_xml.keys == from_csv.keys
+    assert from_xml.companies == from_csv.companies
+    np.testing.assert_allclose(from_xml.batch(RATES)['Payroll (M€)'], from_csv.batch(RATES)['Payroll (M€)'])
+
+
+def test_duplicate_names_are_disambiguated(export, tmp_path):
+    df, path = export
+    index = Urssaf.BulkIndex.build([path], str(tmp_path / 'index'))
+    assert 'Homonyme (000000003)' in index.companies
+    assert 'Homonyme (000000007)' in index.companies
+    assert 'Homonyme' not in index.companies
+    assert 'Entreprise 5' in index.companies
+
+
+def test_lookup_by_siren_or_name(export, tmp_path):
+    df, path = export
+    index = Urssaf.BulkIndex.build([path], str(tmp_path / 'index'))
+    by_siren = index.company_rows('000000005', RATES)
+    by_name = index.company_rows('Entreprise 5', RATES)
+    assert len(by_siren) == 6
+    pd.testing.assert_frame_equal(by_siren, by_name)
+    expected = expected_totals(df).loc['000000005', 'effectifs_salaries'].to_numpy()
+    np.testing.assert_allclose(by_siren['Employees'], expected)
+    assert index.company_rows('999999999', RATES).empty
+
+
+def test_rows_without_siren_are_keyed_by_name(tmp_path):
+    path = tmp_path / 'export.csv'
+    pd.DataFrame([['', 'Sans Siren', 'S', 2020, 10, 100_000.0],
+                  ['', 'Sans Siren', 'S', 2020, 5, 50_000.0]], columns=COLUMNS).to_csv(path, sep=';', index=False)
+    index = Urssaf.BulkIndex.build([str(path)], str(tmp_path / 'index'))
+    assert index.keys == ['Sans Siren']
+    assert index.company_rows('Sans Siren', {'2020': 40.0})['Employees'].tolist() == [15]
+
+
+def test_missing_employees_give_unknown_average_salary(tmp_path):
+    path = tmp_path / 'export.csv'
+    pd.DataFrame([['1', 'A', 'S', 2020, '', 100_000.0],
+                  ['2', 'B', 'S', 2020, 10, 400_000.0]], columns=COLUMNS).to_csv(path, sep=';', index=False)
+    index = Urssaf.BulkIndex.build([str(path)], str(tmp_path / 'index'))
+    df = Urssaf.build_companies_frame(index.batch({'2020': 40.0}), {'2020': 40.0})
+    salaries = df.set_index('Company')['Avg Salary (€)']
+    assert np.isnan(salaries['A'])
+    assert salaries['B'] == 40_000
+    # L'entreprise sans effectif connu ne tire pas la moyenne du secteur vers zéro
+    assert Urssaf.AggregateCube(df).mean.loc[('S', 2020), 'Avg Salary (€)'] == 40_000
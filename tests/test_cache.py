@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import Urssaf
+
+
+def frame(rows=50, start=0):
+    return pd.DataFrame({
+        'Company': [f"C{i}" for i in range(start, start + rows)],
+        'Year': np.arange(rows, dtype=np.int16) + 2000,
+        'Payroll Mass (M€)': np.linspace(1.0, 2.0, rows),
+    })
+
+
+def test_round_trip(tmp_path):
+    cache = Urssaf.DatasetCache(str(tmp_path))
+    df = frame()
+    key = cache.make_key({'A': {}}, {'x': 0.1}, [2020, 2021], seed=1)
+    
+    assert cache.load(key) is None
+    cache.store(key, df)
+    pd.testing.assert_frame_equal(cache.load(key), df, check_dtype=False)
+
+
+def test_key_depends_on_every_input(tmp_path):
+    cache = Urssaf.DatasetCache(str(tmp_path))
+    base = dict(companies={'A': {'sector': 'Luxe'}}, social_rates={'x': 0.1}, years=[2020, 2021], seed=1)
+    key = cache.make_key(**base)
+    
+    assert key == cache.make_key(**base)
+    assert key == cache.make_key(**{**base, 'years': np.array([2020, 2021])})
+    for change in ({'companies': {'A': {'sector': 'Énergie'}}}, {'social_rates': {'x': 0.2}},
+                   {'years': [2020]}, {'seed': 2}, {'history': 'abc'}):
+        assert cache.make_key(**{**base, **change}) != key
+
+
+def test_eviction_keeps_most_recently_used(tmp_path):
+    cache = Urssaf.DatasetCache(str(tmp_path))
+    keys = ['first', 'second', 'third']
+    for i, key in enumerate(keys):
+        cache.store(key, frame(start=i * 50))
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    size = os.path.getsize(cache._path('first'))
+    
+    # Une lecture rafraîchit l'entrée la plus ancienne
+    cache.load('first')
+    cache.max_bytes = 2 * size + size // 2
+    cache.evict()
+    
+    assert cache.load('second') is None
+    assert cache.load('first') is not None
+    assert cache.load('third') is not None
+
+
+def test_analysis_uses_cache(tmp_path):
+    cache = Urssaf.DatasetCache(str(tmp_path))
+    names = ['LVMH', 'Sanofi']
+    first = Urssaf.URSSAFAnalysis(seed=5, cache=cache).get_all_companies_data(names)
+    assert len(os.listdir(tmp_path)) == 1
+    
+    second = Urssaf.URSSAFAnalysis(seed=5, cache=cache).get_all_companies_data(names)
+    pd.testing.assert_frame_equal(second, first, check_dtype=False, check_categorical=False)
+    
+    Urssaf.URSSAFAnalysis(seed=6, cache=cache).get_all_companies_data(names)
+    assert len(os.listdir(tmp_path)) == 2
+    
+    cache.invalidate()
+    assert os.listdir(tmp_path) == []
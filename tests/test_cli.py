@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import urllib.request
+
+import matplotlib
+import pandas as pd
+import pytest
+
+matplotlib.use('Agg')
+
+import Urssaf
+
+COMMON = ['--seed', '5', '--headless', '--output-dir', 'out', '--profile', 'preview']
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # cli() fixe MPLBACKEND: restauré après chaque test
+    monkeypatch.setenv('MPLBACKEND', 'Agg')
+    return tmp_path
+
+
+def outputs():
+    return sorted(os.listdir('out'))
+
+
+def test_run(capsys):
+    assert Urssaf.cli(['run', *COMMON, '--text-report', 'rapport.md']) == 0
+    assert 'urssaf_social_data_2002_2025.csv' in outputs()
+    assert 'rapport.md' in outputs()
+    assert any(name.endswith('_social_analysis_2002_2025.png') for name in outputs())
+
+
+def test_generate_and_incremental():
+    assert Urssaf.cli(['generate', *COMMON, '--output', 'panel.csv', '--years', '2015-2020']) == 0
+    df = pd.read_csv('out/panel.csv')
+    assert set(df['Year']) == set(range(2015, 2021))
+    assert len(df) == 6 * len(Urssaf.URSSAFAnalysis().companies)
+    
+    assert Urssaf.cli(['generate', *COMMON, '--output', 'panel.csv', '--years', '2015-2020', '--incremental']) == 0
+    pd.testing.assert_frame_equal(pd.read_csv('out/panel.csv'), df)
+
+
+@pytest.mark.parametrize('fmt, output', [('csv.gz', 'panel.csv.gz'), ('md', 'rapport.md')])
+def test_export(fmt, output):
+    assert Urssaf.cli(['export', *COMMON, '--format', fmt, '--output', output, '--chunk-size', '7']) == 0
+    assert os.path.getsize(os.path.join('out', output)) > 0
+    if fmt == 'csv.gz':
+        assert len(pd.read_csv('out/panel.csv.gz')) == 24 * len(Urssaf.URSSAFAnalysis().companies)
+
+
+def test_rank(capsys):
+    assert Urssaf.cli(['rank', *COMMON, '--year', '2020', '-k', '3', '--sector', 'Luxe', '--format', 'json']) == 0
+    out = capsys.readouterr().out
+    records = json.loads(out[out.index('['):])
+    assert [record['Rang'] for record in records] == [1, 2, 3]
+
+
+def test_report_and_compare(capsys):
+    assert Urssaf.cli(['report', 'LVMH', 'Sanofi', *COMMON]) == 0
+    assert outputs() == ['LVMH_social_analysis_2002_2025.png', 'Sanofi_social_analysis_2002_2025.png']
+    assert Urssaf.cli(['compare', 'LVMH', 'Kering', *COMMON, '--no-plot']) == 0
+    assert 'Kering' in capsys.readouterr().out
+
+
+def test_peers():
+    assert Urssaf.cli(['peers', 'Kering', *COMMON, '-k', '3', '--same-sector', '--no-plot']) == 0
+    assert Urssaf.cli(['peers', 'Inconnue', *COMMON, '--no-plot']) == 1
+
+
+def test_memory(capsys):
+    assert Urssaf.cli(['memory', *COMMON, '--years', '2020-2025']) == 0
+    assert 'Mémoire du panel' in capsys.readouterr().out
+
+
+def test_ingest_then_report(capsys):
+    rows = pd.DataFrame({
+        'siren': ['000000001', '000000001', '000000002'],
+        'raison_sociale': ['Alpha', 'Alpha', 'Beta'],
+        'secteur_na17': ['Industrie', 'Industrie', 'Banque'],
+        'annee': [2020, 2021, 2021],
+        'effectifs_salaries': [10, 12, 30],
+        'masse_salariale': [400_000.0, 500_000.0, 1_500_000.0],
+    })
+    rows.to_csv('export.csv', sep=';', index=False)
+    assert Urssaf.cli(['ingest', 'export.csv', *COMMON, '--index-dir', 'index']) == 0
+    assert os.path.isdir('out/index')
+    
+    # Entreprise désignée par son SIREN dans l'index
+    assert Urssaf.cli(['report', '000000001', *COMMON, '--index', 'out/index', '--no-plot']) == 0
+    assert 'Alpha' in capsys.readouterr().out
+
+
+def test_serve(monkeypatch):
+    responses = []
+    make_query_server = Urssaf.make_query_server
+    
+    def one_request_server(service, host, port):
+        server = make_query_server(service, host, 0)
+        serve_forever = server.serve_forever
+        
+        def serve_once():
+            thread = threading.Thread(target=serve_forever)
+            thread.start()
+            try:
+                url = f"http://{host}:{server.server_address[1]}/top?k=2&year=2020"
+                with urllib.request.urlopen(url) as response:
+                    responses.append(json.loads(response.read()))
+            finally:
+                server.shutdown()
+                thread.join()
+            raise KeyboardInterrupt
+        server.serve_forever = serve_once
+        return server
+    
+    monkeypatch.setattr(Urssaf, 'make_query_server', one_request_server)
+    assert Urssaf.cli(['serve', *COMMON, '--years', '2018-2020']) == 0
+    assert len(responses[0]) == 2
+
+
+def test_invalid_arguments():
+    with pytest.raises(SystemExit):
+        Urssaf.cli(['rank', '--metric', 'Inconnue'])
+    with pytest.raises(SystemExit):
+        Urssaf.cli(['export', *COMMON])
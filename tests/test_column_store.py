@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+METRIC = 'Social Contributions (M€)'
+
+
+@pytest.fixture(scope='module')
+def backends(tmp_path_factory):
+    analyzer = Urssaf.URSSAFAnalysis(seed=8, headless=True)
+    cube = Urssaf.AggregateCube(analyzer.get_all_companies_data())
+    directory = str(tmp_path_factory.mktemp('store'))
+    Urssaf.ColumnStore.write(analyzer, directory, chunk_size=2)
+    # Petits blocs: les agrégats sont cumulés sur plusieurs blocs par partition
+    return cube, Urssaf.ColumnStore(directory, block_rows=50)
+
+
+def plain(df):
+    df = df.astype({'Company': str, 'Sector': str, 'Year': int})
+    return df.astype({column: np.float64 for column in Urssaf.CUBE_METRICS}).reset_index(drop=True)
+
+
+def by_sector_year(aggregate):
+    # Le cube indexe par secteur catégoriel: comparaison sur un index ordinaire
+    index = pd.MultiIndex.from_tuples([(str(sector), int(year)) for sector, year in aggregate.index],
+                                      names=['Sector', 'Year'])
+    return aggregate.set_axis(index, axis=0).sort_index()
+
+
+def test_aggregates(backends):
+    cube, store = backends
+    pd.testing.assert_frame_equal(by_sector_year(store.mean), by_sector_year(cube.mean))
+    pd.testing.assert_series_equal(by_sector_year(store.count), by_sector_year(cube.count), check_dtype=False)
+    pd.testing.assert_series_equal(store.year_mean('Payroll (M€)'), cube.year_mean('Payroll (M€)'),
+                                   check_index_type=False, check_names=False)
+    assert store.sector_mean('Luxe', 2010, METRIC) == pytest.approx(cube.sector_mean('Luxe', 2010, METRIC))
+    assert sorted(store.sectors) == sorted(cube.sectors)
+    assert store.latest_year == cube.latest_year
+
+
+def test_rows(backends):
+    cube, store = backends
+    columns = ['Company', 'Sector', 'Year'] + Urssaf.CUBE_METRICS
+    for company in ('LVMH', 'BNP Paribas'):
+        pd.testing.assert_frame_equal(plain(store.company_rows(company)[columns]),
+                                      plain(cube.company_rows(company)[columns]))
+    
+    key = ['Company', 'Year']
+    pd.testing.assert_frame_equal(
+        plain(store.sector_rows('Luxe')[columns]).sort_values(key, ignore_index=True),
+        plain(cube.sector_rows('Luxe')[columns]).sort_values(key, ignore_index=True))
+    
+    companies = ['Sanofi', 'LVMH', 'Kering', 'Inconnue']
+    pd.testing.assert_frame_equal(
+        plain(store.companies_rows(companies)[columns]).sort_values(key, ignore_index=True),
+        plain(cube.companies_rows(companies)[columns]).sort_values(key, ignore_index=True))
+    
+    assert store.company_rows('Inconnue').empty
+    assert store.companies_rows(['Inconnue']).empty
+    assert sum(len(chunk) for chunk in store.iter_chunks()) == len(cube.df)
+
+
+def test_rankings_and_describe(backends):
+    cube, store = backends
+    for year, sector in ((None, None), (2015, None), (None, 'Luxe')):
+        expected = cube.nlargest(5, METRIC, year, sector)
+        actual = store.nlargest(5, METRIC, year, sector)
+        assert list(actual['Company'].astype(str)) == list(expected['Company'].astype(str))
+        np.testing.assert_allclose(actual[METRIC], expected[METRIC])
+    
+    columns = ['Employees', 'Avg Salary (€)']
+    pd.testing.assert_frame_equal(store.describe(columns), cube.describe(columns), rtol=1e-9)
+
+
+def test_trends(backends):
+    cube, store = backends
+    expected = cube.trends().summary.astype({'Company': str, 'Sector': str})
+    actual = store.trends().summary.astype({'Company': str, 'Sector': str})
+    key = ['Company', 'Metric']
+    pd.testing.assert_frame_equal(actual.sort_values(key, ignore_index=True),
+                                  expected.sort_values(key, ignore_index=True), check_dtype=False)
+    
+    subset = store.trends(['LVMH', 'Sanofi', 'Inconnue'])
+    assert sorted(subset.companies) == ['LVMH', 'Sanofi']
+    
+    metrics = ['Payroll (M€)', 'Employees']
+    pd.testing.assert_frame_equal(store.crisis_impact(metrics), cube.crisis_impact(metrics))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+SEED = 11
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return Urssaf.URSSAFAnalysis(seed=SEED, headless=True)
+
+
+@pytest.fixture(scope='module')
+def expected(analyzer):
+    return normalize(analyzer.get_all_companies_data())
+
+
+def normalize(df):
+    df = df.astype({'Company': str, 'Sector': str, 'Year': int})
+    values = [column for column in df.columns if column not in ('Company', 'Sector', 'Year')]
+    df = df.astype({column: np.float64 for column in values})
+    return df.sort_values(['Company', 'Year']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('fmt, name', [('csv', 'panel.csv'), ('csv.gz', 'panel.csv.gz')])
+def test_csv_matches_in_memory_frame(analyzer, expected, tmp_path, fmt, name):
+    path = str(tmp_path / name)
+    summary = analyzer.export_streaming(path, fmt, chunk_size=4)
+    
+    assert summary['rows'] == len(expected)
+    assert summary['chunks'] == -(-len(analyzer.companies) // 4)
+    exported = pd.read_csv(path)
+    assert list(exported.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(normalize(exported), expected, check_exact=False, rtol=1e-12)
+
+
+def test_parquet_matches_in_memory_frame(analyzer, expected, tmp_path):
+    path = str(tmp_path / 'panel')
+    summary = analyzer.export_streaming(path, 'parquet', chunk_size=7)
+    
+    assert summary['rows'] == len(expected)
+    exported = pd.read_parquet(path)
+    assert set(exported.columns) == set(expected.columns)
+    pd.testing.assert_frame_equal(normalize(exported)[expected.columns], expected)
+
+
+def test_chunks_override_simulation(analyzer, expected, tmp_path):
+    path = str(tmp_path / 'subset.csv')
+    blocks = [expected.iloc[:10].copy(), expected.iloc[10:25].copy()]
+    summary = analyzer.export_streaming(path, chunks=iter(blocks))
+    
+    assert (summary['rows'], summary['chunks']) == (25, 2)
+    pd.testing.assert_frame_equal(normalize(pd.read_csv(path)), expected.iloc[:25])
+
+
+def test_unknown_format(analyzer, tmp_path):
+    with pytest.raises(ValueError):
+        analyzer.export_streaming(str(tmp_path / 'panel.xlsx'), 'xlsx')
@@ -0,0 +1,84 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+SEED = 3
+
+
+def analyzer(years=None):
+    analyzer = Urssaf.URSSAFAnalysis(seed=SEED, years=years)
+    # Copies: les données de référence sont partagées par tout le processus
+    analyzer.reference = copy.deepcopy(analyzer.reference)
+    analyzer.companies = copy.deepcopy(analyzer.companies)
+    return analyzer
+
+
+def full_frame(analyzer):
+    return Urssaf.build_companies_frame(analyzer.simulate_companies_batch(), analyzer.social_rates)
+
+
+def comparable(df):
+    df = Urssaf.add_derived_columns(df).astype({'Company': str, 'Sector': str, 'Year': int})
+    values = [column for column in df.columns if column not in ('Company', 'Sector', 'Year')]
+    return df.astype({column: np.float64 for column in values}).sort_values(['Company', 'Year']).reset_index(drop=True)
+
+
+@pytest.fixture
+def previous():
+    base = analyzer(np.arange(2002, 2020))
+    return full_frame(base), base.dataset_state()
+
+
+def refresh_matches_full(updated, previous):
+    df, changes = updated.refresh_companies_data(*previous)
+    pd.testing.assert_frame_equal(comparable(df), comparable(full_frame(updated)), check_like=True)
+    return changes
+
+
+def test_unchanged_recomputes_nothing(previous):
+    changes = refresh_matches_full(analyzer(np.arange(2002, 2020)), previous)
+    assert changes['rows_recomputed'] == 0
+    assert changes['companies'] == []
+
+
+def test_history_edit_recomputes_one_cell(previous):
+    updated = analyzer(np.arange(2002, 2020))
+    company, row = next(iter(updated.reference.history_index['social'].items()))
+    column = int(np.flatnonzero(updated.reference.history_years == 2010)[0])
+    updated.reference.history['social'][row, column] = 12345.0
+    
+    changes = refresh_matches_full(updated, previous)
+    assert changes['rows_recomputed'] == 1
+    assert changes['companies'] == [company]
+
+
+def test_registry_change_recomputes_company(previous):
+    updated = analyzer(np.arange(2002, 2020))
+    updated.companies['Kering']['employees'] += 1000
+    
+    changes = refresh_matches_full(updated, previous)
+    assert changes['rows_recomputed'] == 18
+    assert changes['companies'] == ['Kering']
+
+
+def test_new_years_only_simulate_added_years(previous):
+    updated = analyzer(np.arange(2002, 2023))
+    
+    changes = refresh_matches_full(updated, previous)
+    assert changes['new_years'] == [2020, 2021, 2022]
+    assert changes['rows_recomputed'] == 3 * len(updated.companies)
+    assert changes['companies'] == []
+
+
+def test_refresh_dataset_round_trip(tmp_path):
+    path = str(tmp_path / 'urssaf.csv')
+    analyzer(np.arange(2002, 2020)).refresh_dataset(path)
+    updated = analyzer()
+    df, changes = updated.refresh_dataset(path)
+    assert changes['new_years'] == list(range(2020, 2026))
+    pd.testing.assert_frame_equal(comparable(pd.read_csv(path)), comparable(full_frame(updated)),
+                                  check_like=True, rtol=1e-9)
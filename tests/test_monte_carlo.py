@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+COMPANIES = ['LVMH', 'Sanofi', 'Inconnue']
+
+
+def bands(seed, workers, **options):
+    analyzer = Urssaf.URSSAFAnalysis(seed=seed, headless=True)
+    return analyzer.monte_carlo_bands(COMPANIES, n_paths=600, workers=workers, paths_per_job=200, **options)
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return bands(21, workers=1)
+
+
+def test_reproducible_across_workers(reference):
+    assert list(reference) == ['LVMH', 'Sanofi']
+    again = bands(21, workers=2)
+    for company, frame in reference.items():
+        pd.testing.assert_frame_equal(again[company], frame)
+
+
+def test_seed_changes_bands(reference):
+    other = bands(22, workers=1)
+    assert not np.allclose(other['Sanofi'].to_numpy(), reference['Sanofi'].to_numpy())
+
+
+def test_known_history_is_kept(reference):
+    # Historique connu de LVMH sur toute la période: bandes réduites à ses valeurs
+    rows = Urssaf.URSSAFAnalysis(seed=21).get_all_companies_data(['LVMH']).set_index('Year')
+    frame = reference['LVMH']
+    for column in Urssaf.HISTORY_METRICS.values():
+        for q in (5, 50, 95):
+            np.testing.assert_allclose(frame[f'{column} p{q}'].to_numpy(), rows[column].to_numpy())
+
+
+def test_bands_are_ordered(reference):
+    frame = reference['Sanofi']
+    assert frame.index.name == 'Year'
+    for column in Urssaf.HISTORY_METRICS.values():
+        low, mid, high = (frame[f'{column} p{q}'].to_numpy() for q in (5, 50, 95))
+        assert np.all(low <= mid) and np.all(mid <= high)
+        assert np.any(low < high)
+
+
+def test_histogram_quantiles_match_percentiles():
+    rng = np.random.default_rng(0)
+    values = np.exp(rng.normal(3, 0.2, (4000, 2, 3)))
+    logs = np.log(values)
+    low, high, bins = logs.min(axis=0) - 0.1, logs.max(axis=0) + 0.1, 512
+    counts = Urssaf._histogram_counts(values, low, high, bins).reshape(2, 3, bins)
+    
+    # Erreur bornée par la largeur (relative) d'une classe
+    tolerance = np.exp((high - low).max() / bins) - 1
+    for q in (5, 50, 95):
+        np.testing.assert_allclose(Urssaf._histogram_quantiles(counts, low, high, q),
+                                   np.percentile(values, q, axis=0), rtol=tolerance)
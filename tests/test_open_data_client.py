@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import Urssaf
+
+BODY = b"annee;effectifs_salaries\n2020;1000\n"
+
+
+class FakeOpenData(BaseHTTPRequestHandler):
+    """Serveur d'exports: répond 503 tant que failures > 0, puis 200 ou 304 selon l'ETag"""
+    failures = 0
+    etag = '"v1"'
+    requests = []
+    
+    def do_GET(self):
+        server = type(self)
+        server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def open_data(tmp_path):
+    FakeOpenData.failures = 0
+    FakeOpenData.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenData)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = Urssaf.URSSAFOpenDataClient(base_url=f"http://127.0.0.1:{server.server_address[1]}",
+                                         max_retries=2, backoff=0, timeout=5,
+                                         cache_dir=str(tmp_path / 'http'))
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_after_503(open_data):
+    FakeOpenData.failures = 2
+    assert open_data._get(open_data.export_url('effectifs')) == BODY
+    assert len(FakeOpenData.requests) == 3
+
+
+def test_gives_up_after_max_retries(open_data):
+    import requests
+    
+    FakeOpenData.failures = 3
+    with pytest.raises(requests.HTTPError):
+        open_data._get(open_data.export_url('effectifs'))
+    assert len(FakeOpenData.requests) == 3
+
+
+def test_etag_revalidation_uses_cached_body(open_data):
+    url = open_data.export_url('effectifs')
+    assert open_data._get(url) == BODY
+    assert open_data._get(url) == BODY
+    assert FakeOpenData.requests == [('/effectifs/exports/csv', None), ('/effectifs/exports/csv', '"v1"')]
+
+
+def test_fetch_datasets(open_data):
+    bodies = asyncio.run(open_data.fetch_datasets(['effectifs', 'masse']))
+    assert bodies == {'effectifs': BODY, 'masse': BODY}
+
+
+def test_normalize_open_data_aggregates_establishments():
+    content = ("raison_sociale;secteur_na17;annee;effectifs_salaries;masse_salariale\n"
+               "ACME;Industrie;2020;100;5000000\n"
+               "ACME;Industrie;2020;50;2000000\n"
+               "ACME;Industrie;2021;160;8000000\n"
+               "Beta;Commerce;2021;10;300000\n").encode('utf-8')
+    batch = Urssaf.normalize_open_data(content, {'2020': 40.0, '2021': 50.0})
+    assert list(batch['Company']) == ['ACME', 'Beta']
+    assert list(batch['Year']) == [2020, 2021]
+    assert batch['Employees'][0].tolist() == [150, 160]
+    assert batch['Payroll (M€)'][0].tolist() == [7.0, 8.0]
+    assert batch['Social Contributions (M€)'][0].tolist() == [2.8, 4.0]
+
+
+def test_normalize_open_data_rejects_exports_without_companies():
+    content = b"libelle_ape;secteur_na17;annee;effectifs_salaries;masse_salariale\nBoulangerie;Commerce;2020;10;1\n"
+    with pytest.raises(ValueError, match='raison_sociale'):
+        Urssaf.normalize_open_data(content, {})
+
+
+def test_each_worker_thread_has_its_own_session(open_data):
+    datasets = [f"jeu{i}" for i in range(6)]
+    bodies = asyncio.run(open_data.fetch_datasets(datasets))
+    assert set(bodies) == set(datasets)
+    assert 1 <= len(open_data._sessions) <= open_data.max_connections
+    assert len({id(session) for session in open_data._sessions}) == len(open_data._sessions)
+    open_data.close()
+    assert open_data._sessions == []
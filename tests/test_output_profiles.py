@@ -0,0 +1,58 @@
+import os
+
+import matplotlib
+import matplotlib.image as mpimg
+import pytest
+
+matplotlib.use('Agg')
+
+import Urssaf
+
+
+def test_savefig_options():
+    assert Urssaf.savefig_options('preview') == {'format': 'png', 'dpi': 72, 'bbox_inches': None}
+    assert Urssaf.savefig_options('print', dpi=150)['dpi'] == 150
+    # Les options renvoyées sont une copie du profil
+    Urssaf.savefig_options('svg')['dpi'] = 1
+    assert Urssaf.OUTPUT_PROFILES['svg']['dpi'] == 72
+    with pytest.raises(ValueError):
+        Urssaf.savefig_options('poster')
+
+
+def test_profile_path():
+    assert Urssaf.profile_path('out/LVMH_report.png', 'svg') == 'out/LVMH_report.svg'
+    assert Urssaf.profile_path('out/report.svg', 'print') == 'out/report.png'
+    assert Urssaf.profile_path('report', 'preview') == 'report.png'
+    with pytest.raises(ValueError):
+        Urssaf.profile_path('report.png', 'poster')
+
+
+@pytest.fixture(scope='module')
+def df():
+    return Urssaf.URSSAFAnalysis(seed=2).get_all_companies_data(['Kering'])
+
+
+def company_report(df, directory, profile):
+    analyzer = Urssaf.URSSAFAnalysis(seed=2, headless=True, output_profile=profile, output_dir=str(directory))
+    analyzer.create_company_specific_report(df, 'Kering')
+    analyzer.close_figures()
+    return [os.path.join(directory, name) for name in os.listdir(directory)]
+
+
+def test_profiles_change_format_and_resolution(df, tmp_path):
+    paths = {profile: company_report(df, tmp_path / profile, profile) for profile in Urssaf.OUTPUT_PROFILES}
+    
+    assert [os.path.basename(path) for path in paths['svg']] == ['Kering_social_analysis_2002_2025.svg']
+    with open(paths['svg'][0], encoding='utf-8') as handle:
+        assert '<svg' in handle.read()
+    
+    preview = mpimg.imread(paths['preview'][0])
+    printed = mpimg.imread(paths['print'][0])
+    # 300 dpi contre 72 dpi: environ quatre fois plus de pixels par côté
+    assert printed.shape[1] > 3 * preview.shape[1]
+    assert os.path.getsize(paths['print'][0]) > os.path.getsize(paths['preview'][0])
+
+
+def test_unknown_profile_fails_on_save(df, tmp_path):
+    with pytest.raises(ValueError):
+        company_report(df, tmp_path, 'poster')
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+
+@pytest.fixture(scope='module')
+def backends(tmp_path_factory):
+    analyzer = Urssaf.URSSAFAnalysis(seed=4)
+    df = analyzer.get_all_companies_data()
+    store = Urssaf.ColumnStore.write(analyzer, str(tmp_path_factory.mktemp('store')), chunk_size=7)
+    return analyzer, Urssaf.AggregateCube(df), store
+
+
+def comparable(peers):
+    return peers.astype({'Company': str, 'Peer': str, 'Sector': str}).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('same_sector', [False, True])
+def test_store_and_cube_agree(backends, same_sector):
+    analyzer, cube, store = backends
+    for company in ('LVMH', 'Sanofi', 'BNP Paribas'):
+        expected = comparable(cube.peers_of(company, 5, same_sector))
+        actual = comparable(store.peers_of(company, 5, same_sector))
+        pd.testing.assert_frame_equal(actual[['Company', 'Rank', 'Peer', 'Sector']],
+                                      expected[['Company', 'Rank', 'Peer', 'Sector']])
+        np.testing.assert_allclose(actual['Distance'], expected['Distance'], rtol=1e-4)
+
+
+def test_default_searches_every_sector(backends):
+    analyzer, cube, store = backends
+    peers = store.peers_of('LVMH', 10)
+    assert len(peers) == 10
+    assert set(peers['Sector']) != {analyzer.companies['LVMH']['sector']}
+
+
+def test_same_sector_stays_in_sector(backends):
+    analyzer, cube, store = backends
+    peers = store.peers_of('LVMH', 10, same_sector=True)
+    assert set(peers['Sector']) == {analyzer.companies['LVMH']['sector']}
+    assert 'LVMH' not in set(peers['Peer'])
+
+
+def test_unknown_company(backends):
+    analyzer, cube, store = backends
+    with pytest.raises(KeyError):
+        store.peers_of('Inconnue')
@@ -0,0 +1,106 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import Urssaf
+
+
+@pytest.fixture(scope='module')
+def service():
+    return Urssaf.QueryService(Urssaf.URSSAFAnalysis(seed=6))
+
+
+def body(response):
+    return json.loads(response[2])
+
+
+@pytest.mark.parametrize('target', [
+    '/companies', '/company?name=LVMH', '/sector?name=Luxe', '/sector?name=Luxe&year=2020',
+    '/top', '/top?k=3&metric=Employees&format=md', '/top?sector=Luxe&year=2010',
+    '/compare?companies=LVMH,Sanofi', '/compare?companies=LVMH,Sanofi&year=2015&format=txt',
+    '/peers?name=LVMH&k=3', '/peers?name=LVMH&same_sector=1&format=html', '/health',
+])
+def test_routes_answer(service, target):
+    status, content_type, payload = service.handle(target)
+    assert status == 200
+    assert payload
+
+
+def test_charts(service):
+    status, content_type, payload = service.handle('/chart/company?name=LVMH&profile=preview')
+    assert (status, content_type) == (200, 'image/png')
+    assert payload.startswith(b'\x89PNG')
+    status, content_type, payload = service.handle('/chart/comparative?companies=LVMH,Sanofi&profile=svg')
+    assert (status, content_type) == (200, 'image/svg+xml')
+
+
+def test_top_matches_cube(service):
+    top = body(service.handle('/top?k=5&year=2020'))
+    expected = service.cube.nlargest(5, 'Social Contributions (M€)', 2020)
+    assert [row['Entreprise'] for row in top] == list(expected['Company'].astype(str))
+    assert [row['Rang'] for row in top] == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize('target, status, message', [
+    ('/nope', 404, 'Requête inconnue'),
+    ('/company', 400, 'Paramètre manquant: name'),
+    ('/company?name=', 400, 'Paramètre vide: name'),
+    ('/company?name=Inconnue', 404, 'Entreprise inconnue'),
+    ('/sector?name=Inconnu', 404, 'Secteur inconnu'),
+    ('/sector?name=Luxe&year=1990', 404, 'Année inconnue: 1990'),
+    ('/sector?name=Luxe&year=abc', 400, 'Paramètre invalide: year=abc'),
+    ('/top?year=1990', 404, 'Année inconnue'),
+    ('/top?k=0', 400, 'k doit être compris'),
+    ('/top?k=1000', 400, 'k doit être compris'),
+    ('/top?metric=Chiffre', 400, 'Indicateur inconnu'),
+    ('/top?format=pdf', 400, 'Format inconnu'),
+    ('/compare?companies=,', 400, 'Paramètre vide: companies'),
+    ('/compare?companies=%20,%20', 400, 'Paramètre vide: companies'),
+    ('/compare?companies=LVMH,Inconnue', 400, 'Entreprise(s) inconnue(s): Inconnue'),
+    ('/compare?companies=LVMH&year=1990', 404, 'Année inconnue'),
+    ('/peers?name=Inconnue', 404, 'Entreprise inconnue'),
+    ('/peers?name=LVMH&k=500', 400, 'k doit être compris'),
+    ('/chart/company?name=LVMH&profile=gif', 400, 'Profil inconnu'),
+    ('/chart/comparative?companies=', 400, 'Paramètre vide: companies'),
+])
+def test_error_paths(service, target, status, message):
+    response = service.handle(target)
+    assert response[0] == status
+    assert message in body(response)['error']
+
+
+def test_unexpected_errors_are_generic_500(service, monkeypatch, capsys):
+    def broken(params):
+        raise RuntimeError("détail interne")
+    monkeypatch.setitem(service.routes, '/companies', broken)
+    status, _, payload = service.handle('/companies?x=1')
+    assert status == 500
+    assert json.loads(payload) == {'error': 'Erreur interne'}
+    assert 'détail interne' in capsys.readouterr().err
+
+
+def test_successful_responses_are_cached(service):
+    service.handle('/company?name=Sanofi')
+    hits = service.cache.hits
+    service.handle('/company?name=Sanofi')
+    assert service.cache.hits == hits + 1
+
+
+def test_http_server(service):
+    server = Urssaf.make_query_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/company?name=LVMH") as response:
+            assert response.headers['X-Dataset-Version'] == service.version
+            assert json.loads(response.read())[0]['Company'] == 'LVMH'
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{base}/sector?name=Luxe&year=1990")
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+
+@pytest.fixture(scope='module')
+def panel():
+    rng = np.random.default_rng(3)
+    n = 6000
+    df = pd.DataFrame({
+        'Company': [f"E{i}" for i in range(n)],
+        'Sector': rng.choice(['Luxe', 'Banque', 'Énergie'], n),
+        'Year': rng.integers(2015, 2020, n).astype(np.int16),
+    })
+    for metric in Urssaf.CUBE_METRICS:
+        # Valeurs arrondies: beaucoup d'égalités, départagées par l'ordre de lecture
+        df[metric] = np.round(rng.random(n) * 20)
+    df.loc[df.index[::9], 'Employees'] = np.nan
+    return df
+
+
+def expected(df, metric, year, sector, n):
+    rows = df[df[metric].notna()]
+    if year is not None:
+        rows = rows[rows['Year'] == year]
+    if sector is not None:
+        rows = rows[rows['Sector'] == sector]
+    return rows.nlargest(n, metric, keep='first')
+
+
+@pytest.mark.parametrize('chunk_rows', [500, 6000])
+def test_matches_nlargest(panel, chunk_rows):
+    ranking = Urssaf.TopKRanking.from_chunks(
+        [panel.iloc[start:start + chunk_rows] for start in range(0, len(panel), chunk_rows)], k=10)
+    for metric in ('Social Contributions (M€)', 'Employees'):
+        for year in (None, 2017):
+            for sector in (None, 'Luxe'):
+                top = ranking.top(metric, year, sector, 8)
+                reference = expected(panel, metric, year, sector, 8)
+                assert list(top['Company']) == list(reference['Company'])
+                np.testing.assert_array_equal(top[metric], reference[metric])
+
+
+def test_cube_ranking(panel):
+    cube = Urssaf.AggregateCube(panel.assign(**{column: panel[column] for column in Urssaf.DERIVED_COLUMNS}))
+    top = cube.nlargest(5, 'Payroll (M€)', 2016, 'Banque')
+    assert list(top['Company']) == list(expected(panel, 'Payroll (M€)', 2016, 'Banque', 5)['Company'])
+
+
+def test_limits(panel):
+    ranking = Urssaf.TopKRanking.from_chunks([panel], k=5)
+    with pytest.raises(ValueError):
+        ranking.top('Employees', n=6)
+    with pytest.raises(KeyError):
+        ranking.top('Chiffre')
+    assert ranking.rows_seen == len(panel)
@@ -0,0 +1,73 @@
+import copy
+import os
+
+import matplotlib
+import matplotlib.image as mpimg
+import numpy as np
+import pytest
+
+matplotlib.use('Agg')
+
+import Urssaf
+
+COMPANIES = ['LVMH', 'Sanofi', 'Kering']
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    analyzer = Urssaf.URSSAFAnalysis(seed=9, headless=True, output_profile='preview')
+    analyzer.companies = copy.deepcopy(analyzer.companies)
+    return analyzer
+
+
+@pytest.fixture(scope='module')
+def df(analyzer):
+    return analyzer.get_all_companies_data(COMPANIES)
+
+
+def test_parallel_manifest(analyzer, df, tmp_path):
+    manifest = analyzer.render_reports(df, COMPANIES + ['Inconnue'], comparative=COMPANIES[:2],
+                                       output_dir=str(tmp_path), workers=2)
+    
+    # Ordre des travaux: globale, entreprises connues, comparative
+    assert [entry['kind'] for entry in manifest] == ['global', 'company', 'company', 'company', 'comparative']
+    assert [entry['name'] for entry in manifest[1:4]] == COMPANIES
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(entry['path']) for entry in manifest)
+    for entry in manifest:
+        assert entry['path'].endswith('.png')
+        assert os.path.getsize(entry['path']) == entry['bytes'] > 0
+        with open(entry['path'], 'rb') as handle:
+            assert handle.read(8) == b'\x89PNG\r\n\x1a\n'
+
+
+def test_reused_figure_matches_fresh_render(df, tmp_path):
+    cube = Urssaf.AggregateCube(df)
+    
+    def job(company, name):
+        return {'kind': 'company', 'name': company, 'data': cube.company_rows(company),
+                'path': str(tmp_path / name), 'profile': 'preview'}
+    
+    # Un processus de rendu réutilise la figure d'une entreprise à l'autre
+    Urssaf._worker_company_figure = None
+    Urssaf._render_figure_job(job('LVMH', 'first.png'))
+    Urssaf._render_figure_job(job('Sanofi', 'reused.png'))
+    Urssaf._worker_company_figure.close()
+    Urssaf._worker_company_figure = None
+    Urssaf._render_figure_job(job('Sanofi', 'fresh.png'))
+    Urssaf._worker_company_figure.close()
+    Urssaf._worker_company_figure = None
+    
+    reused, fresh = mpimg.imread(tmp_path / 'reused.png'), mpimg.imread(tmp_path / 'fresh.png')
+    assert reused.shape == fresh.shape
+    # Au plus quelques pixels d'anticrénelage diffèrent
+    assert (np.abs(reused - fresh).max(axis=2) > 0).mean() < 1e-4
+
+
+def test_profile_and_dpi(analyzer, df, tmp_path):
+    manifest = analyzer.render_reports(df, ['LVMH'], output_dir=str(tmp_path), workers=1,
+                                       include_global=False, profile='svg')
+    assert [os.path.basename(entry['path']) for entry in manifest] == ['LVMH_social_analysis_2002_2025.svg']
+    with open(manifest[0]['path'], encoding='utf-8') as handle:
+        assert '<svg' in handle.read()
+    
+    assert analyzer.render_reports(df, [], output_dir=str(tmp_path), include_global=False) == []
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+COLUMNS = [
+    ('Rang', 'Rank', '%d', 5),
+    ('Entreprise', 'Company', '%s', 12),
+    ('Cotisations (M€)', 'Social Contributions (M€)', '%.0f', 16),
+    ('Ratio (%)', 'Social/Payroll Ratio (%)', '%.1f', 10),
+]
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'Rank': np.array([1, 2, 3], dtype=np.int16),
+        'Company': pd.Categorical(["L'Oréal", 'A&B <Tech>', 'Kering']),
+        'Social Contributions (M€)': [1234.4, 99.5, 7.0],
+        'Social/Payroll Ratio (%)': [41.25, 38.04, 40.0],
+    })
+
+
+def test_txt_matches_row_by_row_formatting(frame):
+    lines = Urssaf.render_table(frame, COLUMNS, 'txt').split('\n')
+    
+    header = ' '.join(f"{header:<{width}}" for header, _, _, width in COLUMNS)
+    assert lines[:2] == [header, '-' * len(header)]
+    expected = [f"{row['Rank']:<5d} {row['Company']:<12} {row['Social Contributions (M€)']:<16.0f} "
+                f"{row['Social/Payroll Ratio (%)']:<10.1f}".rstrip()
+                for _, row in frame.astype({'Company': str}).iterrows()]
+    assert lines[2:] == expected
+
+
+def test_markdown(frame):
+    lines = Urssaf.render_table(frame, COLUMNS, 'md').split('\n')
+    assert lines[0] == '| Rang | Entreprise | Cotisations (M€) | Ratio (%) |'
+    assert lines[1] == '|---|---|---|---|'
+    assert lines[2] == "| 1 | L'Oréal | 1234 | 41.2 |"
+    assert len(lines) == 5
+
+
+def test_html_escapes_cells(frame):
+    html = Urssaf.render_table(frame, COLUMNS, 'html')
+    assert html.startswith('<table>\n<thead><tr><th>Rang</th>')
+    assert '<tr><td>2</td><td>A&amp;B &lt;Tech&gt;</td><td>100</td><td>38.0</td></tr>' in html
+    assert html.endswith('</tbody>\n</table>')
+
+
+def test_json_records(frame):
+    records = json.loads(Urssaf.render_table(frame, COLUMNS, 'json'))
+    assert records[0] == {'Rang': 1, 'Entreprise': "L'Oréal", 'Cotisations (M€)': 1234.4, 'Ratio (%)': 41.25}
+    assert [record['Entreprise'] for record in records] == ["L'Oréal", 'A&B <Tech>', 'Kering']
+
+
+def test_report_documents(frame):
+    sections = [('Classement', frame, COLUMNS), ('Vide', frame.iloc[:0], COLUMNS)]
+    
+    txt = Urssaf.render_report(sections, 'txt')
+    assert txt.startswith('Classement\n==========\n\nRang')
+    assert '\n\nVide\n====\n\n' in txt
+    assert Urssaf.render_report(sections, 'md').startswith('## Classement\n\n| Rang |')
+    assert Urssaf.render_report(sections, 'html').startswith('<!DOCTYPE html>')
+    
+    document = json.loads(Urssaf.render_report(sections, 'json'))
+    assert list(document) == ['Classement', 'Vide']
+    assert len(document['Classement']) == 3 and document['Vide'] == []
+    
+    with pytest.raises(ValueError):
+        Urssaf.render_table(frame, COLUMNS, 'pdf')
+
+
+def test_format_lines(frame):
+    lines = Urssaf.format_lines(frame, ['#', ('Rank', '%d'), ' ', ('Company', '%s'), ': ',
+                                        ('Social/Payroll Ratio (%)', '%.2f'), '%'])
+    assert list(lines) == ["#1 L'Oréal: 41.25%", '#2 A&B <Tech>: 38.04%', '#3 Kering: 40.00%']
@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+import pytest
+
+import Urssaf
+
+SCENARIOS = [
+    {'name': 'base'},
+    {'name': 'hausse', 'rate_change': 1.5},
+    {'name': 'bareme', 'rates': {'2024': 30.0, 2025: 31.0, 1990: 99.0}},
+    {'name': 'secteurs', 'sector_ratios': {'Luxe': 0.3, 'Inconnu': 0.9}, 'exemptions': {'Énergie': 0.25}},
+    {'name': 'crise', 'shocks': {2020: 0.1, 2021: 0.05}, 'exemptions': {'Luxe': 0.5}},
+]
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return Urssaf.URSSAFAnalysis(seed=17, headless=True)
+
+
+@pytest.fixture(scope='module')
+def batch(analyzer):
+    return analyzer.simulate_companies_batch()
+
+
+def brute_force(batch, social_rates, scenario):
+    """Cotisations d'un scénario, entreprise par entreprise et année par année"""
+    years = [int(year) for year in batch['Year']]
+    rates = {year: social_rates[str(year)] for year in years}
+    for year, rate in scenario.get('rates', {}).items():
+        if int(year) in rates:
+            rates[int(year)] = rate
+    
+    contributions = {}
+    for i, company in enumerate(batch['Company']):
+        sector = batch['Sector'][i]
+        base_ratio = Urssaf.SECTOR_SOCIAL_RATIOS.get(sector, Urssaf.DEFAULT_SOCIAL_RATIO)
+        ratio = scenario.get('sector_ratios', {}).get(sector, base_ratio)
+        exemption = scenario.get('exemptions', {}).get(sector, 0.0)
+        shock = 1.0
+        for j, year in enumerate(years):
+            shock *= 1 - scenario.get('shocks', {}).get(year, 0.0)
+            rate = rates[year] + scenario.get('rate_change', 0.0)
+            value = batch['Social Contributions (M€)'][i][j]
+            contributions[company, year] = (value * rate / social_rates[str(year)] * shock
+                                            * ratio / base_ratio * (1 - exemption))
+    return contributions
+
+
+def test_totals_match_brute_force(analyzer, batch):
+    results = Urssaf.ScenarioEngine(batch, analyzer.social_rates).evaluate(SCENARIOS)
+    sector_of = dict(zip(batch['Company'], batch['Sector']))
+    
+    assert list(results.totals.index) == [scenario['name'] for scenario in SCENARIOS]
+    for scenario in SCENARIOS:
+        contributions = brute_force(batch, analyzer.social_rates, scenario)
+        name = scenario['name']
+        for year in results.years:
+            values = [value for (_, y), value in contributions.items() if y == year and not math.isnan(value)]
+            assert results.totals.at[name, year] == pytest.approx(math.fsum(values), rel=1e-9)
+        for sector in ('Luxe', 'Énergie'):
+            expected = math.fsum(value for (company, year), value in contributions.items()
+                                 if year == 2025 and sector_of[company] == sector and not math.isnan(value))
+            assert results.sector_totals.at[(name, sector), 2025] == pytest.approx(expected, rel=1e-9)
+        total = math.fsum(value for value in contributions.values() if not math.isnan(value))
+        assert results.summary.at[name, 'Total (M€)'] == pytest.approx(total, rel=1e-9)
+    
+    assert results.summary.at['base', 'Delta vs base (%)'] == pytest.approx(0, abs=1e-9)
+    assert results.summary.at['hausse', 'Delta vs base (%)'] > 0
+
+
+def test_full_array_in_blocks(analyzer, batch):
+    # Blocs d'un seul scénario: le tableau complet est rempli en plusieurs passes
+    engine = Urssaf.ScenarioEngine(batch, analyzer.social_rates, max_cells=1)
+    results = engine.evaluate(SCENARIOS, keep_contributions=True)
+    
+    assert results.contributions.shape == (len(SCENARIOS), len(batch['Company']), len(batch['Year']))
+    for s, scenario in enumerate(SCENARIOS):
+        contributions = brute_force(batch, analyzer.social_rates, scenario)
+        expected = np.array([[contributions[company, int(year)] for year in batch['Year']]
+                             for company in batch['Company']])
+        np.testing.assert_allclose(results.contributions[s], expected, rtol=1e-6)
+    assert engine.evaluate(SCENARIOS).contributions is None
+
+
+def test_run_scenarios(analyzer):
+    results = analyzer.run_scenarios(SCENARIOS[:2], companies=['LVMH', 'Kering'])
+    assert results.sectors == ['Luxe']
+    assert results.summary.at['hausse', 'Total (M€)'] > results.summary.at['base', 'Total (M€)']
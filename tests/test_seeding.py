@@ -0,0 +1,61 @@
+import numpy as np
+
+import Urssaf
+
+SERIES = ('Social Contributions (M€)', 'Payroll (M€)', 'Employees')
+
+
+def test_seeded_runs_are_reproducible():
+    first = Urssaf.URSSAFAnalysis(seed=11).simulate_companies_batch()
+    second = Urssaf.URSSAFAnalysis(seed=11).simulate_companies_batch()
+    for column in SERIES:
+        np.testing.assert_array_equal(first[column], second[column])
+
+
+def test_seeds_differ():
+    first = Urssaf.URSSAFAnalysis(seed=1).simulate_companies_batch(use_history=False)
+    second = Urssaf.URSSAFAnalysis(seed=2).simulate_companies_batch(use_history=False)
+    assert not np.array_equal(first['Payroll (M€)'], second['Payroll (M€)'])
+
+
+def test_draws_do_not_depend_on_order_or_period():
+    analyzer = Urssaf.URSSAFAnalysis(seed=5)
+    names = list(analyzer.companies)
+    growth, noise = analyzer._draw_normals('social', names, analyzer.years)
+    subset_growth, subset_noise = analyzer._draw_normals('social', names[::-1], analyzer.years[4:10])
+    np.testing.assert_array_equal(growth[::-1, 4:10], subset_growth)
+    np.testing.assert_array_equal(noise[::-1, 4:10], subset_noise)
+
+
+def test_each_pair_is_a_numpy_philox_stream():
+    analyzer = Urssaf.URSSAFAnalysis(seed=5)
+    names = list(analyzer.companies)[:3]
+    growth, noise = analyzer._draw_normals('payroll', names, analyzer.years)
+    for i, key in enumerate(analyzer._company_keys('payroll', names)):
+        expected = np.random.Generator(np.random.Philox(key=key)).standard_normal((len(analyzer.years), 2))
+        np.testing.assert_array_equal(growth[i], expected[:, 0])
+        np.testing.assert_array_equal(noise[i], expected[:, 1])
+
+
+def test_draws_are_standard_normal():
+    analyzer = Urssaf.URSSAFAnalysis(seed=5)
+    growth, noise = analyzer._draw_normals('payroll', [f"E{i}" for i in range(20_000)], analyzer.years)
+    for draws in (growth.ravel(), noise.ravel()):
+        assert abs(draws.mean()) < 0.01
+        assert abs(draws.std() - 1) < 0.01
+        # Quantiles de la loi normale centrée réduite
+        np.testing.assert_allclose(np.quantile(draws, [0.025, 0.16, 0.5, 0.84, 0.975]),
+                                   [-1.960, -0.994, 0.0, 0.994, 1.960], atol=0.02)
+
+
+def test_streams_are_independent():
+    analyzer = Urssaf.URSSAFAnalysis(seed=5)
+    names = [f"E{i}" for i in range(20_000)]
+    growth, noise = analyzer._draw_normals('social', names, analyzer.years)
+    other_metric, _ = analyzer._draw_normals('employees', names, analyzer.years)
+    limit = 4 / np.sqrt(growth.size)
+    # Entre aléas d'une même entreprise, entre entreprises voisines, entre métriques et entre années
+    assert abs(np.corrcoef(growth.ravel(), noise.ravel())[0, 1]) < limit
+    assert abs(np.corrcoef(growth[:-1].ravel(), growth[1:].ravel())[0, 1]) < limit
+    assert abs(np.corrcoef(growth.ravel(), other_metric.ravel())[0, 1]) < limit
+    assert abs(np.corrcoef(growth[:, :-1].ravel(), growth[:, 1:].ravel())[0, 1]) < limit
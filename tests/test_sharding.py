@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+import Urssaf
+
+
+def plain(df):
+    return df.astype({'Company': str, 'Sector': str})
+
+
+@pytest.mark.parametrize('shard_by', ['sector', 'hash'])
+def test_sharded_generation_matches_serial(shard_by):
+    analyzer = Urssaf.URSSAFAnalysis(seed=9)
+    serial = analyzer.get_all_companies_data()
+    sharded = analyzer.get_all_companies_data(workers=2, shard_by=shard_by)
+    pd.testing.assert_frame_equal(plain(serial), plain(sharded))
+
+
+def test_shards_cover_every_company_once():
+    analyzer = Urssaf.URSSAFAnalysis(seed=9)
+    names = list(analyzer.companies)
+    for shard_by in ('sector', 'hash'):
+        shards = analyzer.shard_companies(names, shard_by, 4)
+        positions = sorted(position for shard in shards for position in shard)
+        assert positions == list(range(len(names)))
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import Urssaf
+
+METRIC = 'Payroll (M€)'
+YEARS = np.arange(2005, 2015)
+CRISES = {'2008-2009': (2008, 2009), '2012': (2012, 2012), '2005': (2005, 2005)}
+
+
+@pytest.fixture(scope='module')
+def panel():
+    rng = np.random.default_rng(1)
+    rows = []
+    for c, (company, sector) in enumerate([('A', 'Luxe'), ('B', 'Banque'), ('C', 'Luxe')]):
+        values = 100 * (1 + c) * np.cumprod(1 + rng.normal(0.03, 0.05, len(YEARS)))
+        for year, value in zip(YEARS, values):
+            rows.append({'Company': company, 'Sector': sector, 'Year': year, METRIC: value})
+    df = pd.DataFrame(rows)
+    # Une année manquante pour C, lignes dans le désordre
+    df.loc[(df['Company'] == 'C') & (df['Year'] == 2010), METRIC] = np.nan
+    return df.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def trends(panel):
+    return Urssaf.TrendAnalytics.from_frame(panel, [METRIC], window=3, crises=CRISES)
+
+
+def series(panel, company):
+    return panel[panel['Company'] == company].set_index('Year')[METRIC].sort_index()
+
+
+def test_matrices(panel, trends):
+    assert list(trends.companies) == list(pd.unique(panel['Company']))
+    np.testing.assert_array_equal(trends.years, YEARS)
+    for company, sector in (('A', 'Luxe'), ('B', 'Banque')):
+        i = trends.company_index[company]
+        assert trends.sectors[i] == sector
+        np.testing.assert_allclose(trends.values[METRIC][i], series(panel, company).to_numpy())
+
+
+def test_growth_and_rolling_match_pandas(panel, trends):
+    for company in ('A', 'B', 'C'):
+        i = trends.company_index[company]
+        values = series(panel, company)
+        growth = values.pct_change(fill_method=None) * 100
+        np.testing.assert_allclose(trends.yoy(METRIC)[i], growth.to_numpy(), equal_nan=True)
+        np.testing.assert_allclose(trends.rolling_mean(METRIC)[i], values.rolling(3).mean().to_numpy(),
+                                   equal_nan=True)
+        np.testing.assert_allclose(trends.rolling_volatility(METRIC, 4)[i], growth.rolling(4).std().to_numpy(),
+                                   equal_nan=True)
+        
+        expected = ((values[2014] / values[2005]) ** (1 / 9) - 1) * 100
+        assert trends.cagr(METRIC)[i] == pytest.approx(expected)
+        expected = ((values[2014] / values[2011]) ** (1 / 3) - 1) * 100
+        assert trends.cagr(METRIC, 2011, 2014)[i] == pytest.approx(expected)
+    
+    assert np.isnan(trends.cagr(METRIC, 2014, 2011)).all()
+    assert np.isnan(trends.cagr(METRIC, 1990, 2014)).all()
+
+
+def test_crisis_deltas(panel, trends):
+    deltas = trends.crisis_deltas(METRIC)
+    for company in ('A', 'B'):
+        i = trends.company_index[company]
+        values = series(panel, company)
+        assert deltas['Crisis 2008-2009 (%)'][i] == pytest.approx((values[2009] / values[2007] - 1) * 100)
+        before, after = values.loc[2005:2007].mean(), values.loc[2010:2012].mean()
+        assert deltas['Post/Pre 2008-2009 (%)'][i] == pytest.approx((after / before - 1) * 100)
+        assert deltas['Crisis 2012 (%)'][i] == pytest.approx((values[2012] / values[2011] - 1) * 100)
+    
+    # Crise en première année: aucune année de référence
+    assert np.isnan(deltas['Crisis 2005 (%)']).all()
+    assert np.isnan(deltas['Post/Pre 2005 (%)']).all()
+    # Année manquante dans la fenêtre d'après-crise de C
+    assert np.isnan(deltas['Post/Pre 2008-2009 (%)'][trends.company_index['C']])
+
+
+def test_summary_and_impact(panel, trends):
+    row = trends.company('B', METRIC)
+    values = series(panel, 'B')
+    assert row['Max'] == values.max() and row['Max Year'] == values.idxmax()
+    assert row['Min'] == values.min() and row['Min Year'] == values.idxmin()
+    assert row['Mean'] == pytest.approx(values.mean())
+    assert row['Last YoY (%)'] == pytest.approx((values[2014] / values[2013] - 1) * 100)
+    assert trends.company('Inconnue', METRIC) is None
+    assert list(trends.companies_summary(['C', 'Inconnue', 'A'], METRIC)['Company']) == ['C', 'A']
+    
+    impact = trends.crisis_impact()
+    expected = np.nanmedian(trends.crisis_deltas(METRIC)['Crisis 2008-2009 (%)'])
+    assert impact.at[METRIC, 'Crisis 2008-2009 (%)'] == pytest.approx(expected)
+    
+    table = trends.table()
+    assert len(table) == 3 * len(YEARS)
+    c = table[(table['Company'] == 'C') & (table['Year'] == 2011)]
+    assert c['YoY (%)'].isna().all()
+
+
+def test_crisis_periods():
+    shocks = {'social': {2008: 0.1, 2009: 0.2, 2020: 0.1}, 'payroll': {2009: 0.1, 2012: 0.05}}
+    assert Urssaf._crisis_periods(shocks) == {'2008-2009': (2008, 2009), '2012': (2012, 2012),
+                                              '2020': (2020, 2020)}